@@ -12,28 +12,111 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import logging
 import os
 import subprocess
 
+# Only this many leading bytes are inspected to classify a file.
+SNIFF_BYTES = 8192
+
+# Extensions that are always treated as text, skipping the signature check.
+TEXT_EXTENSIONS = frozenset([
+    '.c', '.cc', '.cfg', '.cpp', '.cs', '.css', '.go', '.gradle', '.h',
+    '.hpp', '.html', '.ini', '.java', '.js', '.json', '.jsx', '.kt', '.md',
+    '.php', '.properties', '.py', '.rb', '.rs', '.scala', '.sh', '.sql',
+    '.swift', '.toml', '.ts', '.tsx', '.txt', '.xml', '.yaml', '.yml',
+])
+
+# Extensions that are never sent to the model, so the file is not opened.
+BINARY_EXTENSIONS = frozenset([
+    '.7z', '.a', '.avi', '.bin', '.bmp', '.class', '.dll', '.dylib', '.ear',
+    '.eot', '.exe', '.gif', '.gz', '.ico', '.jar', '.jpeg', '.jpg', '.mov',
+    '.mp3', '.mp4', '.o', '.otf', '.pdf', '.png', '.pyc', '.pyo', '.so',
+    '.tar', '.tgz', '.ttf', '.war', '.wasm', '.webm', '.webp', '.woff',
+    '.woff2', '.xz', '.zip',
+])
+
+# Leading bytes of common binary formats.
+MAGIC_NUMBERS = (
+    b'\x89PNG', b'GIF87a', b'GIF89a', b'\xff\xd8\xff', b'%PDF', b'PK\x03\x04',
+    b'\x7fELF', b'\xca\xfe\xba\xbe', b'\x1f\x8b', b'BZh', b'\xfd7zXZ',
+    b'7z\xbc\xaf', b'\x00asm', b'RIFF', b'OggS', b'ID3',
+)
+
+
+def sniff_binary(prefix, extension=''):
+    """
+    Classify a file from its extension and leading bytes.
+    :param prefix: Up to SNIFF_BYTES bytes from the start of the file
+    :param extension: Lower-cased file extension, including the dot
+    :return: Reason the file looks binary, or None if it looks like text
+    """
+    if b'\x00' in prefix:
+        return 'contains NUL bytes'
+    if extension not in TEXT_EXTENSIONS and prefix.startswith(MAGIC_NUMBERS):
+        return 'binary file signature'
+    return None
+
+
+def decode_text(data):
+    """
+    Decode file bytes the way text mode reading would.
+    :param data: Raw file contents
+    :return: Decoded text with universal newlines, or None if not UTF-8
+    """
+    try:
+        content = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+
+def read_text_file(file_path):
+    """
+    Read a file once, classifying it as text or binary on the way.
+    :param file_path: Path to the file
+    :return: Tuple of (contents, reason); contents is None and reason says
+             why when the file was rejected
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in BINARY_EXTENSIONS:
+        return None, 'binary file extension'
+
+    try:
+        with open(file_path, 'rb') as f:
+            prefix = f.read(SNIFF_BYTES)
+            reason = sniff_binary(prefix, extension)
+            if reason:
+                return None, reason
+            data = prefix + f.read()
+    except OSError as e:
+        return None, f'unreadable: {e.strerror or e}'
+
+    content = decode_text(data)
+    if content is None:
+        return None, 'not valid UTF-8'
+    return content, None
+
+
 def is_ascii_text(file_path):
     """
     Check if the file contains ASCII text.
     :param file_path: Path to the file
     :return: Boolean indicating whether the file contains ASCII text
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            f.read()
-        return True
-    except UnicodeDecodeError:
-        return False
+    return read_text_file(file_path)[1] is None
 
-def get_text_files_contents(path, ignore=None):
+
+def get_text_files_contents(path, ignore=None, rejected=None):
     """
     Returns a dictionary with file paths (including file name) as keys 
     and the respective file contents as values.
     :param path: Directory path
     :param ignore: List of file or folder names to be ignored
+    :param rejected: Optional dictionary that receives the path and reason
+                     for every file that was skipped as non-text
     :return: Dictionary with file paths as keys and file contents as values
     """
     if ignore is None:
@@ -47,25 +130,22 @@ def get_text_files_contents(path, ignore=None):
         for filename in filenames:
             if filename not in ignore:
                 full_path = os.path.join(dirpath, filename)
-                if is_ascii_text(full_path):
-                    with open(full_path, 'r', encoding='ascii') as f:
-                        result[full_path] = f.read()
+                content, reason = read_text_file(full_path)
+                if reason is None:
+                    result[full_path] = content
+                else:
+                    logging.debug(f"Skipping {full_path}: {reason}")
+                    if rejected is not None:
+                        rejected[full_path] = reason
     return result
 
 
-def format_files_as_string(input):
-    def process_file(file_path):
-        if not is_ascii_text(file_path):
-            return f"file: {file_path}\nsource: [Binary File - Not ASCII Text]\n"
-            # pass
-
-        with open(file_path, 'r') as file:
-            content = file.read()
-            return f"\nfile: {file_path}\ncontent:\n{content}\n"
-            # return f"{content}\n\n"
-
-    formatted_string = ""
-
+def iter_file_paths(input):
+    """
+    Yields the paths of the files that make up a context, in walk order.
+    :param input: Directory path, single file path, or list of file paths
+    :return: Generator of file paths
+    """
     exclude_directories = set(['venv', '__pycache__', '.gitignore']) 
 
     if isinstance(input, str):
@@ -77,18 +157,75 @@ def format_files_as_string(input):
                 for file in files:
                     file_path = os.path.join(root, file)
                     if os.path.exists(file_path):
-                        formatted_string += process_file(file_path)
+                        yield file_path
         else:
             if os.path.exists(input):
-                formatted_string += process_file(input)
+                yield input
     elif isinstance(input, list):
         for file_path in input:
             if os.path.exists(file_path):
-                formatted_string += process_file(file_path)
+                yield file_path
     else:
         raise ValueError("Input must be a directory path, a single file path, or a list of file paths")
 
-    return formatted_string
+
+def format_file(file_path, rejected=None):
+    """
+    Formats a single file as a context block.
+    :param file_path: Path to the file
+    :param rejected: Optional dictionary that receives the reason when the
+                     file is skipped as non-text
+    :return: The formatted block for the file
+    """
+    content, reason = read_text_file(file_path)
+    if reason is not None:
+        logging.debug(f"Skipping {file_path}: {reason}")
+        if rejected is not None:
+            rejected[file_path] = reason
+        return f"file: {file_path}\nsource: [Binary File - Not ASCII Text]\n"
+
+    return f"\nfile: {file_path}\ncontent:\n{content}\n"
+
+
+def iter_formatted_files(input, rejected=None):
+    """
+    Yields one formatted block per file so callers never have to hold
+    more than the blocks they keep.
+    :param input: Directory path, single file path, or list of file paths
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    :return: Generator of formatted file blocks
+    """
+    for file_path in iter_file_paths(input):
+        yield format_file(file_path, rejected)
+
+
+def write_formatted_files(input, stream, rejected=None):
+    """
+    Writes the formatted context to a file-like object, block by block.
+    :param input: Directory path, single file path, or list of file paths
+    :param stream: Object with a write(str) method
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    """
+    for block in iter_formatted_files(input, rejected):
+        stream.write(block)
+
+
+def format_files_as_parts(input, header=None, rejected=None):
+    """
+    Returns the context as a list of prompt parts, one per file, ready to be
+    passed to send_message or generate_content.
+    :param input: Directory path, single file path, or list of file paths
+    :param header: Optional text part placed before the file blocks
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    :return: List of strings
+    """
+    parts = [header] if header else []
+    parts.extend(iter_formatted_files(input, rejected))
+    return parts
+
+
+def format_files_as_string(input, rejected=None):
+    return "".join(iter_formatted_files(input, rejected))
 
 def list_files(start_sha, end_sha, refer_commit_parent=False):
 
@@ -24,7 +24,7 @@ from google.cloud.aiplatform import telemetry
 from vertexai.generative_models import GenerativeModel
 
 from .constants import USER_AGENT, MODEL_NAME
-from .file_processor import format_files_as_string
+from .file_processor import format_files_as_parts
 
 model = GenerativeModel(MODEL_NAME)
 
@@ -39,19 +39,19 @@ NEW <<<<
 
 
 def get_source_code(repo_name: str):
-    """Clones the specified GitHub repository and returns its source code as a string.
+    """Clones the specified GitHub repository and returns its source code as prompt parts.
 
     Args:
         repo_name (str): The name of the repository to clone.
 
     Returns:
-        str: The source code of the cloned repository.
+        list[str]: The source code of the cloned repository, one part per file.
     """
     github_account = os.environ["GITHUB_ACCOUNT"]
     repo_name = os.environ["GITHUB_REPO_NAME"]
 
     clone_repo(github_account, repo_name)
-    return format_files_as_string(f"{repo_name}")
+    return format_files_as_parts(f"{repo_name}")
 
 
 def generate_pr_summary(existing_source_code: str, new_source_code: str) -> str:
@@ -273,7 +273,7 @@ def get_summary(instructions, source_code):
 
     Args:
         instructions (str): Instructions for generating the summary.
-        source_code (str): The project's source code.
+        source_code (list[str]): The project's source code, one part per file.
 
     Returns:
         str: The generated README summary.
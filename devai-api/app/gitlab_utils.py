@@ -27,7 +27,7 @@ from vertexai.generative_models import GenerativeModel
 
 from .github_utils import delete_folder
 from .constants import USER_AGENT, MODEL_NAME
-from .file_processor import format_files_as_string
+from .file_processor import format_files_as_parts
 
 
 LLM_INSTRUCTION_TEMPLATE = """You are principal software engineer and given requirements below for implementation.
@@ -50,7 +50,6 @@ LLM_INSTRUCTION_TEMPLATE = """You are principal software engineer and given requ
         >>>> NEW
 
         CONTEXT:
-        {codebase}
         """
 
 PR_PROMPT_TEMPLATE = """Create GitLab merge request using provided details below.
@@ -134,23 +133,23 @@ def _init_agent(new_gitlab_branch: str):
 
     return agent
 
-def _generate_llm_instructions(prompt: str, codebase: str) -> str:
+def _generate_llm_instructions(prompt: str, codebase: list[str]) -> list[str]:
     """Generates instructions for the Language Model (LLM).
 
     Args:
         prompt (str): The user prompt.
-        codebase (str): The codebase context.
+        codebase (list[str]): The codebase context, one part per file.
 
     Returns:
-        str: The formatted instructions for the LLM.
+        list[str]: The instructions followed by the codebase parts.
     """
-    return LLM_INSTRUCTION_TEMPLATE.format(prompt=prompt, codebase=codebase)
+    return [LLM_INSTRUCTION_TEMPLATE.format(prompt=prompt), *codebase]
 
-def _get_llm_response(instructions: str, repo_name: str) -> str:
+def _get_llm_response(instructions: list[str], repo_name: str) -> str:
     """Sends instructions to the LLM and retrieves its response.
 
     Args:
-        instructions (str): The instructions for the LLM.
+        instructions (list[str]): The instructions for the LLM.
         repo_name (str): The name of the repository.
 
     Returns:
@@ -217,7 +216,7 @@ def get_repo_details() -> tuple[str, str]:
     repo = gitlab_repo_name.split("/")
     return (repo[0], repo[1])
 
-def load_codebase(repo_name: str, prompt: str) -> str:
+def load_codebase(repo_name: str, prompt: str) -> list[str]:
     """Loads the codebase from the specified repository.
 
     Args:
@@ -225,7 +224,7 @@ def load_codebase(repo_name: str, prompt: str) -> str:
         prompt (str): The user prompt.
 
     Returns:
-        str: The formatted codebase as a string.
+        list[str]: The formatted codebase, one part per file.
     """
     # Defaults to repo root
     service = ""
@@ -243,4 +242,4 @@ def load_codebase(repo_name: str, prompt: str) -> str:
 
     code_path = f"{repo_name}/{service}"
 
-    return format_files_as_string(code_path)
+    return format_files_as_parts(code_path)
@@ -0,0 +1,122 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the latency of the old two-turn chat requests with the single
+system-instruction request used by the review and document commands.
+
+Needs the CLI installed (pip install -e src) and the same environment it
+uses (PROJECT_ID, LOCATION and application default credentials). Example:
+
+    python benchmarks/review_requests.py -c src/devai/util -n 3
+"""
+
+import statistics
+import time
+
+import click
+from click.testing import CliRunner
+from google.cloud.aiplatform import telemetry
+from vertexai.generative_models import GenerativeModel
+
+from devai.commands import document, models, review
+from devai.commands.constants import USER_AGENT, MODEL_NAME
+from devai.commands.request import generate, set_cache_mode
+
+COMMANDS = {
+    'review code': review.code,
+    'review performance': review.performance,
+    'review security': review.security,
+    'review testcoverage': review.testcoverage,
+    'review blockers': review.blockers,
+    'review compliance': review.compliance,
+    'document readme': document.readme,
+    'document releasenotes': document.releasenotes,
+}
+
+
+class Captured(Exception):
+    pass
+
+
+class CapturingModel:
+    """Stands in for GenerativeModel and stops the command at its first model call."""
+
+    captured = None
+
+    def __init__(self, model_name, system_instruction=None):
+        self.system_instruction = system_instruction
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        CapturingModel.captured = (self.system_instruction, contents)
+        raise Captured()
+
+    async def generate_content_async(self, contents, generation_config=None):
+        self.generate_content(contents)
+
+
+def capture_request(command, context):
+    """
+    Run a command up to its model call and return (instruction, contents).
+    The model class itself is swapped, so whichever request helper the
+    command uses, nothing is sent; the response cache is skipped so a
+    cached reply does not hide the request.
+    """
+    CapturingModel.captured = None
+    original = models.GenerativeModel
+    models.GenerativeModel = CapturingModel
+    try:
+        CliRunner().invoke(command, ['-c', context, '--no-cache'])
+    finally:
+        models.GenerativeModel = original
+    return CapturingModel.captured
+
+
+def two_turn_chat(instruction, contents):
+    """The request pattern the commands used before: instruction turn, then context turn."""
+    instructions = instruction if isinstance(instruction, list) else [instruction]
+    model = GenerativeModel(MODEL_NAME)
+    with telemetry.tool_context_manager(USER_AGENT):
+        chat = model.start_chat(response_validation=False)
+        for part in instructions:
+            chat.send_message(part)
+        return chat.send_message(contents)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option('-c', '--context', required=True, type=str, help="Context passed to every command.")
+@click.option('-n', '--repeat', default=3, type=int, help="Requests per command and pattern.")
+@click.option('--only', multiple=True, type=click.Choice(sorted(COMMANDS)), help="Limit to these commands.")
+def main(context, repeat, only):
+    click.echo(f"{'command':<24} {'chat (s)':>10} {'single (s)':>11} {'saved (s)':>10}")
+    # Time real requests, not cache hits.
+    set_cache_mode(enabled=False)
+    for name in only or COMMANDS:
+        request = capture_request(COMMANDS[name], context)
+        if request is None:
+            click.echo(f"{name:<24} could not build the request")
+            continue
+        chat = statistics.median(timed(two_turn_chat, *request) for _ in range(repeat))
+        single = statistics.median(timed(generate, *request) for _ in range(repeat))
+        click.echo(f"{name:<24} {chat:>10.2f} {single:>11.2f} {chat - single:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -14,7 +14,7 @@
 
 import click
 
-from devai.commands import cmd,  prompt, review, release, document
+from devai.commands import cmd,  prompt, review, release, document, cache, batch
 from devai.commands.rag import rag
 from devai.commands.prompts import prompts as prompts_group
 
@@ -44,6 +44,8 @@ devai.add_command(release.release)
 devai.add_command(document.document)
 devai.add_command(rag.rag)
 devai.add_command(prompts_group)
+devai.add_command(cache.cache)
+devai.add_command(batch.batch)
 
 # devai.add_command(jira.jira)
 # devai.add_command(gitlab.gitlab)
@@ -0,0 +1,432 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Reviews of many repositories in one resumable run."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import uuid
+
+import click
+from google.cloud.aiplatform import telemetry
+
+from devai.util.batch_state import (
+    DEFAULT_CHECKPOINT_FILE, DONE, FAILED, BatchCheckpoint, read_batch_manifest,
+)
+from devai.util.cache import get_response_cache
+from devai.util.file_processor import iter_file_paths, parse_git_spec
+from devai.util.git import get_repository
+from devai.util.packer import estimate_tokens, pack_context
+from devai.util.review_state import prompt_version
+
+from .constants import USER_AGENT, MODEL_NAME
+from .context import get_token_budget
+from .options import cache_options
+from .request import cache_mode, generate_async, response_key
+from .review import REVIEW_TYPES, parse_review_types, review_instructions
+
+# Requests in flight at once in a batch run.
+DEFAULT_BATCH_CONCURRENCY = 8
+
+CONTEXT_HEADER = "### Context (code) ###"
+
+# Request label carrying the id an exported request is matched by on import.
+REQUEST_LABEL = 'devai_request'
+
+
+class BatchItem:
+    """One review type of one repository."""
+
+    def __init__(self, repo, review_type, instruction, revision):
+        self.repo = repo
+        self.review_type = review_type
+        self.instruction = instruction
+        self.prompt = prompt_version(instruction)
+        self.revision = revision
+
+    @property
+    def key(self):
+        """Checkpoint key of the item."""
+        return self.repo, self.review_type, self.prompt, self.revision
+
+    def record(self, **fields):
+        return {'repo': self.repo, 'type': self.review_type, **fields}
+
+
+def context_revision(repo, run_id=''):
+    """
+    Fingerprint of the files a repository's context is read from: the
+    commit of a git:REV entry, otherwise the paths, sizes and modification
+    times of its files, so nothing is read. A new commit or an edited file
+    gives a new fingerprint, and with it new checkpoint items.
+
+    Args:
+        repo (str): Repository path, or any --context value.
+        run_id (str): Optional --run-id value, mixed in so a run can be
+            started afresh over unchanged files.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256(f"{run_id}\0".encode('utf-8'))
+    spec = parse_git_spec(repo)
+    if spec is not None:
+        digest.update(get_repository().run('rev-parse', '--verify', f"{spec[0]}^{{commit}}").encode('utf-8'))
+        return digest.hexdigest()
+    for path in iter_file_paths(repo):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def plan_items(manifest, types, checkpoint, run_id=''):
+    """
+    Items of a manifest that the checkpoint does not have as done for the
+    current revision of their repository, grouped by repository so each
+    context is packed once.
+
+    Args:
+        manifest (file): Batch manifest, see read_batch_manifest.
+        types (list): Default review types.
+        checkpoint (BatchCheckpoint): Progress of earlier runs.
+        run_id (str): Optional --run-id value.
+
+    Returns:
+        tuple: (pending items, number of items already done)
+    """
+    try:
+        entries = read_batch_manifest(manifest, types)
+    except ValueError as e:
+        raise click.UsageError(f"{manifest.name}: {e}")
+    unknown = sorted({t for _, entry_types in entries for t in entry_types if t not in REVIEW_TYPES})
+    if unknown:
+        raise click.UsageError(f"unknown review type(s) {', '.join(unknown)}; choose from {', '.join(REVIEW_TYPES)}")
+
+    instructions = review_instructions(sorted({t for _, entry_types in entries for t in entry_types}))
+    pending, done = [], 0
+    revisions = {}
+    for repo, entry_types in entries:
+        if repo not in revisions:
+            try:
+                revisions[repo] = context_revision(repo, run_id)
+            except (OSError, subprocess.SubprocessError) as e:
+                logging.warning(f"{repo}: could not fingerprint its files: {e}")
+                revisions[repo] = ''
+        for review_type in dict.fromkeys(entry_types):
+            item = BatchItem(repo, review_type, instructions[review_type], revisions[repo])
+            if checkpoint.status(*item.key) == DONE:
+                done += 1
+            else:
+                pending.append(item)
+    return pending, done
+
+
+def pack_repo(repo, budget, instructions):
+    """
+    Context of one repository, packed into the budget.
+
+    Args:
+        repo (str): Repository path, or any --context value.
+        budget (int): Optional --budget value.
+        instructions (list): Instructions sent with the context.
+
+    Returns:
+        list: Prompt parts.
+    """
+    reserved = sum(estimate_tokens(text) for text in (CONTEXT_HEADER, *instructions))
+    pack = pack_context(repo, get_token_budget(budget), reserved_tokens=reserved)
+    logging.info(f"{repo}: {pack.manifest()[0]}")
+    if not pack.included:
+        raise ValueError(f"no reviewable files in {repo}")
+    return pack.parts(CONTEXT_HEADER)
+
+
+class ContextPool:
+    """
+    Packed contexts shared by the items of a repository, packed on a
+    worker thread on first use and released once its last item is done.
+    """
+
+    def __init__(self, items, budget):
+        self.budget = budget
+        self._remaining = {}
+        self._instructions = {}
+        for item in items:
+            self._remaining[item.repo] = self._remaining.get(item.repo, 0) + 1
+            self._instructions.setdefault(item.repo, []).append(item.instruction)
+        self._tasks = {}
+
+    async def get(self, repo):
+        task = self._tasks.get(repo)
+        if task is None:
+            longest = max(self._instructions[repo], key=len)
+            task = self._tasks[repo] = asyncio.ensure_future(
+                asyncio.to_thread(pack_repo, repo, self.budget, [longest]))
+        return await task
+
+    def release(self, repo):
+        self._remaining[repo] -= 1
+        if not self._remaining[repo]:
+            self._tasks.pop(repo, None)
+
+
+async def run_items(items, worker, concurrency):
+    """
+    Run worker over items with concurrency workers. The workers share one
+    queue, so a worker that finishes early takes the next item rather than
+    waiting on a slow repository.
+
+    Args:
+        items (list): Work items, in the order they should start.
+        worker (callable): Coroutine function taking an item.
+        concurrency (int): Number of workers.
+    """
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def work():
+        while True:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await worker(item)
+
+    await asyncio.gather(*(work() for _ in range(max(1, min(concurrency, len(items))))))
+
+
+@click.command(name='run')
+@click.option('-m', '--manifest', type=click.File('r'), required=True,
+              help="Repositories to review, one path or JSON object per line ('-' for stdin).")
+@click.option('--types', default='code', callback=parse_review_types,
+              help=f"Review types of the repositories that name none: {', '.join(REVIEW_TYPES)}.")
+@click.option('-o', '--output', type=click.File('a'), default='-',
+              help="JSON lines file the results are appended to, stdout by default.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=DEFAULT_CHECKPOINT_FILE, show_default=True,
+              help="SQLite file recording finished items, so an interrupted run resumes where it stopped.")
+@click.option('--run-id', default='',
+              help="Label of the run; items done under another label run again even if their files are unchanged.")
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_BATCH_CONCURRENCY,
+              help="Review requests in flight at once.")
+@click.option('--budget', type=click.IntRange(min=1), default=None,
+              help="Token budget of each request; defaults to DEVAI_TOKEN_BUDGET or the model's input limit.")
+@cache_options
+def run(manifest, types, output, checkpoint, run_id, concurrency, budget):
+    """
+    Review many repositories, writing one JSON line per repository and
+    review type.
+    """
+    state = BatchCheckpoint(checkpoint)
+    items, done = plan_items(manifest, types, state, run_id)
+    if done:
+        click.echo(f"Skipping {done} items finished in an earlier run ({checkpoint}).", err=True)
+    click.echo(f"Reviewing {len(items)} items across {len({item.repo for item in items})} repositories.", err=True)
+
+    enabled, refresh = cache_mode()
+    cache = get_response_cache() if enabled else None
+    contexts = ContextPool(items, budget)
+    failed = 0
+
+    async def review_item(item):
+        nonlocal failed
+        try:
+            source = await contexts.get(item.repo)
+            key = response_key(MODEL_NAME, None, item.instruction, source)
+            text = cache.get(key) if cache is not None and not refresh else None
+            if text is None:
+                response = await generate_async(item.instruction, source)
+                text = response.text
+                if cache is not None:
+                    cache.put(key, text)
+            record = item.record(status=DONE, response=text)
+            state.record(*item.key, DONE, text)
+        except Exception as e:
+            failed += 1
+            logging.warning(f"{item.repo} ({item.review_type}): {e}")
+            record = item.record(status=FAILED, error=str(e))
+            state.record(*item.key, FAILED, str(e))
+        finally:
+            contexts.release(item.repo)
+        output.write(json.dumps(record) + '\n')
+        output.flush()
+
+    try:
+        with telemetry.tool_context_manager(USER_AGENT):
+            asyncio.run(run_items(items, review_item, concurrency))
+    finally:
+        if cache is not None:
+            cache.flush()
+        state.close()
+
+    if failed:
+        click.echo(f"{failed} of {len(items)} items failed; run again to retry them.", err=True)
+        sys.exit(1)
+
+
+def batch_request(item, source, key):
+    """
+    An item as a request line of a Vertex AI batch prediction job for
+    Gemini. The key travels in the request labels, which the job copies to
+    the prediction unchanged.
+
+    Args:
+        item (BatchItem): Item to review.
+        source (list): Its context parts.
+        key (str): Id of the request, see request_key.
+
+    Returns:
+        dict: The request.
+    """
+    return {
+        'systemInstruction': {'parts': [{'text': item.instruction}]},
+        'contents': [{'role': 'user', 'parts': [{'text': part} for part in source]}],
+        'labels': {REQUEST_LABEL: key},
+    }
+
+
+def request_key(request):
+    """Key of the request a prediction answers, or None when it carries none."""
+    labels = request.get('labels') if isinstance(request, dict) else None
+    return labels.get(REQUEST_LABEL) if isinstance(labels, dict) else None
+
+
+@click.command(name='export')
+@click.option('-m', '--manifest', type=click.File('r'), required=True,
+              help="Repositories to review, one path or JSON object per line ('-' for stdin).")
+@click.option('--types', default='code', callback=parse_review_types,
+              help=f"Review types of the repositories that name none: {', '.join(REVIEW_TYPES)}.")
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help="Where the batch prediction requests are written, stdout by default.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=DEFAULT_CHECKPOINT_FILE, show_default=True,
+              help="SQLite file recording the exported requests.")
+@click.option('--run-id', default='',
+              help="Label of the run; items done under another label run again even if their files are unchanged.")
+@click.option('--budget', type=click.IntRange(min=1), default=None,
+              help="Token budget of each request; defaults to DEVAI_TOKEN_BUDGET or the model's input limit.")
+def export(manifest, types, output, checkpoint, run_id, budget):
+    """
+    Write the pending items as JSON lines input of a Vertex AI batch
+    prediction job, for runs that can wait.
+    """
+    state = BatchCheckpoint(checkpoint)
+    items, done = plan_items(manifest, types, state, run_id)
+    if done:
+        click.echo(f"Skipping {done} items finished in an earlier run ({checkpoint}).", err=True)
+
+    exported = 0
+    try:
+        # Like ContextPool, pack each repository once with room for the
+        # longest instruction of its items.
+        longest = {}
+        for item in items:
+            longest[item.repo] = max(longest.get(item.repo, ''), item.instruction, key=len)
+        contexts = {}
+        for item in items:
+            try:
+                if item.repo not in contexts:
+                    contexts.clear()
+                    contexts[item.repo] = pack_repo(item.repo, budget, [longest[item.repo]])
+            except ValueError as e:
+                click.echo(f"Skipping {item.repo}: {e}", err=True)
+                continue
+            key = uuid.uuid4().hex
+            request = batch_request(item, contexts[item.repo], key)
+            state.remember_export(key, *item.key)
+            output.write(json.dumps({'request': request}) + '\n')
+            exported += 1
+    finally:
+        state.close()
+    click.echo(f"Exported {exported} requests. Upload them to Cloud Storage, run a batch prediction job "
+               f"with {MODEL_NAME}, and pass its output to 'devai batch import'.", err=True)
+
+
+def prediction_text(prediction):
+    """Text of a batch prediction output line; raises ValueError for a failed one."""
+    if prediction.get('status'):
+        raise ValueError(prediction['status'])
+    try:
+        parts = prediction['response']['candidates'][0]['content']['parts']
+    except (KeyError, IndexError, TypeError):
+        raise ValueError("prediction has no content")
+    return ''.join(part.get('text', '') for part in parts)
+
+
+@click.command(name='import')
+@click.option('-p', '--predictions', type=click.File('r'), required=True,
+              help="Output JSON lines of the batch prediction job ('-' for stdin).")
+@click.option('-o', '--output', type=click.File('a'), default='-',
+              help="JSON lines file the results are appended to, stdout by default.")
+@click.option('--checkpoint', type=click.Path(dir_okay=False), default=DEFAULT_CHECKPOINT_FILE, show_default=True,
+              help="SQLite file the requests were exported with.")
+def import_predictions(predictions, output, checkpoint):
+    """
+    Record the output of a batch prediction job as results of the items
+    exported with 'devai batch export'.
+    """
+    state = BatchCheckpoint(checkpoint)
+    imported = failed = unknown = 0
+    try:
+        for line in predictions:
+            if not line.strip():
+                continue
+            prediction = json.loads(line)
+            key = request_key(prediction.get('request'))
+            item = state.exported(key) if key else None
+            if item is None:
+                unknown += 1
+                continue
+            repo, review_type = item[:2]
+            try:
+                text = prediction_text(prediction)
+            except ValueError as e:
+                failed += 1
+                state.record(*item, FAILED, str(e))
+                record = {'repo': repo, 'type': review_type, 'status': FAILED, 'error': str(e)}
+            else:
+                imported += 1
+                state.record(*item, DONE, text)
+                record = {'repo': repo, 'type': review_type, 'status': DONE, 'response': text}
+            output.write(json.dumps(record) + '\n')
+    finally:
+        state.close()
+    click.echo(f"Imported {imported} results, {failed} failed, {unknown} not from this checkpoint.", err=True)
+    if unknown and not imported and not failed:
+        click.echo(f"None of the predictions carry a '{REQUEST_LABEL}' label exported with {checkpoint}; "
+                   f"check that the job ran on the requests of 'devai batch export' and that --checkpoint matches.",
+                   err=True)
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
+
+
+@click.group()
+def batch():
+    """
+    Review many repositories from a manifest, online or through batch prediction.
+    """
+    pass
+
+
+batch.add_command(run)
+batch.add_command(export)
+batch.add_command(import_predictions)
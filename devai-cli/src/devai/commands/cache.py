@@ -0,0 +1,70 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import click
+
+from devai.util.cache import get_cache_dir, get_context_cache, get_prompt_cache, get_response_cache
+from devai.util.imgdiff import get_verdict_cache
+from devai.util.mapreduce import get_shard_cache
+
+# Caches managed by 'devai cache', by name.
+CACHES = {
+    'context': get_context_cache,
+    'shards': get_shard_cache,
+    'responses': get_response_cache,
+    'prompts': get_prompt_cache,
+    'imgdiff': get_verdict_cache,
+}
+
+
+@click.command(name='stats')
+def stats():
+    """
+    Show the size and hit rate of the local caches.
+    """
+    click.echo(f"Cache directory: {get_cache_dir()}")
+    for name, get_cache in CACHES.items():
+        cache = get_cache()
+        if cache is None:
+            click.echo(f"{name:<10} disabled")
+            continue
+        data = cache.stats()
+        lookups = data['hits'] + data['misses']
+        rate = f"{data['hits'] / lookups:.0%}" if lookups else "n/a"
+        click.echo(f"{name:<10} {data['entries']:>7,} entries {data['bytes'] / 1024 / 1024:>9.1f} MiB "
+                   f"{data['hits']:>7,} hits {data['misses']:>7,} misses  hit rate {rate}")
+
+
+@click.command(name='clear')
+@click.argument('names', nargs=-1, type=click.Choice(list(CACHES)))
+def clear(names):
+    """
+    Empty the local caches, or only the named ones.
+    """
+    for name in names or CACHES:
+        cache = CACHES[name]()
+        if cache is not None:
+            cache.clear()
+            click.echo(f"Cleared the {name} cache")
+
+
+@click.group()
+def cache():
+    """
+    Inspect and clear the local context, shard, response and prompt override caches.
+    """
+    pass
+
+cache.add_command(stats)
+cache.add_command(clear)
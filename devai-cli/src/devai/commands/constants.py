@@ -1,2 +1,7 @@
 USER_AGENT = 'cloud-solutions/genai-for-developers-v1.0'
 MODEL_NAME = 'gemini-2.0-flash-001'
+
+# Input window of MODEL_NAME and its list price per million input tokens (USD),
+# used for local budget and cost estimates.
+MODEL_INPUT_TOKEN_LIMIT = 1048576
+INPUT_PRICE_PER_MILLION_TOKENS = 0.10
@@ -0,0 +1,228 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+
+import click
+
+from devai.util.file_processor import iter_context_files, iter_file_paths, read_text_file, resolve_context
+from devai.util.k8s_policy import (
+    MANIFEST_EXTENSIONS, check_documents, compile_standards, documents_block, load_manifest, pod_spec_of,
+)
+from devai.util.mapreduce import shard_files
+from devai.util.packer import estimate_tokens, pack_context
+
+from .constants import MODEL_INPUT_TOKEN_LIMIT, INPUT_PRICE_PER_MILLION_TOKENS
+
+
+def get_token_budget(budget=None):
+    """Resolve the token budget from the option, DEVAI_TOKEN_BUDGET or the model limit."""
+    if budget is None:
+        try:
+            budget = int(os.getenv('DEVAI_TOKEN_BUDGET', MODEL_INPUT_TOKEN_LIMIT))
+        except ValueError:
+            budget = MODEL_INPUT_TOKEN_LIMIT
+    return min(budget, MODEL_INPUT_TOKEN_LIMIT)
+
+
+def prepare_context(context, header, files_from=None, budget=None, dry_run=False, instructions=()):
+    """
+    Pack a command's context into the token budget and print the manifest
+    to stderr.
+
+    Args:
+        context (str): The --context value.
+        header (str): Text placed before the file parts.
+        files_from (file): Optional --files-from stream.
+        budget (int): Optional --budget value.
+        dry_run (bool): Print the estimate only.
+        instructions (list): Other prompt text sent with the context, counted
+            against the budget.
+
+    Returns:
+        list: Prompt parts, or None for a dry run.
+    """
+    budget = get_token_budget(budget)
+    reserved = sum(estimate_tokens(text) for text in (header, *instructions) if text)
+    pack = pack_context(resolve_context(context, files_from), budget, reserved_tokens=reserved)
+
+    for line in pack.manifest(verbose=dry_run):
+        click.echo(line, err=True)
+
+    if dry_run:
+        total = pack.tokens + reserved
+        cost = total / 1_000_000 * INPUT_PRICE_PER_MILLION_TOKENS
+        click.echo(f"Estimated input: ~{total:,} tokens, ~${cost:.4f} per request", err=True)
+        return None
+    return pack.parts(header)
+
+
+def collect_files(context, files_from=None):
+    """
+    Format every file of a command's context, without a budget.
+
+    Args:
+        context (str): The --context value.
+        files_from (file): Optional --files-from stream.
+
+    Returns:
+        list: (file_path, block, tokens) tuples in walk order.
+    """
+    return [(file_path, block, estimate_tokens(block))
+            for file_path, block in iter_context_files(resolve_context(context, files_from))]
+
+
+def plan_shards(files, header, shard_tokens=None, dry_run=False, instructions=()):
+    """
+    Split files into shards of at most shard_tokens tokens each, one request
+    per shard, and print a summary to stderr.
+
+    Args:
+        files (list): (file_path, block, tokens) tuples, see collect_files.
+        header (str): Text placed before the file parts of every shard.
+        shard_tokens (int): Token budget of one request.
+        dry_run (bool): Print the estimate only.
+        instructions (list): Other prompt text sent with every shard.
+
+    Returns:
+        list: Shards as lists of (file_path, block, tokens), or None for a
+            dry run.
+    """
+    reserved = sum(estimate_tokens(text) for text in (header, *instructions) if text)
+    shard_tokens = max(1, get_token_budget(shard_tokens) - reserved)
+    shards = shard_files(files, shard_tokens)
+
+    context_tokens = sum(tokens for _, _, tokens in files)
+    click.echo(f"Context: {len(files)} files, ~{context_tokens:,} tokens in {len(shards)} shards "
+               f"of up to ~{shard_tokens:,} tokens", err=True)
+    if dry_run:
+        for index, shard in enumerate(shards, 1):
+            tokens = sum(tokens for _, _, tokens in shard)
+            click.echo(f"  shard {index}: {len(shard)} files, ~{tokens:,} tokens", err=True)
+        total = context_tokens + reserved * len(shards)
+        cost = total / 1_000_000 * INPUT_PRICE_PER_MILLION_TOKENS
+        click.echo(f"Estimated input: ~{total:,} tokens, ~${cost:.4f} per run", err=True)
+        return None
+    return shards
+
+
+def prepare_shards(context, header, files_from=None, shard_tokens=None, dry_run=False, instructions=()):
+    """
+    Split a command's whole context into shards, see plan_shards.
+
+    Args:
+        context (str): The --context value.
+        header (str): Text placed before the file parts of every shard.
+        files_from (file): Optional --files-from stream.
+        shard_tokens (int): Token budget of one request.
+        dry_run (bool): Print the estimate only.
+        instructions (list): Other prompt text sent with every shard.
+
+    Returns:
+        list: Shards, or None for a dry run.
+    """
+    return plan_shards(collect_files(context, files_from), header, shard_tokens, dry_run, instructions)
+
+
+def read_texts(context):
+    """Contents of the text files of a context, in walk order."""
+    texts = []
+    for file_path in iter_file_paths(context):
+        content, reason = read_text_file(file_path)
+        if content is None:
+            logging.info(f"Skipping {file_path}: {reason}")
+        else:
+            texts.append((file_path, content))
+    return texts
+
+
+def context_location(file_path, context):
+    """
+    Path of a context file from the directory that holds the context, so
+    only the directories the user pointed at tell its environment.
+    """
+    if isinstance(context, str) and os.path.isdir(context):
+        return os.path.relpath(file_path, os.path.dirname(os.path.abspath(context)))
+    return os.path.relpath(file_path) if os.path.isabs(file_path) else file_path
+
+
+def prefilter_manifests(context, config, files_from=None, budget=None, dry_run=False, instructions=()):
+    """
+    Check the Kubernetes manifests of a context against the reference
+    configurations of the standards files. Workload containers are sent
+    only when they may break them; other documents and files are sent
+    unchanged.
+
+    Args:
+        context (str): The --context value.
+        config (str): Standards file or directory.
+        files_from (file): Optional --files-from stream.
+        budget (int): Optional --budget value.
+        dry_run (bool): Print the estimate only.
+        instructions (list): Other prompt text sent with the findings.
+
+    Returns:
+        tuple: (digest, parts); digest is None when the standards hold no
+            reference configuration to check against, parts is None for a
+            dry run and empty when nothing needs the model.
+    """
+    standards = compile_standards([text for _, text in read_texts(config)])
+    if not standards.references:
+        return None, None
+
+    context = resolve_context(context, files_from)
+    manifests = 0
+    findings = []
+    # (file_path, label, block) of what the local checks cannot judge.
+    unchecked = []
+    for file_path, text in read_texts(context):
+        documents = load_manifest(text) if file_path.lower().endswith(MANIFEST_EXTENSIONS) else None
+        if documents is None:
+            unchecked.append((file_path, 'file', f"\nfile: {file_path}\ncontent:\n{text}\n"))
+            continue
+        manifests += 1
+        findings += check_documents(file_path, documents, standards, context_location(file_path, context))
+        others = [doc for doc in documents if pod_spec_of(doc) is None]
+        if len(others) == len(documents):
+            unchecked.append((file_path, 'file', f"\nfile: {file_path}\ncontent:\n{text}\n"))
+        elif others:
+            unchecked.append((file_path, *documents_block(file_path, others)))
+    digest = standards.digest()
+
+    budget = get_token_budget(budget)
+    reserved = sum(estimate_tokens(text) for text in (digest, *instructions) if text)
+    blocks, tokens = [], 0
+    entries = [(finding.file_path, f"{finding.kind} {finding.name}, container {finding.container}", finding.block())
+               for finding in findings] + unchecked
+    for file_path, label, block in entries:
+        block_tokens = estimate_tokens(block)
+        if reserved + tokens + block_tokens > budget:
+            click.echo(f"  dropped {file_path} ({label}): over the token budget", err=True)
+            continue
+        blocks.append(block)
+        tokens += block_tokens
+
+    click.echo(f"Checked {manifests} manifests locally: {len(findings)} containers with potential violations, "
+               f"{len(unchecked)} files or documents sent unchecked, ~{tokens:,} tokens", err=True)
+    if dry_run:
+        for finding in findings:
+            click.echo(f"  {finding.file_path}: {finding.kind} {finding.name}, container {finding.container}, "
+                       f"{len(finding.problems)} potential violations", err=True)
+        for file_path, label, _ in unchecked:
+            click.echo(f"  {file_path}: {label}, not checked locally", err=True)
+        cost = (tokens + reserved) / 1_000_000 * INPUT_PRICE_PER_MILLION_TOKENS
+        click.echo(f"Estimated input: ~{tokens + reserved:,} tokens, ~${cost:.4f} per request", err=True)
+        return digest, None
+    return digest, ["### Context (flagged containers and unchecked files) ###", *blocks] if blocks else []
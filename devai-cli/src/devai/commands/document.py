@@ -13,74 +13,26 @@
 # limitations under the License.
 
 import click
-from devai.util.file_processor import format_files_as_string
 from vertexai.generative_models import (
-    GenerativeModel,
     Image,
 )
-from google.cloud.aiplatform import telemetry
-import os
-from google.cloud import secretmanager
-from google.api_core.exceptions import NotFound, PermissionDenied
-from google.api_core.gapic_v1.client_info import ClientInfo
-import logging
 
-
-from .constants import USER_AGENT, MODEL_NAME
+from .options import files_from_option, budget_options, cache_options
+from .context import prepare_context
+from .request import stream
+from .overrides import get_prompt
 
 # from devai.commands.github_cmd import create_github_pr
 
 
-def ensure_env_variable(var_name):
-    """Ensure an environment variable is set."""
-    value = os.getenv(var_name)
-    if value is None:
-        raise EnvironmentError(f"Required environment variable '{var_name}' is not set.")
-    return value
-
-def get_prompt( secret_id: str) -> str:
-    """Retrieves a secret value from Google Secret Manager.
-
-    Args:
-        secret_id: The ID of the secret to retrieve.
-
-    Returns:
-        The secret value as a string, or None if the secret is not found or the user lacks permission.
-    """    
-    try:
-        project_id = ensure_env_variable('PROJECT_ID')
-        logging.info("PROJECT_ID:", project_id)
-
-        client = secretmanager.SecretManagerServiceClient(
-        client_info=ClientInfo(user_agent=USER_AGENT)
-        )
-        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-        try:
-            response = client.access_secret_version(name=name)
-            payload = response.payload.data.decode("utf-8")
-            logging.info(f"Successfully retrieved secret ID: {secret_id} in project {project_id}")
-            return payload
-        
-        except PermissionDenied:
-            logging.warning(f"Insufficient permissions to access secret {secret_id} in project {project_id}")
-            return None
-        
-        except NotFound:
-            logging.info(f"Secret ID not found: {secret_id} in project {project_id}")
-            return None
-        
-        except Exception as e:  # Catching a broader range of potential errors
-            logging.error(f"An unexpected error occurred while retrieving secret '{secret_id}': {e}")
-            return None
-    
-    except EnvironmentError as e:
-        logging.error(e)
-
 @click.command(name='readme')
 @click.option('-c', '--context', required=False, type=str, default="", help="The code, or context, that you would like to pass.")
 @click.option('-f', '--file', required=False, type=str, default="", help="The file path in the repo to update.")
 @click.option('-b', '--branch', required=False, type=str, default="", help="The branch name for PR")
-def readme(context, file, branch):
+@files_from_option
+@budget_options
+@cache_options
+def readme(context, file, branch, files_from, budget, dry_run):
     """Create a README based on the context passed!
     
     This is useful when no existing README files exist. If you already have a README `update-readme` may be a better option.
@@ -89,11 +41,6 @@ def readme(context, file, branch):
     click.echo('Generating and printing the README....')
     
 
-    source='''
-            ### Context (code) ###
-            {}
-
-            '''
     qry = get_prompt('document_readme')
 
     if qry is None:
@@ -136,16 +83,13 @@ def readme(context, file, branch):
             Contact Information: Email us at support@cymbal.coffee or open an issue on our GitHub repository.
             '''
 
-    # Load files as text into source variable
-    source=source.format(format_files_as_string(context))
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
 
     try:
-        code_chat_model = GenerativeModel(MODEL_NAME)
-        with telemetry.tool_context_manager(USER_AGENT):
-            code_chat = code_chat_model.start_chat()
-            code_chat.send_message(qry)
-            response = code_chat.send_message(source)
-            click.echo(f"{response.text}")
+        stream(qry, source)
     except Exception as e:
         print(f"Failed to call LLM: {e}")
         return
@@ -162,7 +106,10 @@ def readme(context, file, branch):
 @click.command(name='update-readme')
 @click.option('-f', '--file', type=str, help="The existing release notes to be updated.")
 @click.option('-c', '--context', required=False, type=str, default="", help="The code, or context, that you would like to pass.")
-def update_readme(context, file):
+@files_from_option
+@budget_options
+@cache_options
+def update_readme(context, file, files_from, budget, dry_run):
     """Ureate a release notes based on the context passed!
     
     
@@ -188,8 +135,6 @@ def update_readme(context, file):
             {current}
             
             NEW CODE:
-            {context}
-
             '''
     qry = get_prompt('document_update_readme') or f'''
             ### Instruction ###
@@ -376,15 +321,11 @@ def update_readme(context, file):
             '''
 
    
-    source=source.format(current=current, context=format_files_as_string(context))
+    source = prepare_context(context, source.format(current=current), files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
     
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat()
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
-
-    click.echo(f"{response.text}")
+    stream(qry, source)
 
 
 
@@ -392,7 +333,10 @@ def update_readme(context, file):
 @click.option('-t', '--tag', required=False, type=str, help="The version (or tag) number for the release notes.")
 # @click.option('-f', '--file', type=str, help="The existing release notes to be updated.")
 @click.option('-c', '--context', required=False, type=str, default="", help="The code, or context, that you would like to pass.")
-def releasenotes(context, tag):
+@files_from_option
+@budget_options
+@cache_options
+def releasenotes(context, tag, files_from, budget, dry_run):
     """Create a release notes based on the context passed!
     
     This is useful when no existing release notes exist. If you already have release notes `update-releasenotes` may be a better option.
@@ -402,11 +346,6 @@ def releasenotes(context, tag):
     version_info = f"The version number {tag} should be used." if tag else "" 
     
 
-    source='''
-            ### Context (code) ###
-            {}
-
-            '''
     qry = get_prompt('document_releasenotes') or f'''
             ### Instruction ###
             Generate comprehensive release notes for the specified software project and version. The release notes should adhere to industry best practices, be suitable for both technical users and non-technical stakeholders, and accurately reflect the changes and improvements introduced in this release.
@@ -445,23 +384,22 @@ def releasenotes(context, tag):
             * Real-time collaboration may experience delays in slow network environments.
             '''
 
-   
-    source=source.format(format_files_as_string(context))
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
     
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat()
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
-
-    click.echo(f"{response.text}")
+    stream(qry, source)
 
 
 @click.command(name='update-releasenotes')
 @click.option('-t', '--tag', required=False, type=str, help="The version number for the release notes.")
 @click.option('-f', '--file', required=True, type=str, help="The existing release notes to be updated or reviewed.")
 @click.option('-c', '--context', required=False, type=str, default="", help="The code, or context, that you would like to pass.")
-def update_releasenotes(context, tag, file):
+@files_from_option
+@budget_options
+@cache_options
+def update_releasenotes(context, tag, file, files_from, budget, dry_run):
     """Update release notes based on the context passed!
     
     """
@@ -486,8 +424,6 @@ def update_releasenotes(context, tag, file):
             {current}
             
             NEW CODE:
-            {context}
-
             '''
     qry = get_prompt('document_update_releasenotes') or f'''
             ### Instruction ###
@@ -560,15 +496,11 @@ def update_releasenotes(context, tag, file):
             '''
 
    
-    source=source.format(current=current, context=format_files_as_string(context))
+    source = prepare_context(context, source.format(current=current), files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
     
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat()
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
-
-    click.echo(f"{response.text}")
+    stream(qry, source)
 
 
 
@@ -0,0 +1,262 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Image reviews, of one image or pair at a time or of whole directories."""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+from google.cloud.aiplatform import telemetry
+from PIL import Image as PILImage
+from vertexai.generative_models import Image
+
+from devai.util.imgdiff import encode_image, get_verdict_cache, prediff, verdict_key
+
+from .constants import USER_AGENT, MODEL_NAME
+from .models import get_model, with_retries
+from .request import cache_mode, generate
+
+# Files picked up from a directory of screenshots.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.gif', '.bmp')
+
+IMGDIFF_QUERY = '''
+        INSTRUCTIONS:
+        Meticulously examine the two provided images. Generate a comprehensive report detailing the specific
+        elements absent from each image in comparison to the other.  Clearly articulate the reasoning and
+        methodology employed to arrive at your conclusions.
+        '''
+
+
+def collect_images(directory):
+    """
+    Images below a directory.
+
+    Args:
+        directory (str): Directory to walk.
+
+    Returns:
+        list: Paths relative to directory, sorted, with '/' separators.
+    """
+    names = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                names.append(os.path.relpath(os.path.join(root, file), directory).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def pair_directories(current_dir, target_dir):
+    """
+    Pairs the images of two directories by their relative path.
+
+    Args:
+        current_dir (str): Screenshots of the current state.
+        target_dir (str): Screenshots of the target state.
+
+    Returns:
+        list: One {'name', 'current', 'target'} dict per image found in both.
+    """
+    current = collect_images(current_dir)
+    target = set(collect_images(target_dir))
+    unmatched = [name for name in current if name not in target] + sorted(target.difference(current))
+    if unmatched:
+        logging.warning(f"{len(unmatched)} image(s) have no counterpart and are skipped: {', '.join(unmatched[:10])}")
+    return [{'name': name, 'current': os.path.join(current_dir, name), 'target': os.path.join(target_dir, name)}
+            for name in current if name in target]
+
+
+def read_manifest(manifest):
+    """
+    Reads image pairs from a JSON lines manifest such as
+    {"current": "after/login.png", "target": "before/login.png", "name": "login"}.
+    Relative paths are resolved against the directory of the manifest.
+
+    Args:
+        manifest (str): Manifest file.
+
+    Returns:
+        list: One {'name', 'current', 'target'} dict per line.
+    """
+    base = os.path.dirname(os.path.abspath(manifest))
+    pairs = []
+    with open(manifest, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                current, target = entry['current'], entry['target']
+            except (ValueError, KeyError, TypeError):
+                raise click.UsageError(
+                    f"{manifest}:{number}: expected a JSON object with 'current' and 'target' paths")
+            pairs.append({'name': str(entry.get('name', current)),
+                          'current': os.path.join(base, current),
+                          'target': os.path.join(base, target)})
+    return pairs
+
+
+def image_part(path):
+    """
+    An image to send to the model, downscaled and recompressed locally so
+    large screenshots upload quickly.
+
+    Args:
+        path (str): Image file.
+
+    Returns:
+        Image: Prompt part.
+    """
+    with PILImage.open(path) as image:
+        return Image.from_bytes(encode_image(image))
+
+
+def describe_image(path, qry):
+    """
+    Asks about one image; the response is cached like the other requests.
+
+    Args:
+        path (str): Image file.
+        qry (str): Instructions.
+
+    Returns:
+        dict: The response text.
+    """
+    return {'response': generate(qry, [image_part(path)]).text}
+
+
+def imgdiff_contents(qry, result):
+    """
+    Builds the request of an image diff from the local pre-diff.
+
+    Args:
+        qry (str): Instructions.
+        result (PreDiff): Crops or whole images of the current and target state.
+
+    Returns:
+        list: Prompt parts.
+    """
+    contents = [qry]
+    cropped = any(region is not None for region, _, _ in result.pairs)
+    if cropped:
+        contents.append(
+            "Only the regions where the images differ are shown, cropped from both images. Each region is "
+            "given as left, top, right, bottom pixel coordinates of the full current image (IMAGE 2); "
+            "everything else is unchanged.")
+        if result.sizes and result.sizes[0] != result.sizes[1]:
+            contents.append("The images differ in size ({}x{} current, {}x{} target); the crops were taken after "
+                            "scaling both to the smaller size.".format(*result.sizes[0], *result.sizes[1]))
+    for region, current, target in result.pairs:
+        if region is not None:
+            contents.append(f"REGION {', '.join(str(value) for value in region)}:")
+        contents += ["IMAGE 2:", Image.from_bytes(current), "IMAGE 1:", Image.from_bytes(target)]
+    return contents
+
+
+def cached_verdict(qry, result, full):
+    """
+    Looks up the verdict on an image pair.
+
+    Args:
+        qry (str): Instructions.
+        result (PreDiff): Pre-diff of the pair.
+        full (bool): Whether whole images are sent.
+
+    Returns:
+        tuple: (cache, key, verdict); cache is None when disabled and
+            verdict None on a miss or with --refresh.
+    """
+    enabled, refresh = cache_mode()
+    cache = get_verdict_cache() if enabled else None
+    key = verdict_key(MODEL_NAME, f"{qry}\0{'full' if full else 'regions'}", *result.digests)
+    if cache is None or refresh:
+        return cache, key, None
+    return cache, key, cache.get(key)
+
+
+def diff_images(current, target, qry, full=False):
+    """
+    Compares two images, asking the model only about pairs that differ and
+    have no cached verdict.
+
+    Args:
+        current (str): Image of the current state.
+        target (str): Image of the target state.
+        qry (str): Instructions.
+        full (bool): Send the whole images instead of the changed regions.
+
+    Returns:
+        dict: Whether the images are identical, the changed regions, and the
+            model response, or a note on why differing images were not sent.
+    """
+    result = prediff(current, target, crop=not full)
+    record = {'identical': result.identical, 'regions': [list(region) for region in result.regions],
+              'changed_ratio': round(result.changed_ratio, 4)}
+    if not result.pairs:
+        if result.note:
+            record['note'] = f"no significant difference: {result.note}"
+        return record
+
+    cache, key, verdict = cached_verdict(qry, result, full)
+    record['cached'] = verdict is not None
+    if verdict is None:
+        contents = imgdiff_contents(qry, result)
+        model = get_model(MODEL_NAME)
+        with telemetry.tool_context_manager(USER_AGENT):
+            verdict = with_retries(lambda: model.generate_content(contents)).text
+        if cache is not None:
+            cache.put(key, verdict)
+    record['response'] = verdict
+    return record
+
+
+def flush_verdicts():
+    """Writes the verdicts cached by diff_images to disk."""
+    cache = get_verdict_cache() if cache_mode()[0] else None
+    if cache is not None:
+        cache.flush()
+
+
+def run_batch(items, work, concurrency, output):
+    """
+    Runs work over items in a bounded pool of threads and writes one JSON
+    line per item, in input order, as soon as it and the ones before it are
+    done. The images are read and encoded inside the workers, so only the
+    ones in flight are held in memory.
+
+    Args:
+        items (list): Dicts describing each item; copied into its line.
+        work (callable): Takes an item and returns a dict of results.
+        concurrency (int): Items processed at once.
+        output (file): Where the JSON lines go.
+
+    Returns:
+        int: Number of items that failed; their lines carry an 'error'.
+    """
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = [executor.submit(work, item) for item in items]
+        for item, future in zip(items, futures):
+            try:
+                record = {**item, **future.result()}
+            except Exception as e:
+                failed += 1
+                logging.warning(f"{item.get('name')}: {e}")
+                record = {**item, 'error': str(e)}
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+    return failed
@@ -0,0 +1,264 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Model clients shared by the commands, with per-call deadlines and retries."""
+
+import asyncio
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable, TooManyRequests
+from google.cloud.aiplatform import initializer as aiplatform_initializer
+from google.cloud.aiplatform_v1beta1.services import prediction_service
+from vertexai.generative_models import GenerativeModel
+from vertexai.language_models import CodeChatModel
+
+from devai.util.ratelimit import get_rate_controller
+
+from .constants import MODEL_NAME
+
+# Seconds a single model call may take; DEVAI_MODEL_TIMEOUT overrides, 0 for no deadline.
+DEFAULT_MODEL_TIMEOUT = 300
+
+# Attempts after the first one for calls rejected with 429 or 503; DEVAI_MODEL_RETRIES overrides.
+DEFAULT_MODEL_RETRIES = 5
+
+# Backoff before retry n is drawn uniformly from [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)] seconds.
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Errors worth retrying: quota exhausted and service overloaded.
+RETRYABLE_ERRORS = (ResourceExhausted, TooManyRequests, ServiceUnavailable)
+
+# Prediction client methods that get the configured deadline.
+_DEADLINE_METHODS = ('generate_content', 'stream_generate_content', 'count_tokens')
+
+
+def get_model_timeout():
+    """Deadline of one model call in seconds, None when calls may run for ever."""
+    try:
+        timeout = float(os.getenv('DEVAI_MODEL_TIMEOUT', DEFAULT_MODEL_TIMEOUT))
+    except ValueError:
+        timeout = DEFAULT_MODEL_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def get_model_retries():
+    """Number of retries of a call rejected with a quota or availability error."""
+    try:
+        return max(0, int(os.getenv('DEVAI_MODEL_RETRIES', DEFAULT_MODEL_RETRIES)))
+    except ValueError:
+        return DEFAULT_MODEL_RETRIES
+
+
+def backoff_delay(attempt):
+    """Seconds to wait before retry number attempt (0 based), with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class _SharedClient:
+    """
+    Prediction client created on first use and shared by every model of the
+    process, so concurrent requests reuse one channel. Calls that generate
+    content get the configured deadline.
+
+    The asynchronous client is bound to the event loop it was created in,
+    so one is kept per loop.
+    """
+
+    def __init__(self, client_class, location):
+        self._client_class = client_class
+        self._location = location
+        self._clients = weakref.WeakKeyDictionary() if self._is_async else {}
+        self._lock = threading.Lock()
+
+    @property
+    def _is_async(self):
+        return self._client_class is prediction_service.PredictionServiceAsyncClient
+
+    def _client(self):
+        key = asyncio.get_running_loop() if self._is_async else None
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                client = self._clients[key] = aiplatform_initializer.global_config.create_client(
+                    client_class=self._client_class,
+                    location_override=self._location,
+                    prediction_client=True,
+                )
+            return client
+
+    def __getattr__(self, name):
+        attr = getattr(self._client(), name)
+        timeout = get_model_timeout()
+        if name in _DEADLINE_METHODS and timeout:
+            return functools.partial(attr, timeout=timeout)
+        return attr
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def _shared_client(client_class, location):
+    with _shared_clients_lock:
+        client = _shared_clients.get((client_class, location))
+        if client is None:
+            client = _shared_clients[(client_class, location)] = _SharedClient(client_class, location)
+        return client
+
+
+def get_model(model_name=MODEL_NAME, system_instruction=None):
+    """
+    Generative model whose requests go through the process-wide clients.
+
+    Args:
+        model_name (str): Model to call.
+        system_instruction (str or list): Optional system instruction.
+
+    Returns:
+        GenerativeModel
+    """
+    model = GenerativeModel(model_name, system_instruction=system_instruction)
+    location = getattr(model, '_location', None)
+    model._prediction_client_value = _shared_client(
+        prediction_service.PredictionServiceClient, location)
+    model._prediction_async_client_value = _shared_client(
+        prediction_service.PredictionServiceAsyncClient, location)
+    return model
+
+
+@functools.lru_cache(maxsize=None)
+def get_chat_model(model_name):
+    """
+    Code chat model, loaded once per process instead of on every command.
+
+    Args:
+        model_name (str): Model to load, e.g. codechat-bison.
+
+    Returns:
+        CodeChatModel
+    """
+    return CodeChatModel.from_pretrained(model_name)
+
+
+def _log_retry(e, attempt, delay):
+    logging.warning(f"Model call failed ({e.__class__.__name__}: {e}); "
+                    f"retry {attempt + 1} of {get_model_retries()} in {delay:.1f}s")
+
+
+def with_retries(call, kind='model'):
+    """
+    Make a model call, retrying quota and availability errors with jittered
+    exponential backoff. Every attempt waits for a slot from the rate
+    controller shared by the devai processes of the machine, and reports
+    back whether it got through.
+
+    Args:
+        call (callable): Makes the call and returns its result.
+        kind (str): Rate controller to use, 'model' or 'embedding'.
+
+    Returns:
+        The result of call.
+    """
+    controller = get_rate_controller(kind)
+    retries = get_model_retries()
+    attempt = 0
+    while True:
+        if controller:
+            controller.acquire()
+        try:
+            result = call()
+        except RETRYABLE_ERRORS as e:
+            if controller:
+                controller.throttled()
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            _log_retry(e, attempt, delay)
+            time.sleep(delay)
+            attempt += 1
+        else:
+            if controller:
+                controller.succeeded()
+            return result
+
+
+async def with_retries_async(call, kind='model'):
+    """Asynchronous version of with_retries(); call returns an awaitable."""
+    controller = get_rate_controller(kind)
+    retries = get_model_retries()
+    attempt = 0
+    while True:
+        if controller:
+            await controller.acquire_async()
+        try:
+            result = await call()
+        except RETRYABLE_ERRORS as e:
+            if controller:
+                await asyncio.to_thread(controller.throttled)
+            if attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            _log_retry(e, attempt, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+        else:
+            if controller:
+                await asyncio.to_thread(controller.succeeded)
+            return result
+
+
+def iter_with_retries(call, kind='model'):
+    """
+    Iterate over a streamed model call, retrying it like with_retries() as
+    long as nothing has been received yet. A stream that fails halfway
+    raises, since its beginning has already been handed out.
+
+    Args:
+        call (callable): Starts the call and returns an iterable of chunks.
+        kind (str): Rate controller to use.
+
+    Yields:
+        The chunks of the stream.
+    """
+    controller = get_rate_controller(kind)
+    retries = get_model_retries()
+    attempt = 0
+    while True:
+        if controller:
+            controller.acquire()
+        received = False
+        try:
+            for chunk in call():
+                received = True
+                yield chunk
+        except RETRYABLE_ERRORS as e:
+            if controller:
+                controller.throttled()
+            if received or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt)
+            _log_retry(e, attempt, delay)
+            time.sleep(delay)
+            attempt += 1
+        else:
+            if controller:
+                controller.succeeded()
+            return
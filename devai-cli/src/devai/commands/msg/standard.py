@@ -15,7 +15,7 @@
 import click
 
 from devai.util.file_processor import get_text_files_contents
-from vertexai.language_models import CodeChatModel, ChatModel
+from devai.commands.models import get_chat_model, with_retries
 
 @click.command(name='with_msg')
 @click.option('-q', '--query', required=False, type=str, default="Provide a summary of this source code")
@@ -23,7 +23,7 @@ from vertexai.language_models import CodeChatModel, ChatModel
 def with_msg(query, path):
    
     # code_chat_model = CodeChatModel.from_pretrained("codechat-bison@001")
-    code_chat_model = CodeChatModel.from_pretrained("codechat-bison")
+    code_chat_model = get_chat_model("codechat-bison")
     # code_chat_model = CodeChatModel.from_pretrained("codechat-bison-32k")  
     # code_chat_model = ChatModel.from_pretrained("chat-bison@001")
    
@@ -40,7 +40,7 @@ Here are the files
     chat = code_chat_model.start_chat()
 
 
-    response = chat.send_message(initial_prompt)
+    response = with_retries(lambda: chat.send_message(initial_prompt))
     click.echo(response)
 
 
@@ -56,22 +56,22 @@ Here are the files
 # {contents}
 # =================
 # ''')
-        rr=chat.send_message(f'''
+        rr=with_retries(lambda: chat.send_message(f'''
 File: {full_path}
 -----------------
 {contents}
 =================
-''')
+'''))
         click.echo(response)
         
         
 
-    response = chat.send_message("===LOAD COMPLETE===")
+    response = with_retries(lambda: chat.send_message("===LOAD COMPLETE==="))
     click.echo(response)
 
-    response = chat.send_message(query)
+    response = with_retries(lambda: chat.send_message(query))
     click.echo(response)
 
     click.echo(query)
-    response = chat.send_message(query)
+    response = with_retries(lambda: chat.send_message(query))
     click.echo(response)
\ No newline at end of file
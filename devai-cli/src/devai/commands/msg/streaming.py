@@ -15,7 +15,7 @@
 import click
 
 from devai.util.file_processor import get_text_files_contents
-from vertexai.language_models import CodeChatModel, ChatModel
+from devai.commands.models import get_chat_model, iter_with_retries
 
 @click.command(name='with_msg_streaming')
 @click.option('-q', '--query', required=False, type=str, default="Provide a summary of this source code")
@@ -23,7 +23,7 @@ from vertexai.language_models import CodeChatModel, ChatModel
 def with_msg_streaming(query, path):
    
     # code_chat_model = CodeChatModel.from_pretrained("codechat-bison@001")
-    code_chat_model = CodeChatModel.from_pretrained("codechat-bison")
+    code_chat_model = get_chat_model("codechat-bison")
     # code_chat_model = CodeChatModel.from_pretrained("codechat-bison-32k")  
     # code_chat_model = ChatModel.from_pretrained("chat-bison@001")
    
@@ -40,7 +40,7 @@ Here are the files
     chat = code_chat_model.start_chat()
 
 
-    responses = chat.send_message_streaming(initial_prompt)
+    responses = iter_with_retries(lambda: chat.send_message_streaming(initial_prompt))
     rtrn=""
     for response in responses:
         rtrn+=response.text
@@ -79,7 +79,7 @@ File: {full_path}
     # click.echo(response)
 
     click.echo(query)
-    responses = chat.send_message_streaming(query)
+    responses = iter_with_retries(lambda: chat.send_message_streaming(query))
     rtrn=""
     for response in responses:
         rtrn+=response.text
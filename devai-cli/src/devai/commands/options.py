@@ -0,0 +1,48 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Click options shared by the commands that build a code context."""
+
+import click
+
+from .request import set_cache_mode
+
+
+files_from_option = click.option(
+    '--files-from', type=click.File('r'), default=None,
+    help="Read more context paths or globs, one per line, from a file ('-' for stdin).")
+
+
+def budget_options(f):
+    """Adds --budget and --dry-run to a command that packs a context."""
+    f = click.option(
+        '--dry-run', is_flag=True, default=False,
+        help="Print the context manifest with estimated tokens and cost, and exit without calling the model.")(f)
+    f = click.option(
+        '--budget', type=click.IntRange(min=1), default=None,
+        help="Token budget for the request; lower priority files are dropped to fit. Defaults to DEVAI_TOKEN_BUDGET or the model's input limit.")(f)
+    return f
+
+
+def cache_options(f):
+    """Adds --no-cache and --refresh to a command that calls the model."""
+    f = click.option(
+        '--refresh', is_flag=True, default=False, expose_value=False,
+        callback=lambda ctx, param, value: set_cache_mode(refresh=value),
+        help="Query the model even when a cached response exists, and cache the new one.")(f)
+    f = click.option(
+        '--no-cache', is_flag=True, default=False, expose_value=False,
+        callback=lambda ctx, param, value: set_cache_mode(enabled=not value),
+        help="Neither read nor write the response cache.")(f)
+    return f
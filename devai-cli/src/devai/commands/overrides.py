@@ -0,0 +1,157 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Prompt overrides stored in Google Secret Manager, shared by the review and document commands."""
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from google.api_core.exceptions import NotFound, PermissionDenied
+from google.api_core.gapic_v1.client_info import ClientInfo
+from google.cloud import secretmanager
+
+from devai.util.cache import get_prompt_cache
+
+from .constants import USER_AGENT
+
+# Secret Manager requests in flight at once during a prefetch.
+PREFETCH_CONCURRENCY = 8
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def offline():
+    """True when DEVAI_OFFLINE is set: overrides then come from the cache only."""
+    return os.getenv('DEVAI_OFFLINE', '0').lower() not in ('', '0', 'false', 'no', 'off')
+
+
+def get_client():
+    """Secret Manager client shared by every lookup of the process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = secretmanager.SecretManagerServiceClient(
+                client_info=ClientInfo(user_agent=USER_AGENT)
+            )
+        return _client
+
+
+def _cache_key(project_id, secret_id):
+    return f"{project_id}/{secret_id}"
+
+
+def _fetch(project_id, secret_id):
+    """
+    Read the latest version of a secret.
+
+    Returns:
+        tuple: (found, value); found is False when the lookup failed for a
+            reason that may not last, so the result must not be cached.
+    """
+    name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
+    try:
+        response = get_client().access_secret_version(name=name)
+        payload = response.payload.data.decode("utf-8")
+        logging.info(f"Successfully retrieved secret ID: {secret_id} in project {project_id}")
+        return True, payload
+
+    except PermissionDenied as e:
+        logging.warning(f"Insufficient permissions to access secret {secret_id} in project {project_id}: {e}")
+        return True, None
+
+    except NotFound:
+        logging.info(f"Secret ID not found: {secret_id} in project {project_id}")
+        return True, None
+
+    except Exception as e:  # Catching a broader range of potential errors
+        logging.error(f"An unexpected error occurred while retrieving secret '{secret_id}': {e}")
+        return False, None
+
+
+def _cached(cache, project_id, secret_id):
+    """Returns (hit, value) for a secret in the prompt cache."""
+    if cache is None:
+        return False, None
+    entry = cache.get(_cache_key(project_id, secret_id))
+    if entry is None:
+        return False, None
+    return True, json.loads(entry)['value']
+
+
+def prefetch_prompts(secret_ids):
+    """Resolves several prompt overrides at once.
+
+    The ones missing from the cache are requested concurrently over the
+    shared client and cached together, found or not, so later get_prompt
+    calls of this and the next runs are answered locally.
+
+    Args:
+        secret_ids: IDs of the secrets to resolve.
+
+    Returns:
+        dict: Maps each secret ID to its value, or to None when there is no
+            override.
+    """
+    project_id = os.getenv('PROJECT_ID')
+    if project_id is None:
+        logging.error("Required environment variable 'PROJECT_ID' is not set.")
+        return {secret_id: None for secret_id in secret_ids}
+
+    cache = get_prompt_cache()
+    values = {}
+    missing = []
+    for secret_id in dict.fromkeys(secret_ids):
+        hit, value = _cached(cache, project_id, secret_id)
+        if hit:
+            values[secret_id] = value
+        else:
+            missing.append(secret_id)
+
+    if missing and offline():
+        logging.info(f"Offline, not looking up prompt overrides: {', '.join(missing)}")
+        values.update((secret_id, None) for secret_id in missing)
+        missing = []
+
+    if missing:
+        workers = min(PREFETCH_CONCURRENCY, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(lambda secret_id: _fetch(project_id, secret_id), missing)
+            for secret_id, (found, value) in zip(missing, results):
+                values[secret_id] = value
+                if found and cache is not None:
+                    cache.put(_cache_key(project_id, secret_id), json.dumps({'value': value}))
+
+    if cache is not None:
+        cache.flush()
+    return {secret_id: values[secret_id] for secret_id in secret_ids}
+
+
+def get_prompt(secret_id: str) -> str:
+    """Retrieves a prompt override from Google Secret Manager.
+
+    Resolved overrides, missing ones included, are cached on disk for
+    DEVAI_PROMPT_CACHE_TTL seconds; with DEVAI_OFFLINE set only the cache
+    is consulted.
+
+    Args:
+        secret_id: The ID of the secret to retrieve.
+
+    Returns:
+        The secret value as a string, or None if the secret is not found or the user lacks permission.
+    """
+    return prefetch_prompts([secret_id])[secret_id]
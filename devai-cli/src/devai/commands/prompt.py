@@ -16,7 +16,7 @@ import click
 from devai.commands.msg import standard, streaming
 
 from devai.util.file_processor import get_text_files_contents
-from vertexai.language_models import CodeChatModel, ChatModel
+from devai.commands.models import get_chat_model, with_retries
 
 
 @click.command(name='with_context')
@@ -24,14 +24,12 @@ from vertexai.language_models import CodeChatModel, ChatModel
 @click.option('-c', '--context', required=False, type=str, default="")
 def with_context(qry, context):
     click.echo("Prompt with context")
-    code_chat_model = ChatModel.from_pretrained("chat-bison")
-
-    code_chat_model = CodeChatModel.from_pretrained("codechat-bison")
+    code_chat_model = get_chat_model("codechat-bison")
     #context=""
 
 
     chat = code_chat_model.start_chat(context=context)
-    response = chat.send_message(qry)
+    response = with_retries(lambda: chat.send_message(qry))
     
     click.echo(response.text)
 
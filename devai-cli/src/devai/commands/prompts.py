@@ -4,10 +4,8 @@ import click
 import json
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
-from vertexai.generative_models import GenerativeModel
-from google.cloud.aiplatform import telemetry
-from google.api_core.gapic_v1.client_info import ClientInfo
-from .constants import USER_AGENT, MODEL_NAME
+from .options import cache_options
+from .request import generate
 import pkg_resources
 
 # User configuration file path
@@ -322,6 +320,7 @@ def create_prompt(name: str, category: str, subcategory: str, description: str,
 @click.argument('path')
 @click.option('--input', '-i', help='Input text to send with the prompt')
 @click.option('--output-format', '-f', type=click.Choice(['markdown', 'json', 'text']), help='Override the output format')
+@cache_options
 def execute_prompt(path: str, input: Optional[str], output_format: Optional[str]):
     """Execute a prompt template with Gemini."""
     prompt_file, is_user_override = find_prompt_file(path)
@@ -350,19 +349,15 @@ def execute_prompt(path: str, input: Optional[str], output_format: Optional[str]
         if input:
             full_prompt += f"\n\nInput:\n{input}"
             
-        # Initialize Gemini with telemetry
-        client_info = ClientInfo(user_agent=USER_AGENT)
-        with telemetry.tool_context_manager(USER_AGENT):
-            model = GenerativeModel(MODEL_NAME)
-            
-            # Generate response
-            response = model.generate_content(
-                full_prompt,
-                generation_config={
-                    'temperature': config.get('temperature', 0.7),
-                    'max_output_tokens': config.get('max_tokens', 1024),
-                }
-            )
+        # Generate response, served from the response cache when possible
+        response = generate(
+            None,
+            full_prompt,
+            generation_config={
+                'temperature': config.get('temperature', 0.7),
+                'max_output_tokens': config.get('max_tokens', 1024),
+            }
+        )
         
         # Format and display the response
         if config.get('output_format') == 'json':
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+from langchain_google_vertexai import VertexAIEmbeddings
+
+from devai.commands.models import with_retries
+
+EMBEDDING_QPM = 100
+EMBEDDING_NUM_BATCH = 5
+EMBEDDING_PARALLELISM = 5
+
+# Texts per rate-limited call: the most the SDK puts in one request. It
+# finds the largest batch size the project's quota accepts on its own, and
+# may split a call into several requests.
+EMBEDDING_BATCH_TEXTS = 250
+
+
+class RateLimitedEmbeddings(Embeddings):
+    """
+    Sends every embedding call through the rate controller shared by the
+    devai processes, so the retries of a busy runner back off together.
+    Texts go out in batches as large as one request may be, leaving the
+    SDK's dynamic batch sizing in place.
+
+    The shared rate is charged once per call of up to batch_size texts, not
+    per request: when the SDK splits a call, its own requests_per_minute
+    paces the requests within it.
+    """
+
+    def __init__(self, embeddings, batch_size=EMBEDDING_BATCH_TEXTS, parallelism=EMBEDDING_PARALLELISM):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.parallelism = parallelism
+
+    def _embed_batch(self, batch):
+        return with_retries(lambda: self.embeddings.embed_documents(batch), kind='embedding')
+
+    def embed_documents(self, texts):
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+            return [vector for vectors in executor.map(self._embed_batch, batches) for vector in vectors]
+
+    def embed_query(self, text):
+        return with_retries(lambda: self.embeddings.embed_query(text), kind='embedding')
+
+
+def get_embeddings():
+    """Embedding model of the code index, rate limited with the other devai processes."""
+    embeddings = VertexAIEmbeddings(
+        requests_per_minute=EMBEDDING_QPM,
+        num_instances_per_batch=EMBEDDING_NUM_BATCH,
+        model_name="textembedding-gecko@latest",
+        # Retried by with_retries, which lets the rate controller see quota errors.
+        max_retries=1,
+    )
+    return RateLimitedEmbeddings(embeddings)
@@ -6,7 +6,7 @@ from git import Repo
 from langchain_community.document_loaders import GitLoader
 from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_vertexai import VertexAIEmbeddings
+from devai.commands.rag.embeddings import get_embeddings
 
 
 
@@ -57,13 +57,7 @@ def load(repo, branch, db_path):
     texts = text_splitter.split_documents(documents)
 
     # 3. Generate Embeddings (Replace with your preferred embedding model if not using Vertex AI)
-    EMBEDDING_QPM = 100
-    EMBEDDING_NUM_BATCH = 5
-    embeddings = VertexAIEmbeddings(
-        requests_per_minute=EMBEDDING_QPM,
-        num_instances_per_batch=EMBEDDING_NUM_BATCH,
-        model_name="textembedding-gecko@latest",
-    )
+    embeddings = get_embeddings()
 
 
     # 4. Store in ChromaDB
@@ -96,13 +90,7 @@ def testdb(db_path, qry):
     persist_directory = db_path
     if Path(persist_directory).exists():
         # Assuming same embeddings were used to create the DB
-        EMBEDDING_QPM = 100
-        EMBEDDING_NUM_BATCH = 5
-        embeddings = VertexAIEmbeddings(
-            requests_per_minute=EMBEDDING_QPM,
-            num_instances_per_batch=EMBEDDING_NUM_BATCH,
-            model_name="textembedding-gecko@latest",
-        )
+        embeddings = get_embeddings()
         db = Chroma(
             persist_directory=persist_directory,
             embedding_function=embeddings,
@@ -1,7 +1,9 @@
 import click
 from langchain.chains import RetrievalQA
 from langchain_community.vectorstores import Chroma
-from langchain_google_vertexai import VertexAIEmbeddings, ChatVertexAI
+from langchain_google_vertexai import ChatVertexAI
+
+from devai.commands.rag.embeddings import get_embeddings
 
 
 @click.command()
@@ -11,13 +13,7 @@ def query(qry, db_path):
 
     # Load the ChromaDB
     persist_directory = db_path
-    EMBEDDING_QPM = 100
-    EMBEDDING_NUM_BATCH = 5
-    embeddings = VertexAIEmbeddings(
-        requests_per_minute=EMBEDDING_QPM,
-        num_instances_per_batch=EMBEDDING_NUM_BATCH,
-        model_name="textembedding-gecko@latest",
-    )
+    embeddings = get_embeddings()
     db = Chroma(
         persist_directory=persist_directory,
         embedding_function=embeddings,
@@ -13,9 +13,13 @@
 # limitations under the License.
 
 import click
+import io
 import sys
-from devai.util.file_processor import format_files_as_string, list_files, list_changes, list_commit_messages, list_commits_for_branches, list_tags, list_commits_for_tags
-from vertexai.language_models import CodeChatModel
+from devai.util.file_processor import write_formatted_files, list_files, iter_changes, iter_commit_messages, list_commits_for_branches, list_tags, list_commits_for_tags
+
+from .options import cache_options
+from .models import get_chat_model, with_retries
+from .request import cached_call
 
 
 parameters = {
@@ -23,17 +27,6 @@ parameters = {
     "temperature": 0.2
 }
 
-source = '''
-GIT DIFFS:
-{}
-
-GIT COMMITS:
-{}
-
-FINAL CODE:
-{}
-
-'''
 report_qry = '''
 INSTRUCTIONS:
 You are senior software engineer doing a code review. You are given following information:
@@ -81,6 +74,7 @@ Only write explanation for new code changes and not for existing code in the FIN
 
 @click.command(name="report")
 @click.option('-t', '--tag', required=True, type=str)
+@cache_options
 def report(tag):
     click.echo('report')
     click.echo(f'tag={tag}')
@@ -92,6 +86,7 @@ def report(tag):
 
 @click.command(name="notes")
 @click.option('-t', '--tag', required=True, type=str)
+@cache_options
 def notes(tag):
     click.echo('notes')
     click.echo(f'tag={tag}')
@@ -140,21 +135,30 @@ def summary_for_tag(tag, qry):
 
     end_sha = list[0]
 
-    files = list_files(start_sha, end_sha, refer_commit_parent)
-
-    changes = list_changes(start_sha, end_sha, refer_commit_parent)
-
-    commit_messages = list_commit_messages(
-        start_sha, end_sha, refer_commit_parent)
-
-    prompt_context = source.format(
-        changes, commit_messages, format_files_as_string(files))
-
-    code_chat_model = CodeChatModel.from_pretrained("codechat-bison")
-    chat = code_chat_model.start_chat(context=prompt_context, **parameters)
-    response = chat.send_message(qry)
-
-    return response
+    # Read the final code as of the tag, not from the working tree.
+    files = [f"git:{end_sha}:{name}" for name in list_files(start_sha, end_sha, refer_commit_parent, exclude_deleted=True)]
+
+    # Stream the diff and the log straight into one buffer instead of
+    # formatting copies of them into a template.
+    prompt_context = io.StringIO()
+    sections = (
+        ("GIT DIFFS", iter_changes(start_sha, end_sha, refer_commit_parent)),
+        ("GIT COMMITS", iter_commit_messages(start_sha, end_sha, refer_commit_parent)),
+    )
+    for section, lines in sections:
+        prompt_context.write(f"\n{section}:\n")
+        prompt_context.writelines(lines)
+        prompt_context.write("\n")
+    prompt_context.write("\nFINAL CODE:\n")
+    write_formatted_files(files, prompt_context)
+    prompt_context.write("\n\n")
+
+    def call():
+        code_chat_model = get_chat_model("codechat-bison")
+        chat = code_chat_model.start_chat(context=prompt_context.getvalue(), **parameters)
+        return with_retries(lambda: chat.send_message(qry))
+
+    return cached_call("codechat-bison", parameters, qry, prompt_context.getvalue(), call)
 
 
 @click.group()
@@ -0,0 +1,318 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Request builder shared by the commands that send a code context to the model."""
+
+import asyncio
+import hashlib
+import json
+import logging
+
+import click
+from google.cloud.aiplatform import telemetry
+from rich.console import Console
+from rich.live import Live
+from rich.markdown import Markdown
+from vertexai.generative_models import Image
+
+from devai.util.cache import get_response_cache
+
+from .constants import USER_AGENT, MODEL_NAME
+from .models import get_model, iter_with_retries, with_retries, with_retries_async
+
+# Requests in flight at once when several are sent together.
+DEFAULT_CONCURRENCY = 4
+
+# Redraws per second of markdown streamed to a terminal.
+LIVE_REFRESH_PER_SECOND = 8
+
+# Set per invocation by the --no-cache and --refresh options.
+_cache_mode = {'enabled': True, 'refresh': False}
+
+
+def set_cache_mode(enabled=None, refresh=None):
+    """
+    Choose how the response cache is used by the current command.
+
+    Args:
+        enabled (bool): False skips the cache entirely.
+        refresh (bool): True queries the model and overwrites cached entries.
+    """
+    if enabled is not None:
+        _cache_mode['enabled'] = enabled
+    if refresh is not None:
+        _cache_mode['refresh'] = refresh
+
+
+def cache_mode():
+    """Returns (enabled, refresh) as chosen with --no-cache and --refresh."""
+    return _cache_mode['enabled'], _cache_mode['refresh']
+
+
+class CachedResponse:
+    """Stands in for a model response that was served from the cache."""
+
+    def __init__(self, text):
+        self.text = text
+
+
+def _hash_parts(parts):
+    h = hashlib.sha256()
+    if parts is None or isinstance(parts, str) or not isinstance(parts, (list, tuple)):
+        parts = [parts]
+    for part in parts:
+        if part is None:
+            data = b''
+        elif isinstance(part, str):
+            data = part.encode('utf-8')
+        elif isinstance(part, bytes):
+            data = part
+        elif isinstance(part, Image):
+            data = part.data
+        else:
+            data = json.dumps(part.to_dict(), sort_keys=True, default=str).encode('utf-8')
+        h.update(len(data).to_bytes(8, 'big'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def response_key(model_name, generation_config, prompt, context):
+    """
+    Cache key of a request.
+
+    Args:
+        model_name (str): Model called.
+        generation_config (dict): Generation settings, or None.
+        prompt (str or list): Instruction text or parts.
+        context (str or list): Context text or parts.
+
+    Returns:
+        str: Hex digest.
+    """
+    key = json.dumps({
+        'model': model_name,
+        'config': generation_config or {},
+        'prompt': _hash_parts(prompt),
+        'context': _hash_parts(context),
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _cache():
+    return get_response_cache() if _cache_mode['enabled'] else None
+
+
+def cached_call(model_name, generation_config, prompt, context, call):
+    """
+    Return the cached response of a request, or make it and cache the result.
+
+    Args:
+        model_name (str): Model called.
+        generation_config (dict): Generation settings, or None.
+        prompt (str or list): Instruction text or parts.
+        context (str or list): Context text or parts.
+        call (callable): Makes the request and returns the response.
+
+    Returns:
+        The model response, or a CachedResponse.
+    """
+    cache = _cache()
+    if cache is None:
+        return call()
+
+    key = response_key(model_name, generation_config, prompt, context)
+    if not _cache_mode['refresh']:
+        text = cache.get(key)
+        if text is not None:
+            click.echo("Using a cached response; pass --refresh to query the model again.", err=True)
+            return CachedResponse(text)
+
+    response = call()
+    _remember(cache, key, response)
+    cache.flush()
+    return response
+
+
+def _remember(cache, key, response):
+    try:
+        cache.put(key, response.text)
+    except ValueError as e:
+        # Blocked or empty responses have no text and are not cached.
+        logging.debug(f"Not caching response: {e}")
+
+
+def generate(instruction, contents, model_name=MODEL_NAME, generation_config=None):
+    """
+    Send an instruction and its context to the model in a single request.
+
+    The instruction is passed as the system instruction rather than as a
+    chat turn of its own, so there is one round trip and no throwaway reply.
+    Responses are cached on disk, see cached_call.
+
+    Args:
+        instruction (str or list): Prompt text, or a list of prompt parts.
+        contents (list): Context parts, such as the ones from prepare_context.
+        model_name (str): Model to call.
+        generation_config (dict): Optional generation settings.
+
+    Returns:
+        GenerationResponse: The model response.
+    """
+    def call():
+        model = get_model(model_name, system_instruction=instruction)
+        with telemetry.tool_context_manager(USER_AGENT):
+            return with_retries(lambda: model.generate_content(contents, generation_config=generation_config))
+
+    return cached_call(model_name, generation_config, instruction, contents, call)
+
+
+def generate_stream(instruction, contents, model_name=MODEL_NAME, generation_config=None):
+    """
+    Like generate(), but yield the response text as the model produces it.
+
+    A cached response is yielded whole; a new one is cached once it is complete.
+
+    Args:
+        instruction (str or list): Prompt text, or a list of prompt parts.
+        contents (list): Context parts, such as the ones from prepare_context.
+        model_name (str): Model to call.
+        generation_config (dict): Optional generation settings.
+
+    Yields:
+        str: Pieces of the response text.
+    """
+    cache = _cache()
+    key = None
+    if cache is not None:
+        key = response_key(model_name, generation_config, instruction, contents)
+        if not _cache_mode['refresh']:
+            text = cache.get(key)
+            if text is not None:
+                click.echo("Using a cached response; pass --refresh to query the model again.", err=True)
+                yield text
+                return
+
+    model = get_model(model_name, system_instruction=instruction)
+    pieces = []
+    with telemetry.tool_context_manager(USER_AGENT):
+        for chunk in iter_with_retries(
+                lambda: model.generate_content(contents, generation_config=generation_config, stream=True)):
+            try:
+                text = chunk.text
+            except ValueError as e:
+                # Chunks carrying only safety ratings or a finish reason have no text.
+                logging.debug(f"Skipping chunk without text: {e}")
+                continue
+            pieces.append(text)
+            yield text
+
+    if cache is not None and pieces:
+        cache.put(key, ''.join(pieces))
+        cache.flush()
+
+
+def echo_stream(chunks, markdown=True):
+    """
+    Print response text as it arrives.
+
+    On a terminal, markdown is rendered with rich and redrawn as it grows;
+    anything else, such as a pipe or a file, gets the raw text unchanged.
+
+    Args:
+        chunks (iterable): Pieces of text, such as the ones from generate_stream.
+        markdown (bool): Render the text as markdown on a terminal.
+
+    Returns:
+        str: The whole text.
+    """
+    console = Console()
+    pieces = []
+    if markdown and console.is_terminal:
+        with Live(Markdown(''), console=console, refresh_per_second=LIVE_REFRESH_PER_SECOND,
+                  vertical_overflow='visible') as live:
+            for chunk in chunks:
+                pieces.append(chunk)
+                live.update(Markdown(''.join(pieces)))
+    else:
+        for chunk in chunks:
+            pieces.append(chunk)
+            click.echo(chunk, nl=False)
+        click.echo()
+    return ''.join(pieces)
+
+
+def stream(instruction, contents, model_name=MODEL_NAME, generation_config=None, markdown=True):
+    """
+    Send a request with generate_stream() and print the response with echo_stream().
+
+    Returns:
+        str: The whole response text.
+    """
+    return echo_stream(generate_stream(instruction, contents, model_name, generation_config), markdown)
+
+
+async def generate_async(instruction, contents, model_name=MODEL_NAME):
+    """Asynchronous version of generate(), without the cache."""
+    model = get_model(model_name, system_instruction=instruction)
+    return await with_retries_async(lambda: model.generate_content_async(contents))
+
+
+def generate_many(requests, concurrency=DEFAULT_CONCURRENCY, model_name=MODEL_NAME):
+    """
+    Send several requests concurrently, at most `concurrency` at a time.
+    Cached responses are returned without a request.
+
+    Args:
+        requests (dict): Maps a name to an (instruction, contents) tuple.
+        concurrency (int): Maximum number of requests in flight.
+        model_name (str): Model to call.
+
+    Returns:
+        dict: Maps each name to its response, or to the exception raised
+            by its request, in the order of `requests`.
+    """
+    cache = _cache()
+    keys = {name: response_key(model_name, None, instruction, contents)
+            for name, (instruction, contents) in requests.items()}
+    results = {}
+    if cache is not None and not _cache_mode['refresh']:
+        for name, key in keys.items():
+            text = cache.get(key)
+            if text is not None:
+                results[name] = CachedResponse(text)
+        if results:
+            click.echo(f"Using {len(results)} cached responses; pass --refresh to query the model again.", err=True)
+    pending = {name: request for name, request in requests.items() if name not in results}
+
+    async def run():
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def send(instruction, contents):
+            async with semaphore:
+                return await generate_async(instruction, contents, model_name)
+
+        responses = await asyncio.gather(
+            *(send(instruction, contents) for instruction, contents in pending.values()),
+            return_exceptions=True)
+        return dict(zip(pending, responses))
+
+    if pending:
+        with telemetry.tool_context_manager(USER_AGENT):
+            results.update(asyncio.run(run()))
+        if cache is not None:
+            for name in pending:
+                if not isinstance(results[name], Exception):
+                    _remember(cache, keys[name], results[name])
+            cache.flush()
+    return {name: results[name] for name in requests}
@@ -14,23 +14,48 @@
 
 
 import click
-from devai.util.file_processor import format_files_as_string
+from devai.util.file_processor import format_files_as_parts
+from devai.util.imgdiff import prediff
+from devai.util.json_stream import iter_json_objects
+from devai.util.keyframes import (
+    DEFAULT_MAX_KEYFRAMES, DEFAULT_SCENE_THRESHOLD, KeyframeError, extract_keyframes,
+)
+from devai.util.media import (
+    GCS_PREFIX,
+    INLINE_VIDEO_MAX_BYTES,
+    MediaTooLarge,
+    check_video_size,
+    guess_video_mime_type,
+    upload_video,
+)
+from devai.util.mapreduce import (
+    DEFAULT_SHARD_TOKENS,
+    get_shard_cache,
+    parse_findings,
+    reduce_findings,
+    shard_key,
+)
+from devai.util.review_state import (
+    DEFAULT_STATE_FILE,
+    ReviewState,
+    assign_findings,
+    content_hash,
+    prompt_version,
+)
 from vertexai.generative_models import (
-    GenerativeModel,
     Image,
     Part
 )
 from google.cloud.aiplatform import telemetry
 import os
-from google.cloud import secretmanager
-from google.api_core.exceptions import NotFound, PermissionDenied
-from google.api_core.gapic_v1.client_info import ClientInfo
 import logging
+import sys
+import textwrap
 
 import json
-from json_repair import repair_json
 
 from rich.console import Console 
+from rich.live import Live
 from rich.table import Table
 
 # Uncomment after configuring JIRA and GitLab env variables - see README.md for details
@@ -39,108 +64,19 @@ from rich.table import Table
 # from devai.commands.gitlab import create_gitlab_issue_comment
 
 from .constants import USER_AGENT, MODEL_NAME
+from .options import files_from_option, budget_options, cache_options
+from .context import collect_files, plan_shards, prefilter_manifests, prepare_context, prepare_shards
+from .models import get_model, iter_with_retries
+from .images import (
+    IMGDIFF_QUERY, cached_verdict, collect_images, describe_image, diff_images, flush_verdicts, imgdiff_contents,
+    pair_directories, read_manifest, run_batch,
+)
+from .overrides import get_prompt, prefetch_prompts
+from .request import generate_many, generate_stream, stream, DEFAULT_CONCURRENCY, LIVE_REFRESH_PER_SECOND
 
 
-def ensure_env_variable(var_name):
-    """Ensure an environment variable is set."""
-    value = os.getenv(var_name)
-    if value is None:
-        raise EnvironmentError(f"Required environment variable '{var_name}' is not set.")
-    return value
-
-def get_prompt( secret_id: str) -> str:
-    """Retrieves a secret value from Google Secret Manager.
-
-    Args:
-        secret_id: The ID of the secret to retrieve.
-
-    Returns:
-        The secret value as a string, or None if the secret is not found or the user lacks permission.
-    """    
-    try:
-        project_id = ensure_env_variable('PROJECT_ID')
-        logging.info("PROJECT_ID:", project_id)
-
-        client = secretmanager.SecretManagerServiceClient(
-        client_info=ClientInfo(user_agent=USER_AGENT)
-        )
-        name = f"projects/{project_id}/secrets/{secret_id}/versions/latest"
-        try:
-            response = client.access_secret_version(name=name)
-            payload = response.payload.data.decode("utf-8")
-            logging.info(f"Successfully retrieved secret ID: {secret_id} in project {project_id}")
-            return payload
-        
-        except PermissionDenied as e:
-            logging.warning(f"Insufficient permissions to access secret {secret_id} in project {project_id}: {e}")
-            return None
-        
-        except NotFound:
-            logging.info(f"Secret ID not found: {secret_id} in project {project_id}")
-            return None
-        
-        except Exception as e:  # Catching a broader range of potential errors
-            logging.error(f"An unexpected error occurred while retrieving secret '{secret_id}': {e}")
-            return None
-    
-    except EnvironmentError as e:
-        logging.error(e)
-
-def load_image_from_path(image_path: str) -> Image:
-    """Loads an image from a local path.
-
-    Args:
-        image_path: The path to the image file.
-
-    Returns:
-        A Image object representing the loaded image.
-    """
-    return Image.load_from_file(image_path)
-
-def validate_and_correct_json(json_text):
-    """Validates and attempts to correct JSON text.
-
-    Args:
-        json_text (str): The JSON text to validate.
-
-    Returns:
-        str: The original or corrected JSON text if valid, None otherwise.
-    """
- 
-
-    try:
-        # Validate the JSON
-        json.loads(json_text)
-        return json_text  # JSON is already valid
-    except json.JSONDecodeError:
-        try:
-            # If invalid, attempt to repair
-            return repair_json(json_text) 
-        except ValueError:
-            click.echo(
-                "Error: Model output is not valid JSON and could not be repaired."
-            )
-            return None
-
-@click.command(name='code')
-@click.option('-c', '--context', required=False, type=str, default="")
-@click.option('-o', '--output', type=click.Choice(['markdown', 'json', 'table']), default='markdown', help="The desired output format, markdown is the defualt.")
-def code(context, output):
-    """
-    This function performs a code review using the Generative Model API.
-
-    Args:
-        context (str): The code to be reviewed.
-        output (str): The desired output format (markdown, json, or table).
-    """
-    source = '''
-            ### Context (code) ###
-            {}
-
-            '''
-    # Output Format Substitution
-    output_format = {
-        'markdown': '''Structure: Organize your findings by class and method names. This provides clear context for the issues and aids in refactoring.
+CODE_REVIEW_OUTPUT_FORMATS = {
+    'markdown': '''Structure: Organize your findings by class and method names. This provides clear context for the issues and aids in refactoring.
 
 Tone: Frame your findings as constructive suggestions or open-ended questions. This encourages collaboration and avoids a purely critical tone. Examples:
 
@@ -155,7 +91,7 @@ No Issues: If your review uncovers no significant areas for improvement, state "
 
 Prioritize your findings based on their severity or potential impact (e.g., critical, high, medium, low). If no major issues are found, state: "No major issues found. The code appears well-structured and adheres to good practices." Frame your feedback as constructive suggestions or open-ended questions to foster collaboration and avoid a purely critical tone. Example: "Could we explore an alternative algorithm here to potentially improve performance?"''',
 
-        'json': '''Provide your feedback in a structured JSON array that follows common standards, with each element containing the following fields:
+    'json': '''Provide your feedback in a structured JSON array that follows common standards, with each element containing the following fields:
 
 *   **class_name** (optional): The name of the class where the issue is found.
 *   **method_name** (optional): The name of the method where the issue is found.
@@ -164,7 +100,7 @@ Prioritize your findings based on their severity or potential impact (e.g., crit
 *   **severity**: (optional) Indicate the severity or potential impact of the issue (e.g., "critical", "high", "medium", "low").
 
 Provide an overview or overall impression entry for the code as the first entry.''',
-        'table': '''Provide your feedback in a structured JSON array that follows common standards, with each element containing the following fields:
+    'table': '''Provide your feedback in a structured JSON array that follows common standards, with each element containing the following fields:
 
 *   **class_name** (optional): The name of the class where the issue is found.
 *   **method_name** (optional): The name of the method where the issue is found.
@@ -173,9 +109,9 @@ Provide an overview or overall impression entry for the code as the first entry.
 *   **severity**: (optional) Indicate the severity or potential impact of the issue (e.g., "critical", "high", "medium", "low").
 
 Provide an overview or overall impression entry for the code as the first entry.'''
-    }[output] 
+}
 
-    qry = get_prompt('review_query') or f'''
+CODE_REVIEW_PROMPT = '''
             ### Instruction ###
             You are a senior software engineer and architect with over 20 years of experience, specializing in the language of the provided code snippet and adhering to clean code principles. You are meticulous, detail-oriented, and possess a deep understanding of software design and best practices.
 
@@ -291,91 +227,8 @@ Provide an overview or overall impression entry for the code as the first entry.
                     ]
 
             '''
-    # Load files as text into the source variable
-    source = source.format(format_files_as_string(context))
-
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
-
-
-    # Process Output
-    if output in ["json", "table"]:
-        cleaned_json = response.text
-        if cleaned_json.startswith("`json\n") and cleaned_json.endswith("\n`"):
-            cleaned_json = cleaned_json[8:-3]  # Remove backticks if present
-
-        valid_json = validate_and_correct_json(cleaned_json)
-        if valid_json:
-            if output == 'json':
-                try:
-                    parsed_data = json.loads(valid_json)
-                    formatted_json = json.dumps(parsed_data, indent=4)  # Format with indentation
-                    click.echo(formatted_json)
-                except json.JSONDecodeError:
-                    click.echo("Error: Error processing JSON data: {e}")
-            elif output == "table":
-                try:
-                    data = json.loads(valid_json)
-
-                    console = Console()
-                    table = Table(show_header=True, header_style="bold green")
-                    table.add_column("Class", style="dim")
-                    table.add_column("Method", style="dim")
-                    table.add_column("Category")
-                    table.add_column("Description", width=120)
-                    table.add_column("Severity")
-
-                    severity_emojis = {
-                        "low": "🟡",  # Yellow circle for low severity
-                        "medium": "⚠️",  # Warning sign for medium severity
-                        "high": "🛑",  # Stop sign for high severity
-                    }
-
-                    for item in data:
-                        class_name = item.get("class_name", "General") 
-                        method_name = item.get("method_name", "N/A")
-                        issue_type = item["issue_type"]
-                        description = item["description"]
-                        severity = item.get("severity", "Unknown")  # Default to 'Unknown' if severity is missing
-
-                        # Add emoji based on severity
-                        severity_with_emoji = f"{severity_emojis.get(severity.lower(), '')} {severity}"  
-                        table.add_row(class_name, method_name, issue_type, description, severity_with_emoji)
-
-
-                    console.print(table)
-                except json.JSONDecodeError as e:
-                    click.echo(f"Error processing JSON data: {e}")
-    else:
-        click.echo(response.text) 
-
-    #create_jira_issue("Code Review Results", response.text)
-    # create_gitlab_issue_comment(response.text)
-
-
-@click.command()
-@click.option('-c', '--context', required=False, type=str, default="")
-def performance(context):
-    """
-    This function performs a performance review using the Generative Model API.
-
-    Args:
-        context (str): The code to be reviewed.
-    """
-    #click.echo('performance')
-    
-    source='''
-            ### Context (code) ###
-            {}
-
-            '''
-    qry = get_prompt('review_query')
 
-    if qry is None:
-        qry='''
+PERFORMANCE_REVIEW_PROMPT = '''
             ### Instruction ###
             You are a seasoned application performance tuning expert with deep knowledge of the nuances of various programming languages. Your task is to meticulously review the provided code snippet (please specify the language), focusing on identifying performance pitfalls and optimization opportunities. Tailor your analysis to the specific programming language used.
             If the code snippet involves a framework or library, consider performance implications related to that technology.
@@ -429,40 +282,8 @@ def performance(context):
 
             AI: (Provides output following the structured format, including language-specific insights, constructive suggestions, and prioritized recommendations)
             '''
-    # Load files as text into source variable
-    source=source.format(format_files_as_string(context))
-
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
-
-    click.echo(f"{response.text}")
-
-    # create_jira_issue("Performance Review Results", response.text)
-    # create_gitlab_issue_comment(response.text)
-
-@click.command()
-@click.option('-c', '--context', required=False, type=str, default="")
-def security(context):
-    """
-    This function performs a security review using the Generative Model API.
-
-    Args:
-        context (str): The code to be reviewed.
-    """
-    #click.echo('simple security')
-
-    source='''
-            ### Context (code) ###: 
-            {}
-            '''
-    
-    qry = get_prompt('review_query')
 
-    if qry is None:
-        qry='''
+SECURITY_REVIEW_PROMPT = '''
             ### Instruction ###
             You are an experienced security programmer conducting a code review. Your task is to meticulously examine the provided code snippet (please specify the language) for potential security vulnerabilities. Tailor your review to the specific programming language and its security considerations. Consider the context of the code snippet (e.g., web application, backend service) to assess the relevance and impact of vulnerabilities. 
 
@@ -533,38 +354,8 @@ def security(context):
 
             AI: (Provides output following the structured format, including language-specific insights and security recommendations relevant to PHP)
             '''
-    # Load files as text into source variable
-    source=source.format(format_files_as_string(context))
-    
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
 
-    click.echo(f"{response.text}")
-
-    # create_jira_issue("Security Review Results", response.text)
-    # create_gitlab_issue_comment(response.text)
-
-@click.command()
-@click.option('-c', '--context', required=False, type=str, default="")
-def testcoverage(context):
-    """
-    This function performs a test coverage review using the Generative Model API.
-
-    Args:
-        context (str): The code to be reviewed.
-    """
-
-    source='''
-            ### Context (code) ###: 
-            {}
-            '''
-    qry = get_prompt('review_query')
-
-    if qry is None:
-        qry='''
+TESTCOVERAGE_REVIEW_PROMPT = '''
         ### Instruction ###
         You are an experienced software engineer specializing in test coverage analysis and best practices. Given a code snippet (in any programming language) and its associated test suite (if available), your task is to perform a thorough assessment and provide actionable recommendations.
 
@@ -622,33 +413,8 @@ def testcoverage(context):
         Flexible Output: Coverage metrics and test types are adjusted to be applicable to various languages (e.g., conditions instead of branches for languages that don't have explicit branching).
         Language-Specific Insights: Encourages the AI to offer best practices or insights specific to the language being analyzed.
         '''
-    # Load files as text into source variable
-    source=source.format(format_files_as_string(context))
-    
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
-
-    click.echo(f"{response.text}")
 
-    # create_jira_issue("Code Coverage Review Results", response.text)
-    # create_gitlab_issue_comment(response.text)
-
-@click.command()
-@click.option('-c', '--context', required=False, type=str, default="")
-def blockers(context):
-
-
-    source='''
-            ### Context (code) ###: 
-            {}
-            '''
-    qry = get_prompt('review_query')
-
-    if qry is None:
-        qry='''
+BLOCKERS_REVIEW_PROMPT = '''
         ### Instruction ###
         You are an experienced software engineer specializing in blocking. Analyze the code and check if there are components that are in the BLOCKERS list below.
         Provide explanation why you made the decision.
@@ -678,16 +444,505 @@ def blockers(context):
 
         ### Example Dialogue ###
         '''
-    # Load files as text into source variable
-    source=source.format(format_files_as_string(context))
+
+# Output format of the map step of 'review code --map-reduce'; findings of
+# every shard are merged and ranked locally.
+MAP_REDUCE_OUTPUT_FORMAT = '''Provide your feedback as a JSON array and nothing else, with each element containing the following fields:
+
+*   **file_name**: The path of the file where the issue is found, as given after "file:" in the context.
+*   **class_name** (optional): The name of the class where the issue is found.
+*   **method_name** (optional): The name of the method where the issue is found.
+*   **issue_type**: A brief description of the issue type (e.g., "Performance Bottleneck," "Security Vulnerability").
+*   **description**: A detailed explanation of the issue, including its potential impact and suggested solutions.
+*   **severity**: Indicate the severity or potential impact of the issue ("critical", "high", "medium" or "low").
+
+Return an empty array if you find no issues.'''
+
+# Review types run by 'review all', with their report titles and default prompts.
+REVIEW_TYPES = {
+    'code': ('Code Review', CODE_REVIEW_PROMPT.format(output_format=CODE_REVIEW_OUTPUT_FORMATS['markdown'])),
+    'performance': ('Performance Review', PERFORMANCE_REVIEW_PROMPT),
+    'security': ('Security Review', SECURITY_REVIEW_PROMPT),
+    'testcoverage': ('Test Coverage Review', TESTCOVERAGE_REVIEW_PROMPT),
+    'blockers': ('Blockers Review', BLOCKERS_REVIEW_PROMPT),
+}
+
+
+# Tells the model what the prefiltered compliance context holds.
+COMPLIANCE_PREFILTER_NOTE = (
+    "Of the workloads, only the containers that local checks flagged are included, each with the potential "
+    "violations found. Confirm or dismiss each one against the standards digest and note any other issue in the "
+    "same containers. Other documents and files were not checked locally; review them in full.")
+
+
+def load_image_from_path(image_path: str) -> Image:
+    """Loads an image from a local path.
+
+    Args:
+        image_path: The path to the image file.
+
+    Returns:
+        A Image object representing the loaded image.
+    """
+    return Image.load_from_file(image_path)
+
+def load_video_part(source: str, bucket: str = None) -> Part:
+    """Prepares a video for a request without holding large files in memory.
+
+    A gs:// URI is referenced as is. A local file is sent inline when it is
+    small; larger ones are uploaded to the bucket in chunks streamed from
+    disk and referenced by URI.
+
+    Args:
+        source: Local path or gs:// URI of the video.
+        bucket: Cloud Storage bucket for local videos too large to send inline.
+
+    Returns:
+        A Part referencing or holding the video.
+    """
+    mime_type = guess_video_mime_type(source)
+    if source.startswith(GCS_PREFIX):
+        return Part.from_uri(source, mime_type=mime_type)
+
+    size = check_video_size(source)
+    if size > INLINE_VIDEO_MAX_BYTES:
+        if not bucket:
+            raise click.UsageError(
+                f"{source} is too large to send inline; pass --bucket (or set DEVAI_VIDEO_BUCKET) "
+                "to upload it to Cloud Storage, or pass the gs:// URI of an uploaded copy")
+        click.echo(f"Uploading {source} ({size / 1024 / 1024:,.0f} MiB) to gs://{bucket.removeprefix(GCS_PREFIX)}", err=True)
+        return Part.from_uri(upload_video(source, bucket), mime_type=mime_type)
+
+    with open(source, "rb") as f:
+        return Part.from_data(data=f.read(), mime_type=mime_type)
+
+def keyframe_contents(frames):
+    """Turns keyframes into prompt parts, each image preceded by its timestamp.
+
+    Args:
+        frames: Keyframes from extract_keyframes.
+
+    Returns:
+        A list of prompt parts.
+    """
+    contents = ["The video is given as the frames where the picture changes, in order. "
+                "Each frame is preceded by its timestamp (minutes:seconds); quote timestamps when you refer to one."]
+    for frame in frames:
+        contents += [f"FRAME {frame.label()}:", Part.from_data(data=frame.data, mime_type="image/jpeg")]
+    return contents
+
+SEVERITY_EMOJIS = {
+    "low": "🟡",  # Yellow circle for low severity
+    "medium": "⚠️",  # Warning sign for medium severity
+    "high": "🛑",  # Stop sign for high severity
+    "critical": "🛑",
+}
+
+
+def findings_table(with_files=False):
+    """Creates the empty table review findings are printed in.
+
+    Args:
+        with_files (bool): Add a File column.
+    """
+    table = Table(show_header=True, header_style="bold green")
+    if with_files:
+        table.add_column("File", style="dim")
+    table.add_column("Class", style="dim")
+    table.add_column("Method", style="dim")
+    table.add_column("Category")
+    table.add_column("Description", width=120)
+    table.add_column("Severity")
+    return table
+
+
+def add_finding_row(table, item, with_files=False):
+    """Adds one finding to a table from findings_table."""
+    class_name = item.get("class_name", "General") 
+    method_name = item.get("method_name", "N/A")
+    issue_type = item["issue_type"]
+    description = item["description"]
+    severity = item.get("severity", "Unknown")  # Default to 'Unknown' if severity is missing
+
+    # Add emoji based on severity
+    severity_with_emoji = f"{SEVERITY_EMOJIS.get(str(severity).lower(), '')} {severity}"  
+    row = [class_name, method_name, issue_type, description, severity_with_emoji]
+    if with_files:
+        row.insert(0, item.get("file_name") or "")
+    table.add_row(*row)
+
+
+def print_findings_table(data):
+    """Prints review findings as a table.
+
+    Args:
+        data (list): Findings with issue_type, description and the optional
+            class_name, method_name, file_name and severity fields.
+    """
+    console = Console()
+    with_files = any(item.get("file_name") for item in data)
+    table = findings_table(with_files)
+    for item in data:
+        add_finding_row(table, item, with_files)
+
+    console.print(table)
+
+
+def stream_findings(chunks, output):
+    """Prints the findings of a streamed JSON response as each one completes.
+
+    The table grows in place on a terminal; JSON is written with the same
+    layout as json.dumps(findings, indent=4), one finding at a time.
+
+    Args:
+        chunks (iterable): Pieces of the response text.
+        output (str): json or table.
+
+    Returns:
+        list: The findings printed.
+    """
+    findings = []
+    live = None
+    try:
+        for item in iter_json_objects(chunks):
+            if "issue_type" not in item or "description" not in item:
+                # An entry cut off by the end of the response
+                logging.debug(f"Skipping incomplete finding: {item}")
+                continue
+            findings.append(item)
+            if output == 'json':
+                separator = ",\n" if len(findings) > 1 else "[\n"
+                click.echo(separator + textwrap.indent(json.dumps(item, indent=4), "    "), nl=False)
+                continue
+            if live is None:
+                table = findings_table()
+                live = Live(table, console=Console(), refresh_per_second=LIVE_REFRESH_PER_SECOND,
+                            vertical_overflow='visible')
+                live.start()
+            add_finding_row(table, item)
+            live.refresh()
+    finally:
+        if live is not None:
+            live.stop()
+
+    if output == 'json':
+        click.echo("\n]" if findings else "[]")
+    elif not findings:
+        click.echo("No findings found in the model response.")
+    return findings
+
+
+def format_findings_markdown(findings):
+    """Formats merged review findings as a markdown report, grouped by severity."""
+    if not findings:
+        return "No major issues found. The code appears well-structured and adheres to good practices."
+    lines = []
+    severity = None
+    for item in findings:
+        current = str(item.get("severity") or "Unknown").capitalize()
+        if current != severity:
+            severity = current
+            lines.append(f"\n### {severity}\n")
+        location = " / ".join(str(item[field]) for field in ("file_name", "class_name", "method_name") if item.get(field))
+        prefix = f"**{location}**: " if location else ""
+        lines.append(f"*   {prefix}{item.get('issue_type', 'Issue')}. {item.get('description', '')}")
+    return "\n".join(lines).lstrip()
+
+
+def map_shards(shards, qry, header, concurrency):
+    """
+    Reviews shards concurrently, reusing cached results for shards that
+    were reviewed before with the same instruction and contents.
+
+    Args:
+        shards (list): Shards from prepare_shards or plan_shards.
+        qry (str): Review instruction.
+        header (str): Text placed before the file parts of every shard.
+        concurrency (int): Maximum number of shard requests in flight.
+
+    Returns:
+        dict: Maps the index of every shard that was reviewed to the
+            response text; failed shards are reported and left out.
+    """
+    cache = get_shard_cache()
+    keys = [shard_key(MODEL_NAME, qry, shard) for shard in shards]
+    results = {}
+    for index, key in enumerate(keys):
+        text = cache.get(key) if cache is not None else None
+        if text is not None:
+            results[index] = text
+
+    pending = {index: (qry, [header, *(block for _, block, _ in shard)])
+               for index, shard in enumerate(shards) if index not in results}
+    responses = generate_many(pending, concurrency) if pending else {}
+    for index, response in responses.items():
+        try:
+            if isinstance(response, Exception):
+                raise response
+            results[index] = response.text
+        except Exception as e:
+            click.echo(f"Failed to review shard {index + 1}: {e}", err=True)
+            continue
+        if cache is not None:
+            cache.put(keys[index], results[index])
+    if cache is not None:
+        cache.flush()
+    click.echo(f"Reviewed {len(responses)} shards, {len(shards) - len(pending)} from cache", err=True)
+    return results
+
+
+def print_findings(findings, output):
+    """Prints merged review findings in the requested output format."""
+    if output == "json":
+        click.echo(json.dumps(findings, indent=4))
+    elif output == "table":
+        print_findings_table(findings)
+    else:
+        click.echo(format_findings_markdown(findings))
+
+
+def map_reduce_review(context, output, files_from, budget, dry_run, shard_tokens, concurrency):
+    """
+    Reviews a context too large for one prompt: the files are split into
+    shards, the shards are reviewed concurrently, and the findings are
+    deduplicated and ranked by severity into one report. Shard results are
+    cached, so a re-run only reviews the shards whose files changed.
+
+    Args:
+        context (str): The code to be reviewed.
+        output (str): The desired output format (markdown, json, or table).
+        files_from (file): Optional --files-from stream.
+        budget (int): Optional --budget value, caps the shard size.
+        dry_run (bool): Print the shard plan only.
+        shard_tokens (int): Token budget of one shard request.
+        concurrency (int): Maximum number of shard requests in flight.
+    """
+    header = "### Context (code) ###"
+    qry = get_prompt('review_query') or CODE_REVIEW_PROMPT.format(output_format=MAP_REDUCE_OUTPUT_FORMAT)
+    shard_tokens = min(shard_tokens, budget) if budget else shard_tokens
+    shards = prepare_shards(context, header, files_from, shard_tokens, dry_run, instructions=[qry])
+    if shards is None:
+        return
+
+    results = map_shards(shards, qry, header, concurrency)
+    partial = []
+    for index in sorted(results):
+        shard_paths = [file_path for file_path, _, _ in shards[index]]
+        for finding in parse_findings(results[index]):
+            if not finding.get("file_name") and len(shard_paths) == 1:
+                finding["file_name"] = shard_paths[0]
+            partial.append(finding)
+    print_findings(reduce_findings(partial), output)
+
+
+def incremental_review(context, output, files_from, budget, dry_run, shard_tokens, concurrency, state_file):
+    """
+    Reviews only the files that are new or changed since the last run.
+
+    Findings are kept per file in a state file, keyed by the file's content
+    hash, the prompt version and the model. Unchanged files carry their
+    findings forward, files that left the context lose theirs, and the
+    rest are reviewed in shards as with --map-reduce. Findings that name
+    no file of their shard are kept until any file of that shard changes.
+    Files of a shard whose request failed lose their old findings and are
+    listed, so they are neither reported as current nor skipped next time.
+
+    Args:
+        context (str): The code to be reviewed.
+        output (str): The desired output format (markdown, json, or table).
+        files_from (file): Optional --files-from stream.
+        budget (int): Optional --budget value, caps the shard size.
+        dry_run (bool): Print the plan only, leaving the state untouched.
+        shard_tokens (int): Token budget of one shard request.
+        concurrency (int): Maximum number of shard requests in flight.
+        state_file (str): Path of the state file.
+    """
+    header = "### Context (code) ###"
+    qry = get_prompt('review_query') or CODE_REVIEW_PROMPT.format(output_format=MAP_REDUCE_OUTPUT_FORMAT)
+    shard_tokens = min(shard_tokens, budget) if budget else shard_tokens
+
+    files = collect_files(context, files_from)
+    digests = {file_path: content_hash(block) for file_path, block, _ in files}
+    state = ReviewState.load(state_file, prompt_version(qry), MODEL_NAME)
+    changed = [entry for entry in files if not state.is_current(entry[0], digests[entry[0]])]
+    removed = state.prune(digests)
+    click.echo(f"Incremental review: {len(changed)} new or changed files, "
+               f"{len(files) - len(changed)} unchanged, {len(removed)} removed", err=True)
+
+    shards = plan_shards(changed, header, shard_tokens, dry_run, instructions=[qry])
+    if shards is None:
+        return
+
+    results = map_shards(shards, qry, header, concurrency) if shards else {}
+    for index, text in results.items():
+        shard_paths = [file_path for file_path, _, _ in shards[index]]
+        assigned, unmatched = assign_findings(parse_findings(text), shard_paths)
+        for file_path, findings in assigned.items():
+            state.update(file_path, digests[file_path], findings)
+        state.update_request({file_path: digests[file_path] for file_path in shard_paths}, unmatched)
+    unreviewed = [file_path for index, shard in enumerate(shards) if index not in results
+                  for file_path, _, _ in shard]
+    for file_path in unreviewed:
+        state.discard(file_path)
+    if unreviewed:
+        click.echo(f"Not reviewed, run again to retry: {', '.join(unreviewed)}", err=True)
+    state.save()
+
+    print_findings(reduce_findings(state.findings()), output)
+
+
+@click.command(name='code')
+@click.option('-c', '--context', required=False, type=str, default="")
+@click.option('-o', '--output', type=click.Choice(['markdown', 'json', 'table']), default='markdown', help="The desired output format, markdown is the defualt.")
+@click.option('--map-reduce', is_flag=True, default=False,
+              help="Review the context in shards concurrently and merge the findings; for code bases larger than one prompt.")
+@click.option('--shard-tokens', type=click.IntRange(min=1000), default=DEFAULT_SHARD_TOKENS,
+              help="Token budget of one shard request with --map-reduce.")
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONCURRENCY,
+              help="Maximum number of shard requests in flight with --map-reduce.")
+@click.option('--incremental', is_flag=True, default=False,
+              help="Only review files that are new or changed since the last incremental run and carry the other findings forward.")
+@click.option('--state-file', type=click.Path(dir_okay=False), default=DEFAULT_STATE_FILE, show_default=True,
+              help="Where --incremental keeps the findings of previous runs.")
+@files_from_option
+@budget_options
+@cache_options
+def code(context, output, map_reduce, shard_tokens, concurrency, incremental, state_file, files_from, budget, dry_run):
+    """
+    This function performs a code review using the Generative Model API.
+
+    Args:
+        context (str): The code to be reviewed.
+        output (str): The desired output format (markdown, json, or table).
+        map_reduce (bool): Review in shards and merge the findings.
+        shard_tokens (int): Token budget of one shard with --map-reduce.
+        concurrency (int): Shard requests in flight with --map-reduce.
+        incremental (bool): Only review new or changed files.
+        state_file (str): State kept between --incremental runs.
+    """
+    if incremental:
+        incremental_review(context, output, files_from, budget, dry_run, shard_tokens, concurrency, state_file)
+        return
+    if map_reduce:
+        map_reduce_review(context, output, files_from, budget, dry_run, shard_tokens, concurrency)
+        return
+
+    qry = get_prompt('review_query') or CODE_REVIEW_PROMPT.format(output_format=CODE_REVIEW_OUTPUT_FORMATS[output])
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
+
+    if output == 'markdown':
+        stream(qry, source)
+    else:
+        stream_findings(generate_stream(qry, source), output)
+
+    #create_jira_issue("Code Review Results", response.text)
+    # create_gitlab_issue_comment(response.text)
+
+
+@click.command()
+@click.option('-c', '--context', required=False, type=str, default="")
+@files_from_option
+@budget_options
+@cache_options
+def performance(context, files_from, budget, dry_run):
+    """
+    This function performs a performance review using the Generative Model API.
+
+    Args:
+        context (str): The code to be reviewed.
+    """
+    #click.echo('performance')
     
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        response = code_chat.send_message(source)
+    qry = get_prompt('review_query')
+
+    if qry is None:
+        qry = PERFORMANCE_REVIEW_PROMPT
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
+
+    stream(qry, source)
+
+    # create_jira_issue("Performance Review Results", response.text)
+    # create_gitlab_issue_comment(response.text)
+
+@click.command()
+@click.option('-c', '--context', required=False, type=str, default="")
+@files_from_option
+@budget_options
+@cache_options
+def security(context, files_from, budget, dry_run):
+    """
+    This function performs a security review using the Generative Model API.
 
-    click.echo(f"{response.text}")
+    Args:
+        context (str): The code to be reviewed.
+    """
+    #click.echo('simple security')
+
+    qry = get_prompt('review_query')
+
+    if qry is None:
+        qry = SECURITY_REVIEW_PROMPT
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
+    
+    stream(qry, source)
+
+    # create_jira_issue("Security Review Results", response.text)
+    # create_gitlab_issue_comment(response.text)
+
+@click.command()
+@click.option('-c', '--context', required=False, type=str, default="")
+@files_from_option
+@budget_options
+@cache_options
+def testcoverage(context, files_from, budget, dry_run):
+    """
+    This function performs a test coverage review using the Generative Model API.
+
+    Args:
+        context (str): The code to be reviewed.
+    """
+
+    qry = get_prompt('review_query')
+
+    if qry is None:
+        qry = TESTCOVERAGE_REVIEW_PROMPT
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
+    
+    stream(qry, source)
+
+    # create_jira_issue("Code Coverage Review Results", response.text)
+    # create_gitlab_issue_comment(response.text)
+
+@click.command()
+@click.option('-c', '--context', required=False, type=str, default="")
+@files_from_option
+@budget_options
+@cache_options
+def blockers(context, files_from, budget, dry_run):
+
+
+    qry = get_prompt('review_query')
+
+    if qry is None:
+        qry = BLOCKERS_REVIEW_PROMPT
+    # Load files as prompt parts, one per file
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[qry])
+    if source is None:
+        return
+    
+    stream(qry, source)
 
     # create_jira_issue("Blockers Review Results", response.text)
     # create_gitlab_issue_comment(response.text)
@@ -696,6 +951,7 @@ def blockers(context):
 @click.command(name='impact')
 @click.option('-c', '--current', required=True, type=str, default="")
 @click.option('-t', '--target', required=True, type=str, default="")
+@cache_options
 def impact(current, target):
     """
     This function performs an impact analysis using the Generative Model API.
@@ -705,17 +961,7 @@ def impact(current, target):
         target (str): Path to target version of code.
     """
 
-    
-    current_source='''
-    CURRENT VERSION: 
-    {}
-
-    '''
-    target_source='''
-    TARGET VERSION:
-    {}
 
-    '''
     qry = get_prompt('review_query')
 
     if qry is None:
@@ -749,72 +995,115 @@ def impact(current, target):
 
         '''
 
-    # Load files as text into source variable
-    current_source=current_source.format(format_files_as_string(current))
-    target_source=target_source.format(format_files_as_string(target))
+    # Load files as prompt parts, one per file
+    current_source = format_files_as_parts(current, header="CURRENT VERSION:")
+    target_source = format_files_as_parts(target, header="TARGET VERSION:")
     
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        response = code_chat.send_message(current_source)
-        response = code_chat.send_message(target_source)
-
-    click.echo(f"{response.text}")
+    stream(qry, [*current_source, *target_source])
 
     #create_jira_issue("Code Review Results", response.text)
     # create_gitlab_issue_comment(response.text)
 
 @click.command(name='imgdiff')
-@click.option('-c', '--current', required=True, type=str, default="")
-@click.option('-t', '--target', required=True, type=str, default="")
-def imgdiff(current, target):
+@click.option('-c', '--current', required=False, type=str, default="",
+              help="Image of the current state, or a directory of them to compare with --target.")
+@click.option('-t', '--target', required=False, type=str, default="",
+              help="Image of the target state, or a directory of them paired with --current by relative path.")
+@click.option('-m', '--manifest', type=click.Path(exists=True, dir_okay=False), default=None,
+              help="JSON lines file of pairs to compare, each with 'current', 'target' and an optional 'name'.")
+@click.option('--full', is_flag=True, default=False,
+              help="Send the whole images instead of crops of the regions that changed.")
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONCURRENCY,
+              help="Pairs compared at once in batch mode.")
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help="Where batch mode writes its JSON lines, stdout by default.")
+@cache_options
+def imgdiff(current, target, manifest, full, concurrency, output):
     """
     This function performs an image diff analysis using the Generative Model API.
 
+    The images are compared locally first: identical images, and images
+    differing only by noise or resolution, are reported without calling the
+    model, only the changed regions are sent, and the
+    verdict on a pair is cached by the content of both images. Given two
+    directories or a manifest, every pair is compared and one JSON line is
+    written per pair.
+
     Args:
         current (str): current state.
         target (str): target state.
+        manifest (str): pairs to compare in batch mode.
+        full (bool): send the whole images.
+        concurrency (int): pairs compared at once in batch mode.
+        output (file): JSON lines output of batch mode.
     """
-
-    before_state='''
-    IMAGE 1: 
-
-    '''
-    after_state='''
-    IMAGE 2:
-
-    '''
     qry = get_prompt('review_query')
 
     if qry is None:
-        qry='''
-        INSTRUCTIONS:
-        Meticulously examine the two provided images. Generate a comprehensive report detailing the specific 
-        elements absent from each image in comparison to the other.  Clearly articulate the reasoning and 
-        methodology employed to arrive at your conclusions.
-        '''
-    
-    contents = [qry, after_state, load_image_from_path(current),
-                before_state, load_image_from_path(target)]
-
-    code_chat_model = GenerativeModel(MODEL_NAME)
+        qry = IMGDIFF_QUERY
+
+    if manifest or (os.path.isdir(current) and os.path.isdir(target)):
+        pairs = read_manifest(manifest) if manifest else pair_directories(current, target)
+        failed = run_batch(pairs, lambda pair: diff_images(pair['current'], pair['target'], qry, full),
+                           concurrency, output)
+        flush_verdicts()
+        if failed:
+            click.echo(f"{failed} of {len(pairs)} pairs failed.", err=True)
+            sys.exit(1)
+        return
+    if not current or not target:
+        raise click.UsageError("Pass --current and --target, or --manifest.")
+
+    result = prediff(current, target, crop=not full)
+    if result.identical:
+        click.echo("No visual differences: the images are identical.")
+        return
+    if not result.pairs:
+        click.echo(f"No significant visual differences: {result.note}.")
+        return
+    logging.info(f"{len(result.regions)} changed region(s), {result.changed_ratio:.1%} of the pixels, "
+                 f"hash distance {result.distance}")
+
+    cache, key, verdict = cached_verdict(qry, result, full)
+    if verdict is not None:
+        click.echo("Using the cached verdict on these images; pass --refresh to ask again.", err=True)
+        print(verdict, end="")
+        return
+
+    contents = imgdiff_contents(qry, result)
+    code_chat_model = get_model(MODEL_NAME)
     with telemetry.tool_context_manager(USER_AGENT):
-        responses = code_chat_model.generate_content(contents, stream=True)
+        responses = iter_with_retries(lambda: code_chat_model.generate_content(contents, stream=True))
 
+    pieces = []
     for response in responses:
+        pieces.append(response.text)
         print(response.text, end="")
 
+    if cache is not None and pieces:
+        cache.put(key, ''.join(pieces))
+        cache.flush()
+
 @click.command(name='image')
-@click.option('-f', '--file', required=True, type=str, default="")
+@click.option('-f', '--file', required=False, type=str, default="", help="Image to ask about.")
+@click.option('-d', '--dir', 'directory', type=click.Path(exists=True, file_okay=False), default=None,
+              help="Ask about every image below a directory and write one JSON line per image.")
 @click.option('-p', '--prompt', required=True, type=str, default="")
-def image(file, prompt):
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONCURRENCY,
+              help="Images processed at once with --dir.")
+@click.option('-o', '--output', type=click.File('w'), default='-',
+              help="Where --dir writes its JSON lines, stdout by default.")
+@cache_options
+def image(file, directory, prompt, concurrency, output):
     """
     This function performs an image analysis using the Generative Model API.
 
     Args:
         file (str): path to image.
+        directory (str): directory of images to analyse in batch mode.
         prompt (str): question about image.
+        concurrency (int): images processed at once in batch mode.
+        output (file): JSON lines output of batch mode.
     """
 
     qry = get_prompt('review_query')
@@ -824,26 +1113,48 @@ def image(file, prompt):
         INSTRUCTIONS:
         {prompt}
         '''
+
+    if directory:
+        images = [{'name': name, 'file': os.path.join(directory, name)} for name in collect_images(directory)]
+        failed = run_batch(images, lambda item: describe_image(item['file'], qry), concurrency, output)
+        if failed:
+            click.echo(f"{failed} of {len(images)} images failed.", err=True)
+            sys.exit(1)
+        return
+    if not file:
+        raise click.UsageError("Pass --file or --dir.")
     
     contents = [qry, load_image_from_path(file)]
 
-    code_chat_model = GenerativeModel(MODEL_NAME)
+    code_chat_model = get_model(MODEL_NAME)
     with telemetry.tool_context_manager(USER_AGENT):
-        responses = code_chat_model.generate_content(contents, stream=True)
+        responses = iter_with_retries(lambda: code_chat_model.generate_content(contents, stream=True))
 
     for response in responses:
         print(response.text, end="")
 
 @click.command(name='video')
-@click.option('-f', '--file', required=True, type=str, default="")
+@click.option('-f', '--file', required=True, type=str, default="", help="Local video, or the gs:// URI of one in Cloud Storage.")
 @click.option('-p', '--prompt', required=True, type=str, default="")
-def video(file, prompt):
+@click.option('--bucket', default=lambda: os.getenv('DEVAI_VIDEO_BUCKET'),
+              help="Cloud Storage bucket to upload local videos too large to send inline; defaults to DEVAI_VIDEO_BUCKET.")
+@click.option('--keyframes', is_flag=True, default=False,
+              help="Send the frames at scene changes, with their timestamps, instead of the whole video. Needs ffmpeg.")
+@click.option('--scene-threshold', type=click.FloatRange(0, 1), default=DEFAULT_SCENE_THRESHOLD,
+              help="Share of the picture that must change for a frame to count as a new scene, with --keyframes.")
+@click.option('--max-frames', type=click.IntRange(min=1), default=DEFAULT_MAX_KEYFRAMES,
+              help="Most frames sent with --keyframes.")
+def video(file, prompt, bucket, keyframes, scene_threshold, max_frames):
     """
     This function performs a video analysis using the Generative Model API.
 
     Args:
-        file (str): path to video.
+        file (str): path or gs:// URI of the video.
         prompt (str): question about video.
+        bucket (str): bucket for uploading large local videos.
+        keyframes (bool): send keyframes instead of the video.
+        scene_threshold (float): scene change score of a keyframe.
+        max_frames (int): most keyframes sent.
     """
 
     qry = get_prompt('review_query')
@@ -854,19 +1165,25 @@ def video(file, prompt):
         {prompt}
         '''
 
-    with open(file, "rb") as f:
-        video_data = f.read()
-
-    video = Part.from_data(
-        data=video_data,
-        mime_type="video/mp4",
-    )
-
-    contents = [qry, video]
+    if keyframes:
+        if file.startswith(GCS_PREFIX):
+            raise click.UsageError("--keyframes needs a local video")
+        try:
+            frames = extract_keyframes(file, scene_threshold, max_frames)
+        except (KeyframeError, OSError) as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Sending {len(frames)} keyframes of {file}", err=True)
+        contents = [qry, *keyframe_contents(frames)]
+    else:
+        try:
+            video = load_video_part(file, bucket)
+        except (MediaTooLarge, OSError) as e:
+            raise click.ClickException(str(e))
+        contents = [qry, video]
 
-    code_chat_model = GenerativeModel(MODEL_NAME)
+    code_chat_model = get_model(MODEL_NAME)
     with telemetry.tool_context_manager(USER_AGENT):
-        responses = code_chat_model.generate_content(contents, stream=True)
+        responses = iter_with_retries(lambda: code_chat_model.generate_content(contents, stream=True))
 
     for response in responses:
         print(response.text, end="")
@@ -874,24 +1191,25 @@ def video(file, prompt):
 @click.command(name='compliance')
 @click.option('-c', '--context', required=False, type=str, default="")
 @click.option('-cfg', '--config', required=False, type=str, default=".gemini")
-def compliance(context, config):
+@click.option('--full', is_flag=True, default=False,
+              help="Send every file and the whole standards instead of the manifests the local checks flag.")
+@files_from_option
+@budget_options
+@cache_options
+def compliance(context, config, full, files_from, budget, dry_run):
     """
     This function performs a compliance review using the Generative Model API.
 
+    Kubernetes manifests are first checked locally against the reference
+    configurations found in the standards; only the containers that may
+    break them are sent, with a digest of the standards. Standards without
+    reference configurations, and --full, send everything.
+
     Args:
         context (str): The code to be reviewed.
-        output (str): The desired output format (markdown, json, or table).
+        config (str): The standards file or directory.
+        full (bool): Skip the local prefilter.
     """
-    source = '''
-            ### Context (code) ###
-            {}
-
-            '''
-    standards = '''
-            ### Best Practices ###
-            {}
-
-            '''
     qry = get_prompt('review_query') or f'''
             ### Instruction ###
             You are an expert kubernetes engineer and architect with over 20 years of experience, specializing in the language of the provided code snippet and adhering to clean code principles.
@@ -904,18 +1222,98 @@ def compliance(context, config):
             Evaluate the code with a focus on the following key areas:
             
             '''
-    # Load files as text into the source variable
-    source = source.format(format_files_as_string(context))
-    best_practices = standards.format(format_files_as_string(config))
+    if not full:
+        digest, source = prefilter_manifests(context, config, files_from, budget, dry_run, instructions=[qry])
+        if digest is not None:
+            if source == []:
+                click.echo("No potential violations of the standards found.")
+            elif source is not None:
+                stream([qry, COMPLIANCE_PREFILTER_NOTE, digest], source)
+            return
+        click.echo(f"No reference configurations found in {config}; sending every file.", err=True)
+
+    # Load files as prompt parts, one per file
+    best_practices = format_files_as_parts(config, header="### Best Practices ###")
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run,
+                             instructions=[qry, *best_practices])
+    if source is None:
+        return
+
+    stream([qry, *best_practices], source)
+
+def parse_review_types(ctx, param, value):
+    """Click callback turning --types a,b,c into a list of known review types."""
+    types = [t.strip() for t in value.split(',') if t.strip()]
+    unknown = [t for t in types if t not in REVIEW_TYPES]
+    if unknown or not types:
+        raise click.BadParameter(
+            f"unknown review type(s) {', '.join(unknown)}; choose from {', '.join(REVIEW_TYPES)}"
+            if unknown else "at least one review type is required")
+    return list(dict.fromkeys(types))
+
+
+def review_instructions(types):
+    """
+    Instructions of several review types. A review_<type>_query secret
+    overrides one review type, review_query all of them; every override is
+    resolved in one batch.
 
-    code_chat_model = GenerativeModel(MODEL_NAME)
-    with telemetry.tool_context_manager(USER_AGENT):
-        code_chat = code_chat_model.start_chat(response_validation=False)
-        code_chat.send_message(qry)
-        code_chat.send_message(best_practices)
-        response = code_chat.send_message(source)
+    Args:
+        types (list): Review types.
+
+    Returns:
+        dict: Maps each review type to its instruction.
+    """
+    overrides = prefetch_prompts(['review_query', *(f'review_{review_type}_query' for review_type in types)])
+    return {review_type: overrides[f'review_{review_type}_query'] or overrides['review_query']
+            or REVIEW_TYPES[review_type][1] for review_type in types}
+
+
+@click.command(name='all')
+@click.option('-c', '--context', required=False, type=str, default="")
+@click.option('--types', default=','.join(REVIEW_TYPES), callback=parse_review_types,
+              help=f"Comma separated review types to run, defaults to all of them: {', '.join(REVIEW_TYPES)}.")
+@click.option('--concurrency', type=click.IntRange(min=1), default=DEFAULT_CONCURRENCY,
+              help="Maximum number of review requests in flight at once.")
+@files_from_option
+@budget_options
+@cache_options
+def review_all(context, types, concurrency, files_from, budget, dry_run):
+    """
+    This function runs several reviews over one shared context, sending the
+    requests concurrently and merging the results into a single report.
+
+    Args:
+        context (str): The code to be reviewed.
+        types (list): Review types to run.
+        concurrency (int): Maximum number of requests in flight.
+    """
+    instructions = review_instructions(types)
+
+    # Every request carries one instruction, so reserve room for the longest.
+    longest = max(instructions.values(), key=len)
+    source = prepare_context(context, "### Context (code) ###", files_from, budget, dry_run, instructions=[longest])
+    if source is None:
+        return
+
+    responses = generate_many(
+        {review_type: (instruction, source) for review_type, instruction in instructions.items()},
+        concurrency)
+
+    failed = 0
+    for review_type, response in responses.items():
+        click.echo(f"## {REVIEW_TYPES[review_type][0]}\n")
+        try:
+            if isinstance(response, Exception):
+                raise response
+            click.echo(f"{response.text}\n")
+        except Exception as e:
+            failed += 1
+            click.echo(f"Failed to call LLM: {e}\n")
+
+    if failed == len(responses):
+        sys.exit(1)
 
-    click.echo(response.text) 
 
 @click.group()
 def review():
@@ -934,3 +1332,4 @@ review.add_command(imgdiff)
 review.add_command(image)
 review.add_command(video)
 review.add_command(compliance)
+review.add_command(review_all)
@@ -0,0 +1,130 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Default location of the batch checkpoint, relative to the working directory.
+DEFAULT_CHECKPOINT_FILE = os.path.join('.devai', 'batch.db')
+
+DONE = 'done'
+FAILED = 'failed'
+EXPORTED = 'exported'
+
+
+def read_batch_manifest(lines, default_types):
+    """
+    Parse a batch manifest: one repository per line, either a bare path or
+    a JSON object such as {"repo": "services/ledger", "types": ["security"]}.
+    Blank lines and lines starting with # are skipped.
+    :param lines: Iterable of lines
+    :param default_types: Review types of the entries that name none
+    :return: List of (repo, types) tuples
+    """
+    entries = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if not line.startswith('{'):
+            entries.append((line, list(default_types)))
+            continue
+        try:
+            entry = json.loads(line)
+            repo = entry['repo']
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f"line {number}: expected a path or a JSON object with a 'repo'")
+        types = entry.get('types') or default_types
+        entries.append((repo, [types] if isinstance(types, str) else list(types)))
+    return entries
+
+
+class BatchCheckpoint:
+    """
+    Progress of a batch run in a SQLite file, one row per repository, review
+    type, prompt version and revision of the repository's files. Every
+    finished item is committed at once, so a run that is interrupted resumes
+    with the items it had not finished, while a run over changed files or
+    with another run id starts those items afresh. Requests exported for
+    offline batch prediction are remembered by key so their predictions can
+    be matched when they are imported.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(items)')]
+        if columns and 'revision' not in columns:
+            # Checkpoints written before items were keyed by revision cannot
+            # tell which files their results were for.
+            self._conn.execute('DROP TABLE items')
+            self._conn.execute('DROP TABLE IF EXISTS exports')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'repo TEXT NOT NULL, type TEXT NOT NULL, prompt TEXT NOT NULL, revision TEXT NOT NULL, '
+            'status TEXT NOT NULL, result TEXT, updated REAL NOT NULL, '
+            'PRIMARY KEY (repo, type, prompt, revision))')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS exports ('
+            'key TEXT PRIMARY KEY, repo TEXT NOT NULL, type TEXT NOT NULL, prompt TEXT NOT NULL, '
+            'revision TEXT NOT NULL)')
+        self._conn.commit()
+
+    def status(self, repo, review_type, prompt, revision):
+        """Status of an item, or None when it has not been run."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT status FROM items WHERE repo = ? AND type = ? AND prompt = ? AND revision = ?',
+                (repo, review_type, prompt, revision)).fetchone()
+        return row[0] if row else None
+
+    def record(self, repo, review_type, prompt, revision, status, result=None):
+        """Store the outcome of an item and commit it."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO items (repo, type, prompt, revision, status, result, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (repo, review_type, prompt, revision, status, None if result is None else json.dumps(result),
+                 time.time()))
+            self._conn.commit()
+
+    def remember_export(self, key, repo, review_type, prompt, revision):
+        """Note that an item was exported as the request with this key."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO exports (key, repo, type, prompt, revision) VALUES (?, ?, ?, ?, ?)',
+                (key, repo, review_type, prompt, revision))
+            self._conn.execute(
+                'INSERT OR REPLACE INTO items (repo, type, prompt, revision, status, result, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (repo, review_type, prompt, revision, EXPORTED, None, time.time()))
+            self._conn.commit()
+
+    def exported(self, key):
+        """(repo, type, prompt, revision) of an exported request, or None."""
+        with self._lock:
+            row = self._conn.execute('SELECT repo, type, prompt, revision FROM exports WHERE key = ?',
+                                     (key,)).fetchone()
+        return tuple(row) if row else None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,335 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Default location of the on-disk caches; DEVAI_CACHE_DIR overrides.
+DEFAULT_CACHE_DIR = Path.home() / '.devai' / 'cache'
+
+# Size bound of the formatted file block cache; DEVAI_CONTEXT_CACHE_BYTES overrides.
+DEFAULT_CONTEXT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Size bound and lifetime of cached model responses; DEVAI_RESPONSE_CACHE_BYTES
+# and DEVAI_RESPONSE_CACHE_TTL (seconds) override.
+DEFAULT_RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_RESPONSE_CACHE_TTL = 24 * 3600
+
+# Size bound and lifetime of resolved prompt overrides, missing ones included;
+# DEVAI_PROMPT_CACHE_TTL (seconds) overrides the lifetime.
+DEFAULT_PROMPT_CACHE_BYTES = 4 * 1024 * 1024
+DEFAULT_PROMPT_CACHE_TTL = 3600
+
+# Bump when the formatted block layout changes so old entries are not reused.
+CONTEXT_FORMAT_VERSION = '1'
+
+
+def get_cache_dir():
+    """Directory holding the devai caches."""
+    return Path(os.getenv('DEVAI_CACHE_DIR') or DEFAULT_CACHE_DIR)
+
+
+def cache_enabled(name):
+    """
+    Check whether a cache is switched on. DEVAI_CACHE=0 disables every cache,
+    DEVAI_<NAME>_CACHE=0 a single one.
+    :param name: Cache name, e.g. 'context'
+    :return: Boolean
+    """
+    for var in ('DEVAI_CACHE', f'DEVAI_{name.upper()}_CACHE'):
+        if os.getenv(var, '1').lower() in ('0', 'false', 'no', 'off'):
+            return False
+    return True
+
+
+def env_int(var, default):
+    try:
+        return int(os.getenv(var, default))
+    except ValueError:
+        return default
+
+
+class DiskCache:
+    """
+    Size-bounded LRU key/value store kept in a single SQLite file.
+
+    Safe to share between threads; several CLI processes may use the same
+    file at once. New entries are committed as they are written, so a
+    process holds the write lock only for a moment. Recency updates are
+    written in batches by flush(), which also evicts the least recently used
+    entries once the stored values exceed max_bytes. Hit and miss counts are accumulated in
+    the file as well, see stats().
+    """
+
+    def __init__(self, path, max_bytes, ttl=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+        self._touched = set()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, nbytes INTEGER NOT NULL, '
+                'created REAL NOT NULL, last_used REAL NOT NULL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self.create_tables(self._conn)
+        return self._conn
+
+    def create_tables(self, conn):
+        """Hook for subclasses that keep extra tables next to the entries."""
+        pass
+
+    def get(self, key):
+        """
+        Look up a value and mark it as recently used.
+        :param key: Cache key
+        :return: Stored value, or None on a miss or an expired entry
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT value, created FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.ttl and time.time() - row[1] > self.ttl):
+                self.misses += 1
+                self._unsaved['misses'] += 1
+                return None
+            self.hits += 1
+            self._unsaved['hits'] += 1
+            self._touched.add(key)
+            return row[0]
+
+    def put(self, key, value):
+        """Store a value and commit it."""
+        with self._lock:
+            conn = self._connect()
+            self._insert(conn, key, value)
+            conn.commit()
+
+    def _insert(self, conn, key, value):
+        now = time.time()
+        conn.execute(
+            'INSERT OR REPLACE INTO entries (key, value, nbytes, created, last_used) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, value, len(value.encode('utf-8')), now, now))
+
+    def delete(self, key):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            conn.commit()
+
+    def flush(self):
+        """Write pending recency updates, commit and evict down to max_bytes."""
+        with self._lock:
+            if self._conn is None:
+                return
+            conn = self._conn
+            if self._touched:
+                now = time.time()
+                conn.executemany('UPDATE entries SET last_used = ? WHERE key = ?',
+                                 [(now, key) for key in self._touched])
+                self._touched.clear()
+            if self.ttl:
+                conn.execute('DELETE FROM entries WHERE created < ?', (time.time() - self.ttl,))
+            self._evict(conn)
+            for name, value in self._unsaved.items():
+                if value:
+                    conn.execute('INSERT INTO stats (name, value) VALUES (?, ?) '
+                                 'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                                 (name, value))
+                    self._unsaved[name] = 0
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(nbytes), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        doomed = []
+        for key, nbytes in conn.execute('SELECT key, nbytes FROM entries ORDER BY last_used'):
+            doomed.append((key,))
+            excess -= nbytes
+            if excess <= 0:
+                break
+        conn.executemany('DELETE FROM entries WHERE key = ?', doomed)
+        logging.debug(f"Evicted {len(doomed)} entries from {self.path}")
+
+    def stats(self):
+        """
+        Size and lifetime hit/miss counts of the cache file.
+        :return: Dictionary with entries, bytes, hits and misses
+        """
+        self.flush()
+        with self._lock:
+            conn = self._connect()
+            entries, nbytes = conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries').fetchone()
+            counts = dict(conn.execute('SELECT name, value FROM stats'))
+        return {'entries': entries, 'bytes': nbytes,
+                'hits': counts.get('hits', 0), 'misses': counts.get('misses', 0)}
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM entries')
+            conn.execute('DELETE FROM stats')
+            conn.commit()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ContextCache(DiskCache):
+    """
+    Cache of formatted per-file context blocks.
+
+    Blocks are stored by a hash of the file path and contents. A second table
+    maps each file to its last known (size, mtime, inode) and content hash, so
+    an unchanged file is served without being opened. When the stat data
+    changed but the contents did not (a fresh checkout, a touched file) the
+    content hash still finds the block and only the stat entry is refreshed.
+    """
+
+    def create_tables(self, conn):
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'abspath TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, '
+            'mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, digest TEXT NOT NULL, '
+            'PRIMARY KEY (abspath, path))')
+
+    @staticmethod
+    def digest(file_path, data):
+        """
+        Content address of a formatted block.
+        :param file_path: Path as it appears in the block
+        :param data: Raw file contents
+        :return: Hex digest
+        """
+        h = hashlib.sha256(f'{CONTEXT_FORMAT_VERSION}\0{file_path}\0'.encode('utf-8'))
+        h.update(data)
+        return h.hexdigest()
+
+    def lookup(self, file_path, st):
+        """
+        Find the block of a file whose stat data has not changed.
+        :param file_path: Path as it appears in the block
+        :param st: os.stat_result of the file
+        :return: Formatted block, or None
+        """
+        with self._lock:
+            row = self._connect().execute(
+                'SELECT size, mtime_ns, inode, digest FROM files WHERE abspath = ? AND path = ?',
+                (os.path.abspath(file_path), file_path)).fetchone()
+        if row is None or tuple(row[:3]) != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        return self.get(row[3])
+
+    def remember(self, file_path, st, digest, block=None):
+        """
+        Record the stat data and content hash of a file and commit them.
+        :param file_path: Path as it appears in the block
+        :param st: os.stat_result of the file
+        :param digest: Content hash from digest()
+        :param block: Formatted block to store under digest in the same
+                      transaction, if it is new
+        """
+        with self._lock:
+            conn = self._connect()
+            if block is not None:
+                self._insert(conn, digest, block)
+            conn.execute(
+                'INSERT OR REPLACE INTO files (abspath, path, size, mtime_ns, inode, digest) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (os.path.abspath(file_path), file_path, st.st_size, st.st_mtime_ns, st.st_ino, digest))
+            conn.commit()
+
+    def _evict(self, conn):
+        super()._evict(conn)
+        conn.execute('DELETE FROM files WHERE digest NOT IN (SELECT key FROM entries)')
+
+
+_context_cache = None
+
+
+def get_context_cache():
+    """
+    Process-wide formatted block cache, or None when it is disabled.
+    :return: ContextCache or None
+    """
+    global _context_cache
+    if not cache_enabled('context'):
+        return None
+    path = get_cache_dir() / 'context.db'
+    if _context_cache is None or _context_cache.path != path:
+        _context_cache = ContextCache(
+            path, env_int('DEVAI_CONTEXT_CACHE_BYTES', DEFAULT_CONTEXT_CACHE_BYTES))
+    return _context_cache
+
+
+_response_cache = None
+
+
+def get_response_cache():
+    """
+    Process-wide cache of model responses, or None when it is disabled.
+    :return: DiskCache or None
+    """
+    global _response_cache
+    if not cache_enabled('response'):
+        return None
+    path = get_cache_dir() / 'responses.db'
+    if _response_cache is None or _response_cache.path != path:
+        _response_cache = DiskCache(
+            path, env_int('DEVAI_RESPONSE_CACHE_BYTES', DEFAULT_RESPONSE_CACHE_BYTES),
+            ttl=env_int('DEVAI_RESPONSE_CACHE_TTL', DEFAULT_RESPONSE_CACHE_TTL))
+    return _response_cache
+
+
+_prompt_cache = None
+
+
+def get_prompt_cache():
+    """
+    Process-wide cache of prompt overrides, or None when it is disabled.
+    :return: DiskCache or None
+    """
+    global _prompt_cache
+    if not cache_enabled('prompt'):
+        return None
+    path = get_cache_dir() / 'prompts.db'
+    if _prompt_cache is None or _prompt_cache.path != path:
+        _prompt_cache = DiskCache(
+            path, DEFAULT_PROMPT_CACHE_BYTES, ttl=env_int('DEVAI_PROMPT_CACHE_TTL', DEFAULT_PROMPT_CACHE_TTL))
+    return _prompt_cache
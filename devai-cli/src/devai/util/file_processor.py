@@ -12,8 +12,239 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import glob
+import logging
+import mmap
 import os
+import sqlite3
 import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from devai.util.cache import get_context_cache
+from devai.util.git import get_repository
+from devai.util.ignore import DEFAULT_IGNORED_NAMES, IgnoreMatcher, generated_file_reason, sniff_generated
+
+# Only this many leading bytes are inspected to classify a file.
+SNIFF_BYTES = 8192
+
+# Files read concurrently when building a context; DEVAI_READ_WORKERS overrides.
+DEFAULT_READ_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Larger files are skipped; DEVAI_MAX_FILE_BYTES overrides, 0 disables the cap.
+DEFAULT_MAX_FILE_BYTES = 1024 * 1024
+
+# Files at least this large are memory-mapped instead of read into a buffer.
+MMAP_THRESHOLD = 256 * 1024
+
+# Context entries starting with this are read from git: git:REV[:path].
+GIT_PREFIX = 'git:'
+
+# Extensions that are always treated as text, skipping the signature check.
+TEXT_EXTENSIONS = frozenset([
+    '.c', '.cc', '.cfg', '.cpp', '.cs', '.css', '.go', '.gradle', '.h',
+    '.hpp', '.html', '.ini', '.java', '.js', '.json', '.jsx', '.kt', '.md',
+    '.php', '.properties', '.py', '.rb', '.rs', '.scala', '.sh', '.sql',
+    '.swift', '.toml', '.ts', '.tsx', '.txt', '.xml', '.yaml', '.yml',
+])
+
+# Extensions that are never sent to the model, so the file is not opened.
+BINARY_EXTENSIONS = frozenset([
+    '.7z', '.a', '.avi', '.bin', '.bmp', '.class', '.dll', '.dylib', '.ear',
+    '.eot', '.exe', '.gif', '.gz', '.ico', '.jar', '.jpeg', '.jpg', '.mov',
+    '.mp3', '.mp4', '.o', '.otf', '.pdf', '.png', '.pyc', '.pyo', '.so',
+    '.tar', '.tgz', '.ttf', '.war', '.wasm', '.webm', '.webp', '.woff',
+    '.woff2', '.xz', '.zip',
+])
+
+# Reasons that are reported to the model with the binary file placeholder.
+BINARY_REASONS = frozenset([
+    'binary file extension', 'contains NUL bytes', 'binary file signature',
+    'not valid UTF-8',
+])
+
+# Leading bytes of common binary formats.
+MAGIC_NUMBERS = (
+    b'\x89PNG', b'GIF87a', b'GIF89a', b'\xff\xd8\xff', b'%PDF', b'PK\x03\x04',
+    b'\x7fELF', b'\xca\xfe\xba\xbe', b'\x1f\x8b', b'BZh', b'\xfd7zXZ',
+    b'7z\xbc\xaf', b'\x00asm', b'RIFF', b'OggS', b'ID3',
+)
+
+
+def sniff_binary(prefix, extension=''):
+    """
+    Classify a file from its extension and leading bytes.
+    :param prefix: Up to SNIFF_BYTES bytes from the start of the file
+    :param extension: Lower-cased file extension, including the dot
+    :return: Reason the file looks binary, or None if it looks like text
+    """
+    if b'\x00' in prefix:
+        return 'contains NUL bytes'
+    if extension not in TEXT_EXTENSIONS and prefix.startswith(MAGIC_NUMBERS):
+        return 'binary file signature'
+    return None
+
+
+def decode_text(data):
+    """
+    Decode file bytes the way text mode reading would.
+    :param data: Raw file contents, bytes or a mapped buffer
+    :return: Decoded text with universal newlines, or None if not UTF-8
+    """
+    try:
+        content = str(data, 'utf-8')
+    except UnicodeDecodeError:
+        return None
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+
+def get_max_file_bytes(max_bytes=None):
+    """
+    Resolve the per-file byte cap.
+    :param max_bytes: Explicit cap, or None to use the environment
+    :return: Cap in bytes, 0 when files of any size are allowed
+    """
+    if max_bytes is None:
+        try:
+            max_bytes = int(os.getenv('DEVAI_MAX_FILE_BYTES', DEFAULT_MAX_FILE_BYTES))
+        except ValueError:
+            max_bytes = DEFAULT_MAX_FILE_BYTES
+    return max(0, max_bytes)
+
+
+def parse_git_spec(spec):
+    """
+    Split a git:REV[:path] context entry.
+    :param spec: Context entry
+    :return: Tuple of (rev, path), or None if spec is not a git entry
+    """
+    if not spec.startswith(GIT_PREFIX):
+        return None
+    rev, _, path = spec[len(GIT_PREFIX):].partition(':')
+    return rev, path.strip('/')
+
+
+def read_git_bytes(spec, max_bytes=None):
+    """
+    Read a file at a git revision, with the same checks as read_file_bytes.
+    :param spec: git:REV:path entry naming a single file
+    :param max_bytes: Per-file byte cap, see get_max_file_bytes
+    :return: Tuple of (data, reason)
+    """
+    rev, path = parse_git_spec(spec)
+    extension = os.path.splitext(path)[1].lower()
+    if extension in BINARY_EXTENSIONS:
+        return None, 'binary file extension'
+    max_bytes = get_max_file_bytes(max_bytes)
+
+    repository = get_repository()
+    try:
+        size = repository.blob_size(rev, path)
+        if size is None:
+            return None, f'not a file at {rev}'
+        if max_bytes and size > max_bytes:
+            return None, f'exceeds size cap ({size} > {max_bytes} bytes)'
+        data = repository.read_blob(rev, path)
+    except (OSError, subprocess.SubprocessError) as e:
+        return None, f'unreadable: {e}'
+    if data is None:
+        return None, f'not a file at {rev}'
+    prefix = data[:SNIFF_BYTES]
+    reason = sniff_binary(prefix, extension) or sniff_generated(prefix)
+    if reason:
+        return None, reason
+    return data, None
+
+
+def get_file_size(file_path):
+    """
+    Size of a context file without reading it.
+    :param file_path: Path to the file or git:REV:path entry
+    :return: Size in bytes, or None when the file cannot be found
+    """
+    spec = parse_git_spec(file_path)
+    try:
+        if spec:
+            return get_repository().blob_size(*spec)
+        return os.stat(file_path).st_size
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def read_file_bytes(file_path, max_bytes=None):
+    """
+    Read the raw bytes of a file that passes the binary and generated checks.
+
+    Files of MMAP_THRESHOLD bytes or more are memory-mapped rather than
+    copied into a bytes object, so only the pages that are sniffed, hashed
+    or decoded are ever touched. Pass the data to release_buffer() once done.
+    :param file_path: Path to the file, or a git:REV:path entry
+    :param max_bytes: Per-file byte cap, see get_max_file_bytes
+    :return: Tuple of (data, reason); data is None and reason says why when
+             the file was rejected
+    """
+    if file_path.startswith(GIT_PREFIX):
+        return read_git_bytes(file_path, max_bytes)
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in BINARY_EXTENSIONS:
+        return None, 'binary file extension'
+    max_bytes = get_max_file_bytes(max_bytes)
+
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if max_bytes and size > max_bytes:
+                return None, f'exceeds size cap ({size} > {max_bytes} bytes)'
+            if size < MMAP_THRESHOLD:
+                prefix = f.read(SNIFF_BYTES)
+                reason = sniff_binary(prefix, extension) or sniff_generated(prefix)
+                if reason:
+                    return None, reason
+                return prefix + f.read(), None
+
+            # The mapping stays valid after the file is closed.
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            prefix = data[:SNIFF_BYTES]
+            reason = sniff_binary(prefix, extension) or sniff_generated(prefix)
+            if reason:
+                data.close()
+                return None, reason
+            return data, None
+    except OSError as e:
+        return None, f'unreadable: {e.strerror or e}'
+    except ValueError as e:
+        # mmap refuses a file that was truncated after the size check.
+        return None, f'unreadable: {e}'
+
+
+def release_buffer(data):
+    """Unmap data returned by read_file_bytes; plain bytes are left alone."""
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+
+def read_text_file(file_path, max_bytes=None):
+    """
+    Read a file once, classifying it as text or binary on the way.
+    :param file_path: Path to the file
+    :param max_bytes: Per-file byte cap, see get_max_file_bytes
+    :return: Tuple of (contents, reason); contents is None and reason says
+             why when the file was rejected
+    """
+    data, reason = read_file_bytes(file_path, max_bytes)
+    if reason is not None:
+        return None, reason
+
+    try:
+        content = decode_text(data)
+    finally:
+        release_buffer(data)
+    if content is None:
+        return None, 'not valid UTF-8'
+    return content, None
+
 
 def is_ascii_text(file_path):
     """
@@ -21,119 +252,369 @@ def is_ascii_text(file_path):
     :param file_path: Path to the file
     :return: Boolean indicating whether the file contains ASCII text
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            f.read()
-        return True
-    except UnicodeDecodeError:
-        return False
+    return read_text_file(file_path)[1] is None
+
+
+def get_read_workers(workers=None):
+    """
+    Resolve how many files may be read at the same time.
+    :param workers: Explicit worker count, or None to use the environment
+    :return: Worker count, at least 1
+    """
+    if workers is None:
+        try:
+            workers = int(os.getenv('DEVAI_READ_WORKERS', DEFAULT_READ_WORKERS))
+        except ValueError:
+            workers = DEFAULT_READ_WORKERS
+    return max(1, workers)
+
+
+def ordered_map(func, items, workers=None):
+    """
+    Apply func to items on a thread pool, yielding results in input order.
+    At most twice the worker count is in flight, so memory stays bounded
+    even when the consumer is slower than the readers.
+    :param func: Callable applied to every item
+    :param items: Iterable of items
+    :param workers: Worker count, see get_read_workers
+    :return: Generator of results in the same order as items
+    """
+    workers = get_read_workers(workers)
+    if workers == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        window = deque()
+        for item in items:
+            window.append(pool.submit(func, item))
+            if len(window) >= workers * 2:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
 
-def get_text_files_contents(path, ignore=None):
+def read_paths_from(stream):
+    """
+    Read context paths, one per line, from a file object such as stdin.
+    :param stream: Iterable of lines
+    :return: List of paths, blank lines dropped
+    """
+    return [line.strip() for line in stream if line.strip()]
+
+
+def resolve_context(context, files_from=None):
+    """
+    Combine the --context value with the paths given through --files-from.
+    :param context: Directory, file or glob passed on the command line
+    :param files_from: Optional file object listing more paths
+    :return: The context unchanged, or a list of paths when files_from is set
+    """
+    if files_from is None:
+        return context
+    paths = read_paths_from(files_from)
+    if context:
+        paths.insert(0, context)
+    return paths
+
+
+def walk_directory(path, ignore=None, rejected=None):
+    """
+    Yields the files under a directory that are worth sending to the model.
+    Honors .gitignore and .devaiignore files (including those of parent
+    directories up to the repository root), skips the default ignored names,
+    and drops lockfiles, minified bundles and protobuf output by name.
+    :param path: Directory path
+    :param ignore: Extra file or folder names to be ignored
+    :param rejected: Optional dictionary collecting generated files and reasons
+    :return: Generator of file paths
+    """
+    ignore = set(ignore or [])
+    matcher = IgnoreMatcher.for_directory(path)
+    start = matcher.relative(path)
+
+    for root, dirs, files in os.walk(path):
+        rel_root = matcher.relative(root) if root != path else start
+        if root != path:
+            matcher.load(root, rel_root)
+        prefix = f"{rel_root}/" if rel_root else ""
+
+        # Remove ignored directories from dirs so os.walk will skip them
+        dirs[:] = [d for d in dirs
+                   if d not in ignore and not matcher.is_ignored(prefix + d, True)]
+
+        for file in files:
+            if file in ignore or matcher.is_ignored(prefix + file, False):
+                continue
+            file_path = os.path.join(root, file)
+            reason = generated_file_reason(file)
+            if reason:
+                logging.debug(f"Skipping {file_path}: {reason}")
+                if rejected is not None:
+                    rejected[file_path] = reason
+                continue
+            yield file_path
+
+
+def walk_git_tree(spec, rejected=None):
+    """
+    Yields the files under a git:REV[:path] entry as git:REV:path entries,
+    read from the revision rather than the working tree.
+    :param spec: git:REV or git:REV:path, path relative to the repository root
+    :param rejected: Optional dictionary collecting generated files and reasons
+    :return: Generator of git:REV:path entries
+    """
+    rev, path = parse_git_spec(spec)
+    for name in get_repository().list_tree(rev, path):
+        file_path = f"{GIT_PREFIX}{rev}:{name}"
+        parts = name.split('/')
+        if any(part in DEFAULT_IGNORED_NAMES for part in parts):
+            continue
+        reason = generated_file_reason(parts[-1])
+        if reason:
+            logging.debug(f"Skipping {file_path}: {reason}")
+            if rejected is not None:
+                rejected[file_path] = reason
+            continue
+        yield file_path
+
+
+def get_text_files_contents(path, ignore=None, rejected=None, workers=None):
     """
     Returns a dictionary with file paths (including file name) as keys 
     and the respective file contents as values.
     :param path: Directory path
-    :param ignore: List of file or folder names to be ignored
+    :param ignore: List of file or folder names to be ignored, on top of
+                   .gitignore, .devaiignore and the default ignored names
+    :param rejected: Optional dictionary that receives the path and reason
+                     for every file that was skipped as non-text
+    :param workers: Number of files read concurrently
     :return: Dictionary with file paths as keys and file contents as values
     """
-    if ignore is None:
-        ignore = set(['venv', '__pycache__', '.gitignore'])
+    def read(full_path):
+        return full_path, read_text_file(full_path)
 
     result = {}
-    for dirpath, dirnames, filenames in os.walk(path):
-        # Remove ignored directories from dirnames so os.walk will skip them
-        dirnames[:] = [dirname for dirname in dirnames if dirname not in ignore]
-
-        for filename in filenames:
-            if filename not in ignore:
-                full_path = os.path.join(dirpath, filename)
-                if is_ascii_text(full_path):
-                    with open(full_path, 'r', encoding='ascii') as f:
-                        result[full_path] = f.read()
+    files = walk_directory(path, ignore, rejected)
+    for full_path, (content, reason) in ordered_map(read, files, workers):
+        if reason is None:
+            result[full_path] = content
+        else:
+            logging.debug(f"Skipping {full_path}: {reason}")
+            if rejected is not None:
+                rejected[full_path] = reason
     return result
 
 
-def format_files_as_string(input):
-    def process_file(file_path):
-        if not is_ascii_text(file_path):
-            return f"file: {file_path}\nsource: [Binary File - Not ASCII Text]\n"
-            # pass
-
-        with open(file_path, 'r') as file:
-            content = file.read()
-            return f"\nfile: {file_path}\ncontent:\n{content}\n"
-            # return f"{content}\n\n"
-
-    formatted_string = ""
-
-    exclude_directories = set(['venv', '__pycache__', '.gitignore']) 
+def iter_file_paths(input, rejected=None):
+    """
+    Yields the paths of the files that make up a context, in walk order.
+    Directories are walked with walk_directory and git:REV[:path] entries
+    with walk_git_tree; files named explicitly are always included.
+    :param input: Directory path, single file path, glob or git entry, or a
+                  list of them
+    :param rejected: Optional dictionary collecting generated files and reasons
+    :return: Generator of file paths
+    """
+    def walk(path):
+        if path.startswith(GIT_PREFIX):
+            yield from walk_git_tree(path, rejected)
+        elif os.path.isdir(path):
+            yield from walk_directory(path, rejected=rejected)
+        elif os.path.exists(path):
+            yield path
+        elif glob.has_magic(path):
+            for match in sorted(glob.glob(path, recursive=True)):
+                yield from walk(match)
 
     if isinstance(input, str):
-        if os.path.isdir(input):
-            
-            for root, dirs, files in os.walk(input):
-                dirs[:] = [d for d in dirs if d not in exclude_directories]
-                files[:] = [f for f in files if f not in exclude_directories]
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if os.path.exists(file_path):
-                        formatted_string += process_file(file_path)
-        else:
-            if os.path.exists(input):
-                formatted_string += process_file(input)
+        paths = [input]
     elif isinstance(input, list):
-        for file_path in input:
-            if os.path.exists(file_path):
-                formatted_string += process_file(file_path)
+        paths = input
     else:
         raise ValueError("Input must be a directory path, a single file path, or a list of file paths")
 
-    return formatted_string
+    # Overlapping globs and directories must not repeat a file in the prompt
+    seen = set()
+    for path in paths:
+        for file_path in walk(path):
+            if file_path not in seen:
+                seen.add(file_path)
+                yield file_path
+
+
+def _placeholder(file_path, reason, rejected):
+    logging.debug(f"Skipping {file_path}: {reason}")
+    if rejected is not None:
+        rejected[file_path] = reason
+    if reason in BINARY_REASONS:
+        return f"file: {file_path}\nsource: [Binary File - Not ASCII Text]\n"
+    return f"file: {file_path}\nsource: [Skipped - {reason}]\n"
+
+
+def format_file(file_path, rejected=None, cache=None):
+    """
+    Formats a single file as a context block.
+    :param file_path: Path to the file
+    :param rejected: Optional dictionary that receives the reason when the
+                     file is skipped as non-text
+    :param cache: Optional ContextCache; unchanged files are served from it
+                  without being opened. When the cache file stays locked by
+                  another process the file is read without it.
+    :return: The formatted block for the file
+    """
+    if cache is not None:
+        try:
+            return _format_file(file_path, rejected, cache)
+        except sqlite3.OperationalError as e:
+            logging.debug(f"Context cache unavailable for {file_path}: {e}")
+    return _format_file(file_path, rejected, None)
+
 
-def list_files(start_sha, end_sha, refer_commit_parent=False):
+def _format_file(file_path, rejected, cache):
+    if file_path.startswith(GIT_PREFIX):
+        # Blobs are immutable and cheap to read over the cat-file pipe.
+        cache = None
+    if cache is not None:
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            return _placeholder(file_path, f'unreadable: {e.strerror or e}', rejected)
+        max_bytes = get_max_file_bytes()
+        if not max_bytes or st.st_size <= max_bytes:
+            block = cache.lookup(file_path, st)
+            if block is not None:
+                return block
+
+    data, reason = read_file_bytes(file_path)
+    if reason is not None:
+        return _placeholder(file_path, reason, rejected)
+
+    try:
+        if cache is not None:
+            digest = cache.digest(file_path, data)
+            block = cache.get(digest)
+            if block is not None:
+                cache.remember(file_path, st, digest)
+                return block
+        content = decode_text(data)
+    finally:
+        release_buffer(data)
+    if content is None:
+        return _placeholder(file_path, 'not valid UTF-8', rejected)
+
+    block = f"\nfile: {file_path}\ncontent:\n{content}\n"
+    if cache is not None:
+        cache.remember(file_path, st, digest, block)
+    return block
+
+
+def iter_context_files(input, rejected=None, workers=None):
+    """
+    Yields (file_path, block) pairs for a context. Files are read on a
+    thread pool but pairs always come back in walk order, so prompts are
+    reproducible. Blocks of unchanged files come from the on-disk context
+    cache.
+    :param input: Directory path, single file path or glob, or a list of them
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    :param workers: Number of files read concurrently
+    :return: Generator of (file_path, block) tuples
+    """
+    cache = get_context_cache()
+    try:
+        yield from ordered_map(lambda file_path: (file_path, format_file(file_path, rejected, cache)),
+                               iter_file_paths(input, rejected), workers)
+    finally:
+        if cache is not None:
+            try:
+                cache.flush()
+            except sqlite3.OperationalError as e:
+                logging.warning(f"Could not update the context cache: {e}")
+
+
+def iter_formatted_files(input, rejected=None, workers=None):
+    """
+    Yields one formatted block per file so callers never have to hold
+    more than the blocks they keep.
+    :param input: Directory path, single file path or glob, or a list of them
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    :param workers: Number of files read concurrently
+    :return: Generator of formatted file blocks
+    """
+    for _, block in iter_context_files(input, rejected, workers):
+        yield block
+
+
+def write_formatted_files(input, stream, rejected=None):
+    """
+    Writes the formatted context to a file-like object, block by block.
+    :param input: Directory path, single file path or glob, or a list of them
+    :param stream: Object with a write(str) method
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    """
+    for block in iter_formatted_files(input, rejected):
+        stream.write(block)
+
+
+def format_files_as_parts(input, header=None, rejected=None):
+    """
+    Returns the context as a list of prompt parts, one per file, ready to be
+    passed to send_message or generate_content.
+    :param input: Directory path, single file path or glob, or a list of them
+    :param header: Optional text part placed before the file blocks
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    :return: List of strings
+    """
+    parts = [header] if header else []
+    parts.extend(iter_formatted_files(input, rejected))
+    return parts
+
+
+def format_files_as_string(input, rejected=None):
+    return "".join(iter_formatted_files(input, rejected))
+
+def list_files(start_sha, end_sha, refer_commit_parent=False, exclude_deleted=False):
 
     if refer_commit_parent:
         start_sha = f"{start_sha}^"
-        
-    command = ["git", "diff", "--name-only", start_sha, end_sha]
 
-    return run_git_command(command)
+    command = ["diff", "--name-only", start_sha, end_sha]
+    if exclude_deleted:
+        command.insert(2, "--diff-filter=d")
 
-def list_changes(start_sha, end_sha, refer_commit_parent=False):
+    return get_repository().lines(*command)
+
+def iter_changes(start_sha, end_sha, refer_commit_parent=False):
     if refer_commit_parent:
         start_sha = f"{start_sha}^"
 
-    command = ["git", "diff", start_sha, end_sha]
-    output = subprocess.check_output(command, text=True)
-    return output
+    return get_repository().stream("diff", start_sha, end_sha)
 
-def list_commit_messages(start_sha, end_sha, refer_commit_parent=False):
-    
-    command = ["git", "log", "--pretty=format:%s", "--name-only", start_sha, end_sha]
+def list_changes(start_sha, end_sha, refer_commit_parent=False):
+    return "".join(iter_changes(start_sha, end_sha, refer_commit_parent))
+
+def iter_commit_messages(start_sha, end_sha, refer_commit_parent=False):
+
+    command = ["log", "--pretty=format:%s", "--name-only", start_sha, end_sha]
     if refer_commit_parent:
-        command = ["git", "log", "--pretty=format:%s", "--name-only", f"{start_sha}^..{end_sha}"]
+        command = ["log", "--pretty=format:%s", "--name-only", f"{start_sha}^..{end_sha}"]
 
-    output = subprocess.check_output(command, text=True)
-    return output
+    return get_repository().stream(*command)
+
+def list_commit_messages(start_sha, end_sha, refer_commit_parent=False):
+    return "".join(iter_commit_messages(start_sha, end_sha, refer_commit_parent))
 
 def list_commits_for_branches(branch_a, branch_b):
-    command = ["git", "log", "--pretty=format:%h", f"{branch_a}..{branch_b}"]
-    return run_git_command(command)
+    return get_repository().lines("log", "--pretty=format:%h", f"{branch_a}..{branch_b}")
 
 def list_commits_for_tags(tag_a, tag_b):
-    command = ["git", "log", "--pretty=format:%h", tag_a, tag_b]
-    return run_git_command(command)
+    return get_repository().lines("log", "--pretty=format:%h", tag_a, tag_b)
 
 def list_tags():
-    command = ["git", "tag"]
-    return run_git_command(command)
+    return get_repository().tags()
 
 def run_git_command(command):
-    output = subprocess.check_output(command).decode("utf-8").strip()
-    records = output.splitlines()
-
-    list = []
-    for record in records:
-        list.append(record)
-
-    return list
\ No newline at end of file
+    if command[:1] == ["git"]:
+        command = command[1:]
+    return get_repository().lines(*command)
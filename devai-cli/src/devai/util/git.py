@@ -0,0 +1,344 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+
+# Seconds a single git command may run; DEVAI_GIT_TIMEOUT overrides.
+DEFAULT_GIT_TIMEOUT = 120
+
+
+def get_git_timeout(timeout=None):
+    """
+    Resolve the git command timeout.
+    :param timeout: Explicit timeout in seconds, or None to use the environment
+    :return: Timeout in seconds, None when commands may run for ever
+    """
+    if timeout is None:
+        try:
+            timeout = float(os.getenv('DEVAI_GIT_TIMEOUT', DEFAULT_GIT_TIMEOUT))
+        except ValueError:
+            timeout = DEFAULT_GIT_TIMEOUT
+    return timeout if timeout > 0 else None
+
+
+def find_git_dir(path):
+    """
+    Locate the git directory of the work tree holding path.
+    :param path: Directory inside the work tree
+    :return: Tuple of (git_dir, common_dir), or (None, None) outside a work tree
+    """
+    current = os.path.abspath(path)
+    while True:
+        candidate = os.path.join(current, '.git')
+        if os.path.isdir(candidate):
+            git_dir = candidate
+            break
+        if os.path.isfile(candidate):
+            # Linked worktrees and submodules point at their git directory.
+            with open(candidate, 'r', encoding='utf-8') as f:
+                line = f.readline().strip()
+            if not line.startswith('gitdir:'):
+                return None, None
+            git_dir = os.path.normpath(os.path.join(current, line[len('gitdir:'):].strip()))
+            break
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None, None
+        current = parent
+
+    common_dir = git_dir
+    try:
+        with open(os.path.join(git_dir, 'commondir'), 'r', encoding='utf-8') as f:
+            common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+    except OSError:
+        pass
+    return git_dir, common_dir
+
+
+class GitRepository:
+    """
+    Access to one git repository for the lifetime of the process.
+
+    Tags are read straight from the repository files, and blobs, their
+    sizes and types come from 'git cat-file' processes kept open for the
+    lifetime of the object. log, diff and the other commands that need
+    git's history walking and diff machinery start one git process per
+    call: git has no long-lived mode that answers them, and reimplementing
+    them would not match git's output. They run with a timeout and have
+    their output streamed line by line instead of being buffered whole, so
+    a release summary costs a fixed handful of processes whatever the
+    number of commits or files.
+    """
+
+    def __init__(self, path='.', timeout=None):
+        self.path = os.path.abspath(path)
+        self.timeout = get_git_timeout(timeout)
+        self._dirs = None
+        self._sizes = {}
+        self._pipes = {}
+        self._batch_lock = threading.Lock()
+
+    @property
+    def common_dir(self):
+        if self._dirs is None:
+            self._dirs = find_git_dir(self.path)
+        return self._dirs[1]
+
+    def stream(self, *args, timeout=None):
+        """
+        Run a git command and yield its output as it is produced.
+
+        The process is killed when the timeout passes or the caller stops
+        reading early.
+        :param args: Arguments after 'git'
+        :param timeout: Seconds for the whole command, defaults to the
+                        repository timeout
+        :return: Generator of output lines, line endings included
+        """
+        command = ['git', *args]
+        timeout = self.timeout if timeout is None else get_git_timeout(timeout)
+        timed_out = threading.Event()
+
+        with tempfile.TemporaryFile() as stderr:
+            proc = subprocess.Popen(command, cwd=self.path, stdout=subprocess.PIPE, stderr=stderr,
+                                    stdin=subprocess.DEVNULL, text=True, encoding='utf-8',
+                                    errors='replace')
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(timeout, kill) if timeout else None
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                yield from proc.stdout
+                returncode = proc.wait()
+            finally:
+                if timer:
+                    timer.cancel()
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                proc.stdout.close()
+
+            if timed_out.is_set():
+                raise subprocess.TimeoutExpired(command, timeout)
+            if returncode:
+                stderr.seek(0)
+                raise subprocess.CalledProcessError(
+                    returncode, command, stderr=stderr.read().decode('utf-8', 'replace'))
+
+    def run(self, *args, timeout=None):
+        """Run a git command and return its whole output."""
+        return ''.join(self.stream(*args, timeout=timeout))
+
+    def lines(self, *args, timeout=None):
+        """Run a git command and return its output lines, without blank edges."""
+        return self.run(*args, timeout=timeout).strip().splitlines()
+
+    def tags(self):
+        """
+        List tag names sorted like 'git tag', read from the loose and packed
+        refs without starting git.
+        :return: List of tag names
+        """
+        common_dir = self.common_dir
+        if common_dir is None or os.path.exists(os.path.join(common_dir, 'reftable')):
+            return self.lines('tag')
+
+        names = set()
+        try:
+            with open(os.path.join(common_dir, 'packed-refs'), 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith(('#', '^')):
+                        continue
+                    ref = line.rstrip('\n').partition(' ')[2]
+                    if ref.startswith('refs/tags/'):
+                        names.add(ref[len('refs/tags/'):])
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.debug(f"Could not read packed refs, asking git: {e}")
+            return self.lines('tag')
+
+        tags_dir = os.path.join(common_dir, 'refs', 'tags')
+        for root, _, files in os.walk(tags_dir):
+            for name in files:
+                if name.endswith('.lock'):
+                    continue
+                names.add(os.path.relpath(os.path.join(root, name), tags_dir).replace(os.sep, '/'))
+        return sorted(names, key=lambda name: name.encode('utf-8'))
+
+    def list_tree(self, rev, path=''):
+        """
+        List the blobs of a revision, like a directory walk of that commit.
+        A path naming a single file is looked up over the cat-file pipe, so
+        listing many files one by one does not start git for each of them.
+        :param rev: Commit, tag or branch
+        :param path: Directory or file relative to the repository root, ''
+                     for the whole tree
+        :return: List of paths relative to the repository root
+        """
+        if path and self.object_info(rev, path)[0] == 'blob':
+            return [path]
+        args = ['ls-tree', '-r', '-z', '-l', '--full-tree', rev]
+        if path:
+            args += ['--', path]
+        paths = []
+        for entry in self.run(*args).split('\0'):
+            if not entry:
+                continue
+            meta, _, name = entry.partition('\t')
+            _, kind, _, size = meta.split()
+            if kind != 'blob':
+                continue
+            self._sizes[(rev, name)] = int(size)
+            paths.append(name)
+        return paths
+
+    def object_info(self, rev, path):
+        """
+        Type and size of the object at a path of a revision, asked of a
+        'git cat-file --batch-check' process that is kept open.
+        :param rev: Commit, tag or branch
+        :param path: Path relative to the repository root
+        :return: Tuple of (type, size), (None, None) if there is no such object
+        """
+        header = self._ask('--batch-check', rev, path, lambda proc, header: header)
+        if len(header) != 3:
+            # '<object> missing' or '<object> ambiguous'
+            return None, None
+        kind, size = header[1].decode('ascii'), int(header[2])
+        if kind == 'blob':
+            self._sizes[(rev, path)] = size
+        return kind, size
+
+    def blob_size(self, rev, path):
+        """Size in bytes of a file at a revision, or None if it does not exist there."""
+        size = self._sizes.get((rev, path))
+        if size is None:
+            kind, size = self.object_info(rev, path)
+            if kind != 'blob':
+                return None
+        return size
+
+    def read_blob(self, rev, path):
+        """
+        Read a file at a revision through a 'git cat-file --batch' process
+        that is kept open for the lifetime of the repository object.
+        :param rev: Commit, tag or branch
+        :param path: File path relative to the repository root
+        :return: File contents as bytes, or None if the path is not a file
+                 at that revision
+        """
+        def read(proc, header):
+            if len(header) != 3:
+                return None
+            data = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)
+            return data if header[1] == b'blob' else None
+
+        data = self._ask('--batch', rev, path, read)
+        if data is not None:
+            self._sizes[(rev, path)] = len(data)
+        return data
+
+    def _ask(self, mode, rev, path, read):
+        """
+        Send one object name to a persistent cat-file process and read the
+        answer. The process is killed, and started again on the next call,
+        when the answer takes longer than the repository timeout.
+        :param mode: '--batch' or '--batch-check'
+        :param read: Callable reading the answer from the process, given it
+                     and the split header line
+        :return: What read returns
+        """
+        with self._batch_lock:
+            proc = self._pipes.get(mode)
+            if proc is None or proc.poll() is not None:
+                proc = self._pipes[mode] = subprocess.Popen(
+                    ['git', 'cat-file', mode], cwd=self.path, stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            timed_out = threading.Event()
+
+            def kill():
+                timed_out.set()
+                proc.kill()
+
+            timer = threading.Timer(self.timeout, kill) if self.timeout else None
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                proc.stdin.write(f'{rev}:{path}\n'.encode('utf-8'))
+                proc.stdin.flush()
+                result = read(proc, proc.stdout.readline().split())
+            except OSError:
+                if not timed_out.is_set():
+                    raise
+            finally:
+                if timer:
+                    timer.cancel()
+            if timed_out.is_set():
+                self._stop(mode)
+                raise subprocess.TimeoutExpired(['git', 'cat-file', mode], self.timeout)
+            return result
+
+    def _stop(self, mode):
+        proc = self._pipes.pop(mode, None)
+        if proc is not None:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.wait()
+            proc.stdout.close()
+
+    def close(self):
+        """Stop the cat-file processes, if any were started."""
+        with self._batch_lock:
+            for mode in list(self._pipes):
+                self._stop(mode)
+
+
+_repositories = {}
+_repositories_lock = threading.Lock()
+
+
+def get_repository(path='.'):
+    """
+    Shared GitRepository for a directory, created on first use.
+    :param path: Directory inside the work tree
+    :return: GitRepository
+    """
+    path = os.path.abspath(path)
+    with _repositories_lock:
+        repository = _repositories.get(path)
+        if repository is None:
+            repository = _repositories[path] = GitRepository(path)
+        return repository
+
+
+@atexit.register
+def close_repositories():
+    with _repositories_lock:
+        for repository in _repositories.values():
+            repository.close()
@@ -0,0 +1,251 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import re
+
+# Files holding ignore rules, read in every directory that is walked.
+IGNORE_FILES = ('.gitignore', '.devaiignore')
+
+# Names that are skipped everywhere, whatever the ignore files say.
+DEFAULT_IGNORED_NAMES = frozenset([
+    '.git', '.hg', '.svn', '.idea', '.vscode', '.gradle', '.tox', '.nox',
+    '.venv', 'venv', '__pycache__', '.mypy_cache', '.pytest_cache',
+    '.ruff_cache', 'node_modules', 'bower_components', 'dist', 'target',
+    '.gitignore', '.devaiignore', '.DS_Store',
+])
+
+# Dependency lockfiles: machine written and rarely useful in a review.
+LOCKFILE_NAMES = frozenset([
+    'Cargo.lock', 'Gemfile.lock', 'Pipfile.lock', 'bun.lockb',
+    'composer.lock', 'go.sum', 'gradle.lockfile', 'mix.lock',
+    'npm-shrinkwrap.json', 'package-lock.json', 'packages.lock.json',
+    'pnpm-lock.yaml', 'poetry.lock', 'pubspec.lock', 'uv.lock', 'yarn.lock',
+])
+
+# File name endings of minified bundles, source maps and protobuf output.
+GENERATED_SUFFIXES = (
+    '.min.js', '.min.css', '.js.map', '.css.map', '_pb2.py', '_pb2.pyi',
+    '_pb2_grpc.py', '.pb.go', '.pb.cc', '.pb.h', '_pb.js', '_pb.d.ts',
+    '_grpc_pb.js', '.g.dart', '.designer.cs',
+)
+
+# Header comments that code generators conventionally emit.
+GENERATED_MARKERS = (
+    b'code generated', b'do not edit', b'@generated', b'autogenerated',
+    b'auto-generated',
+)
+
+# Only the start of a file is searched for a generated marker.
+GENERATED_MARKER_BYTES = 512
+
+# Sniffed prefixes with longer lines than this on average are treated as
+# minified or otherwise generated.
+MAX_AVERAGE_LINE_LENGTH = 500
+
+
+def generated_file_reason(file_name):
+    """
+    Detect lockfiles, minified bundles and protobuf output by name.
+    :param file_name: Base name of the file
+    :return: Reason the file is skipped, or None
+    """
+    if file_name in LOCKFILE_NAMES:
+        return 'dependency lockfile'
+    if file_name.endswith(GENERATED_SUFFIXES):
+        return 'generated file'
+    return None
+
+
+def sniff_generated(prefix):
+    """
+    Detect generated content from the first bytes of a file.
+    :param prefix: Leading bytes of the file
+    :return: Reason the file is skipped, or None
+    """
+    if any(marker in prefix[:GENERATED_MARKER_BYTES].lower() for marker in GENERATED_MARKERS):
+        return 'generated file header'
+    if len(prefix) >= 4096 and len(prefix) > (prefix.count(b'\n') + 1) * MAX_AVERAGE_LINE_LENGTH:
+        return 'long single-line content'
+    return None
+
+
+def _translate(pattern):
+    """
+    Translate the glob part of a gitignore pattern to a regular expression.
+    :param pattern: Pattern without the leading '!' or trailing '/'
+    :return: Regular expression source
+    """
+    i, n = 0, len(pattern)
+    result = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**/', i):
+                result.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern.startswith('**', i):
+                result.append('.*')
+                i += 2
+                continue
+            result.append('[^/]*')
+        elif c == '?':
+            result.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                result.append(re.escape(c))
+            else:
+                chars = pattern[i + 1:end].replace('\\', '\\\\')
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                result.append(f'[{chars}]')
+                i = end + 1
+                continue
+        elif c == '\\' and i + 1 < n:
+            result.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            result.append(re.escape(c))
+        i += 1
+    return ''.join(result)
+
+
+def compile_pattern(line):
+    """
+    Compile one line of an ignore file.
+    :param line: Raw line from .gitignore or .devaiignore
+    :return: Tuple of (regex, negate, dir_only), or None for blank lines
+             and comments
+    """
+    line = line.rstrip('\r\n')
+    if not line or line.startswith('#'):
+        return None
+    line = re.sub(r'(?<!\\) +$', '', line)
+
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    # Patterns with a slash before the end are relative to the ignore file,
+    # the rest match at any depth.
+    anchored = '/' in line
+    prefix = '' if anchored else '(?:.*/)?'
+    regex = re.compile(prefix + _translate(line.lstrip('/')) + '$')
+    return regex, negate, dir_only
+
+
+def find_repository_root(path):
+    """
+    Find the enclosing git work tree, so ancestor .gitignore files apply.
+    :param path: Directory inside the repository
+    :return: Repository root, or None when path is not inside a git work tree
+    """
+    current = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(current, '.git')):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+class IgnoreMatcher:
+    """
+    Compiled .gitignore and .devaiignore rules for one directory walk.
+
+    Paths are matched relative to the matcher root using '/' separators.
+    Later rules win over earlier ones, as in git.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.rules = []
+
+    @classmethod
+    def for_directory(cls, path):
+        """
+        Build a matcher for walking path, loading the ignore files of the
+        repository root and every directory between it and path.
+        :param path: Directory about to be walked
+        :return: IgnoreMatcher
+        """
+        path = os.path.abspath(path)
+        root = find_repository_root(path) or path
+        matcher = cls(root)
+        matcher.load_file(os.path.join(root, '.git', 'info', 'exclude'), '')
+
+        relative = os.path.relpath(path, root)
+        directory, rel_dir = root, ''
+        matcher.load(directory, rel_dir)
+        if relative != '.':
+            for name in relative.split(os.sep):
+                directory = os.path.join(directory, name)
+                rel_dir = f'{rel_dir}/{name}' if rel_dir else name
+                matcher.load(directory, rel_dir)
+        return matcher
+
+    def relative(self, path):
+        """Return path relative to the matcher root, '' for the root itself."""
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        return '' if relative == '.' else relative.replace(os.sep, '/')
+
+    def load(self, directory, rel_dir):
+        """
+        Load the ignore files of one directory.
+        :param directory: Directory on disk
+        :param rel_dir: Same directory relative to the matcher root
+        """
+        for name in IGNORE_FILES:
+            self.load_file(os.path.join(directory, name), rel_dir)
+
+    def load_file(self, file_path, rel_dir):
+        try:
+            with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        for line in lines:
+            rule = compile_pattern(line)
+            if rule:
+                self.rules.append((rel_dir, *rule))
+
+    def is_ignored(self, rel_path, is_dir):
+        """
+        Check a path against the default names and the loaded rules.
+        :param rel_path: Path relative to the matcher root
+        :param is_dir: Whether the path is a directory
+        :return: True if the path should be skipped
+        """
+        if rel_path.rsplit('/', 1)[-1] in DEFAULT_IGNORED_NAMES:
+            return True
+        for rel_dir, regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if rel_dir:
+                if not rel_path.startswith(rel_dir + '/'):
+                    continue
+                candidate = rel_path[len(rel_dir) + 1:]
+            else:
+                candidate = rel_path
+            if regex.match(candidate):
+                return not negate
+        return False
@@ -0,0 +1,271 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import io
+import math
+from collections import deque
+
+from PIL import Image, ImageChops
+
+from devai.util.cache import DiskCache, cache_enabled, env_int, get_cache_dir
+
+# Per channel difference up to which two pixels are not located as a
+# change, so antialiasing and compression noise are not sent to the model.
+# Such pairs are reported as not significantly different, never identical.
+PIXEL_THRESHOLD = 24
+
+# Side in pixels of the tiles changed areas are located with, and the
+# margin of context kept around each changed region.
+TILE_SIZE = 32
+REGION_MARGIN = 24
+
+# Above this many separate regions the union of all of them is sent instead.
+MAX_REGIONS = 6
+
+# Longest side of an image sent to the model; larger crops are downscaled.
+MAX_SIDE = 1024
+
+# Difference hash size: HASH_SIZE * HASH_SIZE bits.
+HASH_SIZE = 8
+
+# Images of different sizes whose hashes differ in more bits than this show
+# different screens and are sent whole; closer ones are scaled to one size
+# and diffed pixel by pixel.
+MAX_RESCALE_DISTANCE = 10
+
+# Size bound and lifetime of the cached verdicts.
+DEFAULT_VERDICT_CACHE_BYTES = 32 * 1024 * 1024
+VERDICT_CACHE_TTL = 30 * 24 * 3600
+
+
+def image_digest(path):
+    """SHA-256 of an image file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dhash(image, hash_size=HASH_SIZE):
+    """
+    Perceptual difference hash: one bit per neighbouring pixel pair of a
+    small grayscale thumbnail, set where brightness increases.
+    :param image: PIL image
+    :param hash_size: Bits per row and rows of the hash
+    :return: Integer hash
+    """
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = thumbnail.tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (right > left)
+    return value
+
+
+def hash_distance(a, b):
+    """Number of differing bits of two hashes."""
+    return bin(a ^ b).count('1')
+
+
+def max_difference(before, after):
+    """Largest difference of any channel, alpha included, between two images of the same size."""
+    diff = ImageChops.difference(before.convert('RGBA'), after.convert('RGBA'))
+    return max(high for _, high in diff.getextrema())
+
+
+def changed_mask(before, after, threshold=PIXEL_THRESHOLD):
+    """
+    Black and white mask of the pixels that differ between two images of the
+    same size, white where any channel differs by more than threshold.
+    """
+    diff = ImageChops.difference(before.convert('RGB'), after.convert('RGB'))
+    # The largest channel difference of every pixel.
+    r, g, b = diff.split()
+    diff = ImageChops.lighter(ImageChops.lighter(r, g), b)
+    return diff.point(lambda value: 255 if value > threshold else 0)
+
+
+def changed_regions(mask, tile_size=TILE_SIZE, margin=REGION_MARGIN, max_regions=MAX_REGIONS):
+    """
+    Group the changed pixels of a mask into rectangular regions.
+
+    The mask is scanned in tiles; touching changed tiles form one region,
+    which is grown by margin pixels of context.
+    :param mask: Mask from changed_mask
+    :return: List of (left, top, right, bottom) boxes, empty when nothing changed
+    """
+    width, height = mask.size
+    if mask.getbbox() is None:
+        return []
+    cols = (width + tile_size - 1) // tile_size
+    rows = (height + tile_size - 1) // tile_size
+    changed = set()
+    for row in range(rows):
+        for col in range(cols):
+            box = (col * tile_size, row * tile_size,
+                   min(width, (col + 1) * tile_size), min(height, (row + 1) * tile_size))
+            if mask.crop(box).getbbox() is not None:
+                changed.add((row, col))
+
+    regions = []
+    seen = set()
+    for start in sorted(changed):
+        if start in seen:
+            continue
+        seen.add(start)
+        queue = deque([start])
+        top, left, bottom, right = start[0], start[1], start[0], start[1]
+        while queue:
+            row, col = queue.popleft()
+            top, left, bottom, right = min(top, row), min(left, col), max(bottom, row), max(right, col)
+            for neighbour in ((row + dr, col + dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1)):
+                if neighbour in changed and neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
+        # Tighten the tile box to the changed pixels inside it.
+        tile_box = (left * tile_size, top * tile_size,
+                    min(width, (right + 1) * tile_size), min(height, (bottom + 1) * tile_size))
+        x0, y0, x1, y1 = mask.crop(tile_box).getbbox()
+        regions.append((tile_box[0] + x0, tile_box[1] + y0, tile_box[0] + x1, tile_box[1] + y1))
+
+    if len(regions) > max_regions:
+        regions = [mask.getbbox()]
+    return [(max(0, x0 - margin), max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin))
+            for x0, y0, x1, y1 in regions]
+
+
+def encode_image(image, max_side=MAX_SIDE):
+    """
+    Downscale an image so its longest side is at most max_side and encode it
+    as PNG.
+    :return: PNG bytes
+    """
+    scale = max_side / max(image.size)
+    if scale < 1:
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.Resampling.LANCZOS)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+class PreDiff:
+    """
+    Result of comparing two screenshots locally.
+
+    identical is True only when both images have the same size and pixels.
+    pairs holds the (region, before PNG, after PNG) crops to send, with
+    region None for whole images; it is empty when the model does not need
+    to be asked, and note then says why differing images were not sent.
+    Regions are in the pixel coordinates of the before image, sizes are
+    the sizes of both images.
+    """
+
+    def __init__(self, digests, identical, distance, regions=None, pairs=None, changed_ratio=0.0, note=None,
+                 sizes=None):
+        self.digests = digests
+        self.identical = identical
+        self.distance = distance
+        self.regions = regions or []
+        self.pairs = pairs or []
+        self.changed_ratio = changed_ratio
+        self.note = note
+        self.sizes = sizes
+
+
+def prediff(before_path, after_path, crop=True):
+    """
+    Compare two screenshots with a perceptual hash and a pixel diff.
+    :param before_path: First image
+    :param after_path: Second image
+    :param crop: Crop to the changed regions; False sends whole images
+    :return: PreDiff
+    """
+    digests = (image_digest(before_path), image_digest(after_path))
+    if digests[0] == digests[1]:
+        return PreDiff(digests, True, 0)
+
+    with Image.open(before_path) as before_file, Image.open(after_path) as after_file:
+        before, after = before_file.copy(), after_file.copy()
+    distance = hash_distance(dhash(before), dhash(after))
+    sizes = (before.size, after.size)
+
+    if before.size == after.size:
+        largest = max_difference(before, after)
+        if largest == 0:
+            return PreDiff(digests, True, distance, sizes=sizes)
+        note = f"no channel differs by more than {largest} levels"
+    else:
+        if distance > MAX_RESCALE_DISTANCE:
+            return PreDiff(digests, False, distance, pairs=[(None, encode_image(before), encode_image(after))],
+                           changed_ratio=1.0, sizes=sizes)
+        # The same screen at another resolution: compare at the smaller size.
+        size = min(before.size, after.size, key=lambda wh: wh[0] * wh[1])
+        before = before.resize(size, Image.Resampling.LANCZOS) if before.size != size else before
+        after = after.resize(size, Image.Resampling.LANCZOS) if after.size != size else after
+        note = "the same screen at {}x{} and {}x{} pixels".format(*sizes[0], *sizes[1])
+
+    mask = changed_mask(before, after)
+    regions = changed_regions(mask)
+    if not regions:
+        return PreDiff(digests, False, distance, note=note, sizes=sizes)
+
+    changed_ratio = mask.histogram()[255] / (mask.width * mask.height)
+    if not crop:
+        pairs = [(None, encode_image(before), encode_image(after))]
+    else:
+        pairs = [(region, encode_image(before.crop(region)), encode_image(after.crop(region))) for region in regions]
+    return PreDiff(digests, False, distance, [_scale_box(region, before.size, sizes[0]) for region in regions],
+                   pairs, changed_ratio, sizes=sizes)
+
+
+def _scale_box(box, size, original):
+    """Box in the coordinates of an image of size, scaled to the original size."""
+    if size == original:
+        return box
+    sx, sy = original[0] / size[0], original[1] / size[1]
+    x0, y0, x1, y1 = box
+    return (math.floor(x0 * sx), math.floor(y0 * sy),
+            min(original[0], math.ceil(x1 * sx)), min(original[1], math.ceil(y1 * sy)))
+
+
+def verdict_key(model_name, instruction, before_digest, after_digest):
+    """Cache key of the verdict on one image pair."""
+    return hashlib.sha256(
+        f'{model_name}\0{instruction}\0{before_digest}\0{after_digest}'.encode('utf-8')).hexdigest()
+
+
+_verdict_cache = None
+
+
+def get_verdict_cache():
+    """
+    Process-wide cache of image diff verdicts, or None when it is disabled.
+    :return: DiskCache or None
+    """
+    global _verdict_cache
+    if not cache_enabled('imgdiff'):
+        return None
+    path = get_cache_dir() / 'imgdiff.db'
+    if _verdict_cache is None or _verdict_cache.path != path:
+        _verdict_cache = DiskCache(
+            path, env_int('DEVAI_IMGDIFF_CACHE_BYTES', DEFAULT_VERDICT_CACHE_BYTES), ttl=VERDICT_CACHE_TTL)
+    return _verdict_cache
@@ -0,0 +1,142 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import logging
+import re
+
+from json_repair import repair_json
+
+# Characters that change the nesting or string state of the scanner.
+_STRUCTURAL = re.compile(r'[\\"{}\[\]]')
+
+
+def _load_object(text):
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(text))
+        except (ValueError, json.JSONDecodeError):
+            logging.warning("Skipping a finding that is not valid JSON")
+            return None
+    return data if isinstance(data, dict) and data else None
+
+
+class JsonArrayParser:
+    """
+    Incremental parser for a JSON array of objects that arrives in pieces,
+    such as a streamed model response.
+
+    Each object is returned by feed() as soon as its closing brace arrives.
+    Text around the array, like a markdown fence, is ignored, a lone object
+    is treated as an array of one, and close() salvages an object cut off by
+    the end of the response.
+    """
+
+    def __init__(self):
+        self._buffer = ''
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._in_array = False
+        self.done = False
+
+    def feed(self, text):
+        """
+        Add the next piece of the response.
+        :param text: Response text following the previous piece
+        :return: List of the objects completed by this piece
+        """
+        if self.done:
+            return []
+        self._buffer += text
+        objects = []
+        buffer = self._buffer
+        pos = self._pos
+        if self._escaped and pos < len(buffer):
+            self._escaped = False
+            pos += 1
+
+        while not self.done:
+            match = _STRUCTURAL.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            i = match.start()
+            char = buffer[i]
+            pos = i + 1
+
+            if self._in_string:
+                if char == '\\':
+                    if pos < len(buffer):
+                        pos += 1
+                    else:
+                        self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._in_array or self._depth:
+                    self._in_string = True
+            elif char in '{[':
+                if not self._in_array and not self._depth and char == '[':
+                    self._in_array = True
+                    continue
+                if not self._depth:
+                    self._start = i
+                self._depth += 1
+            elif self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    obj = _load_object(buffer[self._start:pos])
+                    if obj is not None:
+                        objects.append(obj)
+                    self._start = None
+                    if not self._in_array:
+                        self.done = True
+            elif char == ']' and self._in_array:
+                self.done = True
+
+        # Keep only the text of the object being read.
+        keep = self._start if self._start is not None else pos
+        self._buffer = buffer[keep:]
+        self._pos = pos - keep
+        if self._start is not None:
+            self._start = 0
+        return objects
+
+    def close(self):
+        """
+        Finish parsing at the end of the response.
+        :return: List holding the repaired object that was cut off, if any
+        """
+        if self._start is None or self.done:
+            return []
+        obj = _load_object(self._buffer[self._start:])
+        self.done = True
+        return [obj] if obj is not None else []
+
+
+def iter_json_objects(chunks):
+    """
+    Yield the objects of a JSON array as its text arrives.
+    :param chunks: Iterable of text pieces
+    :return: Generator of dictionaries
+    """
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.close()
@@ -0,0 +1,309 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Local prefilter of the compliance review: reference configurations are
+compiled from the standards files, and Kubernetes manifests are checked
+against them so only the containers that may be out of line are sent in
+place of the workloads. Documents of other kinds are not judged here.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+import yaml
+
+# Spellings of the environments a standard or a manifest can be written for.
+ENVIRONMENTS = {
+    'dev': 'dev', 'development': 'dev',
+    'test': 'test', 'testing': 'test', 'qa': 'test',
+    'stage': 'staging', 'staging': 'staging',
+    'prod': 'prod', 'production': 'prod',
+}
+
+_ENVIRONMENT_WORD = re.compile(r'\b(' + '|'.join(ENVIRONMENTS) + r')\b', re.IGNORECASE)
+
+# Workload kinds, with the path from the document to the pod spec.
+POD_SPEC_PATHS = {
+    'Pod': ('spec',),
+    'Deployment': ('spec', 'template', 'spec'),
+    'StatefulSet': ('spec', 'template', 'spec'),
+    'DaemonSet': ('spec', 'template', 'spec'),
+    'ReplicaSet': ('spec', 'template', 'spec'),
+    'Job': ('spec', 'template', 'spec'),
+    'CronJob': ('spec', 'jobTemplate', 'spec', 'template', 'spec'),
+}
+
+MANIFEST_EXTENSIONS = ('.yaml', '.yml')
+
+_QUANTITY = re.compile(r'^([+-]?[0-9.]+(?:[eE][+-]?[0-9]+)?)([a-zA-Z]*)$')
+_SUFFIXES = {
+    '': 1, 'm': Decimal('0.001'), 'k': 10 ** 3, 'M': 10 ** 6, 'G': 10 ** 9, 'T': 10 ** 12, 'P': 10 ** 15,
+    'Ki': 2 ** 10, 'Mi': 2 ** 20, 'Gi': 2 ** 30, 'Ti': 2 ** 40, 'Pi': 2 ** 50,
+}
+
+
+def parse_quantity(value):
+    """
+    Kubernetes quantity as a number, so 1000m equals 1 and 1Gi equals 1024Mi.
+    :param value: Quantity such as '500m' or '0.5Gi'
+    :return: Decimal, or None when value is not a quantity
+    """
+    match = _QUANTITY.match(str(value).strip())
+    if not match or match.group(2) not in _SUFFIXES:
+        return None
+    try:
+        return Decimal(match.group(1)) * _SUFFIXES[match.group(2)]
+    except InvalidOperation:
+        return None
+
+
+def environment_of(text):
+    """
+    Environment named in a heading, path or namespace, or None. The last
+    name wins, so the directory nearest a manifest decides its environment.
+    """
+    words = _ENVIRONMENT_WORD.findall(re.sub(r'[_/\\.-]', ' ', text or ''))
+    return ENVIRONMENTS[words[-1].lower()] if words else None
+
+
+def flatten(value, prefix=()):
+    """Leaves of nested dicts as (path tuple, value) pairs."""
+    if isinstance(value, dict):
+        for key, child in value.items():
+            yield from flatten(child, prefix + (str(key),))
+    else:
+        yield prefix, value
+
+
+def lookup(value, path):
+    """Value at a path of nested dicts, or None."""
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+class Standards:
+    """
+    Standards compiled from Markdown: the prose, and the reference
+    configurations of its YAML snippets by environment (None for snippets
+    not tied to one).
+    """
+
+    def __init__(self, prose, references):
+        self.prose = prose
+        self.references = references
+
+    def rules(self, environment):
+        """(path, expected value) pairs that apply to a manifest of an environment."""
+        reference = self.references.get(environment) if environment else None
+        if reference is None:
+            reference = self.references.get(None)
+        if reference is not None:
+            return list(flatten(reference))
+        # No reference for this environment: only check that the settings
+        # every environment sets are there.
+        paths = [set(path for path, _ in flatten(reference)) for reference in self.references.values()]
+        return [(path, None) for path in sorted(set.intersection(*paths))] if paths else []
+
+    def digest(self):
+        """Compact text of the standards to send instead of the whole files."""
+        lines = ["### Standards digest ###", *self.prose]
+        for environment, reference in self.references.items():
+            lines.append(f"Reference configuration{f' for {environment}' if environment else ''}:")
+            lines += [f"  {'.'.join(path)}: {value}" for path, value in flatten(reference)]
+        return '\n'.join(lines)
+
+
+def compile_standards(texts):
+    """
+    Compile standards files into reference configurations.
+
+    Every heading starts a section. Fenced code blocks that parse as YAML
+    mappings are reference configurations for the environment the heading
+    of their section names; a # inside a fence is a YAML comment, not a
+    heading. A section without fences whose body parses as a YAML mapping
+    is a reference configuration as well. Everything else is kept as prose.
+    :param texts: Contents of the standards files
+    :return: Standards
+    """
+    prose = []
+    references = {}
+
+    def close_section(heading, body, blocks):
+        environment = environment_of(heading)
+        if not blocks:
+            reference = _yaml_mapping('\n'.join(body))
+            if reference is not None:
+                references.setdefault(environment, {}).update(reference)
+                return
+        lines = [heading, *body]
+        for block in blocks:
+            reference = _yaml_mapping('\n'.join(block))
+            if reference is not None:
+                references.setdefault(environment, {}).update(reference)
+            else:
+                lines += block
+        prose.extend(line.strip() for line in lines if line.strip())
+
+    for text in texts:
+        heading = ''
+        body = []
+        blocks = []
+        fence = None
+        for line in text.splitlines():
+            marker = line.lstrip()[:3]
+            if fence is not None:
+                if marker == fence:
+                    fence = None
+                else:
+                    blocks[-1].append(line)
+            elif marker in ('```', '~~~'):
+                fence = marker
+                blocks.append([])
+            elif line.startswith('#'):
+                close_section(heading, body, blocks)
+                heading = line.strip('# ').strip()
+                body = []
+                blocks = []
+            else:
+                body.append(line)
+        close_section(heading, body, blocks)
+    return Standards(prose, references)
+
+
+def _yaml_mapping(text):
+    if not text.strip():
+        return None
+    try:
+        value = yaml.safe_load(text)
+    except yaml.YAMLError:
+        return None
+    return value if isinstance(value, dict) and any(isinstance(v, dict) for v in value.values()) else None
+
+
+def _matches(actual, expected):
+    if expected is None:
+        return True
+    a, e = parse_quantity(actual), parse_quantity(expected)
+    if a is not None and e is not None:
+        return a == e
+    return str(actual) == str(expected)
+
+
+class Finding:
+    """A container that may break the standards, with what the local checks saw."""
+
+    def __init__(self, file_path, kind, name, container, environment, snippet, problems):
+        self.file_path = file_path
+        self.kind = kind
+        self.name = name
+        self.container = container
+        self.environment = environment
+        self.snippet = snippet
+        self.problems = problems
+
+    def block(self):
+        """The finding as a context block."""
+        title = f"{self.kind} {self.name}, container {self.container}"
+        environment = self.environment or 'unknown'
+        problems = '\n'.join(f"- {problem}" for problem in self.problems)
+        return (f"\nfile: {self.file_path}\n{title} (environment: {environment})\n"
+                f"potential violations found locally:\n{problems}\ncontent:\n{self.snippet}\n")
+
+
+def load_manifest(text):
+    """
+    YAML documents of a Kubernetes manifest.
+    :param text: Manifest contents, possibly several YAML documents
+    :return: List of dicts, or None when text is not a Kubernetes manifest
+    """
+    try:
+        documents = [doc for doc in yaml.safe_load_all(text) if isinstance(doc, dict)]
+    except yaml.YAMLError:
+        return None
+    if not any('apiVersion' in doc and 'kind' in doc for doc in documents):
+        return None
+    return documents
+
+
+def pod_spec_of(document):
+    """Pod spec of a workload document, or None for the kinds the rules cannot judge."""
+    pod_spec = lookup(document, POD_SPEC_PATHS.get(document.get('kind'), ('-',)))
+    return pod_spec if isinstance(pod_spec, dict) else None
+
+
+def documents_block(file_path, documents):
+    """
+    Documents the rules cannot judge, as a context block.
+    :param file_path: Path of the manifest
+    :param documents: Documents from load_manifest
+    :return: (label, block) tuple; the label names the documents
+    """
+    label = ', '.join(f"{doc.get('kind', '?')} {(doc.get('metadata') or {}).get('name', '?')}" for doc in documents)
+    return label, (f"\nfile: {file_path}\n{label} (not checked locally)\n"
+                   f"content:\n{yaml.safe_dump_all(documents, sort_keys=False)}\n")
+
+
+def check_documents(file_path, documents, standards, location=None):
+    """
+    Check the containers of the workload documents against the rules;
+    other documents are ignored.
+    :param file_path: Path of the manifest
+    :param documents: Documents from load_manifest
+    :param standards: Standards from compile_standards
+    :param location: Path used to tell the environment, file_path by default
+    :return: List of Finding
+    """
+    findings = []
+    for doc in documents:
+        pod_spec = pod_spec_of(doc)
+        if pod_spec is None:
+            continue
+        metadata = doc.get('metadata') or {}
+        environment = environment_of(location or file_path) or environment_of(metadata.get('namespace'))
+        rules = standards.rules(environment)
+        for container in (pod_spec.get('containers') or []) + (pod_spec.get('initContainers') or []):
+            problems = []
+            for path, expected in rules:
+                # Pod level settings such as securityContext cover every container.
+                actual = lookup(container, path)
+                if actual is None:
+                    actual = lookup(pod_spec, path)
+                if actual is None:
+                    problems.append(f"{'.'.join(path)} is not set"
+                                    + (f" (standard: {expected})" if expected is not None else ""))
+                elif not _matches(actual, expected):
+                    problems.append(f"{'.'.join(path)} is {actual}, the {environment or 'reference'} "
+                                    f"standard is {expected}")
+            if problems:
+                findings.append(Finding(file_path, doc['kind'], metadata.get('name', '?'), container.get('name', '?'),
+                                        environment, yaml.safe_dump(container, sort_keys=False), problems))
+    return findings
+
+
+def check_manifest(file_path, text, standards):
+    """
+    Check the containers of the workloads in a manifest against the rules.
+    :param file_path: Path of the manifest, also used to tell its environment
+    :param text: Manifest contents, possibly several YAML documents
+    :param standards: Standards from compile_standards
+    :return: List of Finding, or None when text is not a Kubernetes manifest
+    """
+    documents = load_manifest(text)
+    if documents is None:
+        return None
+    return check_documents(file_path, documents, standards)
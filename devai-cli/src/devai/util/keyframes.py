@@ -0,0 +1,151 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image
+
+from devai.util.imgdiff import MAX_SIDE, dhash, hash_distance
+
+# ffmpeg scene score (0 to 1, the share of the picture that changed between
+# two frames) above which a frame starts a new scene.
+DEFAULT_SCENE_THRESHOLD = 0.1
+
+# Most frames sent for one video; more scene changes are thinned out evenly.
+DEFAULT_MAX_KEYFRAMES = 32
+
+# Keyframes whose difference hashes are at most this far from the last kept
+# frame add nothing and are dropped; ffmpeg compares neighbouring frames only.
+DUPLICATE_DISTANCE = 2
+
+# JPEG quality scale of ffmpeg, 2 (best) to 31.
+JPEG_QUALITY = 4
+
+_PTS_TIME = re.compile(r'pts_time:\s*(-?[\d.]+)')
+
+
+class KeyframeError(RuntimeError):
+    """Raised when frames cannot be extracted from a video."""
+
+
+class Keyframe:
+    """One frame of a video: its timestamp in seconds and JPEG bytes."""
+
+    def __init__(self, timestamp, data):
+        self.timestamp = timestamp
+        self.data = data
+
+    def label(self):
+        """Timestamp as m:ss.s, as the model is asked to quote it."""
+        minutes, seconds = divmod(self.timestamp, 60)
+        return f"{int(minutes)}:{seconds:04.1f}"
+
+
+def find_ffmpeg():
+    """
+    Path of the ffmpeg binary, from DEVAI_FFMPEG or the PATH.
+    :return: Path
+    """
+    path = os.getenv('DEVAI_FFMPEG') or shutil.which('ffmpeg')
+    if not path:
+        raise KeyframeError("ffmpeg is needed to sample keyframes; install it or set DEVAI_FFMPEG to its path")
+    return path
+
+
+def ffmpeg_command(ffmpeg, source, pattern, threshold=DEFAULT_SCENE_THRESHOLD, max_side=MAX_SIDE):
+    """
+    ffmpeg arguments that write the first frame and every frame starting a
+    new scene as downscaled JPEG files, logging their timestamps.
+    :param ffmpeg: ffmpeg binary
+    :param source: Video file
+    :param pattern: Output file pattern, such as /tmp/x/frame-%05d.jpg
+    :return: Argument list
+    """
+    filters = ','.join([
+        f"select='eq(n,0)+gt(scene,{threshold})'",
+        'showinfo',
+        f"scale='min({max_side},iw)':'min({max_side},ih)':force_original_aspect_ratio=decrease",
+    ])
+    return [ffmpeg, '-hide_banner', '-nostdin', '-loglevel', 'info', '-i', source,
+            '-vf', filters, '-vsync', 'vfr', '-q:v', str(JPEG_QUALITY), '-an', pattern]
+
+
+def parse_timestamps(log):
+    """Timestamps in seconds of the frames showinfo logged, in output order."""
+    return [float(value) for value in _PTS_TIME.findall(log)]
+
+
+def drop_near_duplicates(frames, max_distance=DUPLICATE_DISTANCE):
+    """
+    Drop frames that look like the frame kept before them, such as a
+    flicker that crossed the scene threshold and returned.
+    :param frames: Keyframes in time order
+    :return: Kept keyframes
+    """
+    kept = []
+    last = None
+    for frame in frames:
+        with Image.open(io.BytesIO(frame.data)) as image:
+            value = dhash(image)
+        if last is None or hash_distance(last, value) > max_distance:
+            kept.append(frame)
+            last = value
+    return kept
+
+
+def thin_out(frames, max_frames=DEFAULT_MAX_KEYFRAMES):
+    """Keep at most max_frames frames spread evenly, always the first and the last."""
+    if len(frames) <= max_frames:
+        return frames
+    if max_frames == 1:
+        return frames[:1]
+    step = (len(frames) - 1) / (max_frames - 1)
+    return [frames[round(i * step)] for i in range(max_frames)]
+
+
+def extract_keyframes(source, threshold=DEFAULT_SCENE_THRESHOLD, max_frames=DEFAULT_MAX_KEYFRAMES):
+    """
+    Sample the frames of a video where the picture changes.
+
+    ffmpeg decodes the video once and keeps the frames whose difference
+    from the previous frame exceeds threshold; near duplicates are then
+    dropped and the rest thinned out to max_frames.
+    :param source: Local video file
+    :param threshold: Scene change score between 0 and 1
+    :param max_frames: Most frames returned
+    :return: List of Keyframe in time order
+    """
+    ffmpeg = find_ffmpeg()
+    with tempfile.TemporaryDirectory(prefix='devai-keyframes-') as directory:
+        pattern = os.path.join(directory, 'frame-%05d.jpg')
+        result = subprocess.run(ffmpeg_command(ffmpeg, source, pattern, threshold),
+                                capture_output=True, text=True, errors='replace')
+        if result.returncode != 0:
+            message = result.stderr.strip().splitlines()[-1:] or ['no output']
+            raise KeyframeError(f"ffmpeg failed on {source}: {message[0]}")
+        names = sorted(name for name in os.listdir(directory) if name.endswith('.jpg'))
+        timestamps = parse_timestamps(result.stderr)
+        frames = []
+        for index, name in enumerate(names):
+            with open(os.path.join(directory, name), 'rb') as f:
+                timestamp = timestamps[index] if index < len(timestamps) else 0.0
+                frames.append(Keyframe(timestamp, f.read()))
+    if not frames:
+        raise KeyframeError(f"ffmpeg found no frames in {source}")
+    return thin_out(drop_near_duplicates(frames), max_frames)
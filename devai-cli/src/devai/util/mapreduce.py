@@ -0,0 +1,172 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import re
+
+from json_repair import repair_json
+
+from devai.util.cache import DiskCache, cache_enabled, env_int, get_cache_dir
+
+# Tokens of context per map request; --shard-tokens overrides.
+DEFAULT_SHARD_TOKENS = 100000
+
+# Size bound and lifetime of the cached shard results.
+DEFAULT_SHARD_CACHE_BYTES = 64 * 1024 * 1024
+SHARD_CACHE_TTL = 7 * 24 * 3600
+
+# Ranking of the severities models report, most severe first.
+SEVERITY_ORDER = ('critical', 'high', 'medium', 'low')
+
+
+def shard_files(files, max_tokens):
+    """
+    Split the files of a context into shards that fit one request each.
+
+    Files stay in walk order and are grouped by directory, so a module lands
+    in as few shards as possible. Shards end at content-defined directory
+    boundaries: whether a shard closes after a directory depends only on
+    that directory's name and size, not on what came before it. An edit to
+    one directory therefore moves at most the boundaries up to the next
+    such cut, and the shards of the other directories keep their keys.
+    A shard also closes before a directory that would overflow it; a
+    directory larger than max_tokens is split, and a file larger than
+    max_tokens gets a shard of its own.
+    :param files: List of (file_path, block, tokens) in walk order
+    :param max_tokens: Token budget of one shard
+    :return: List of shards, each a list of (file_path, block, tokens)
+    """
+    groups = []
+    for entry in files:
+        directory = os.path.dirname(entry[0])
+        if groups and groups[-1][0] == directory:
+            groups[-1][1].append(entry)
+        else:
+            groups.append((directory, [entry]))
+
+    shards = []
+    current, current_tokens = [], 0
+    for directory, entries in groups:
+        group_tokens = sum(tokens for _, _, tokens in entries)
+        if current and current_tokens + group_tokens > max_tokens:
+            shards.append(current)
+            current, current_tokens = [], 0
+        for entry in entries:
+            if current and current_tokens + entry[2] > max_tokens:
+                shards.append(current)
+                current, current_tokens = [], 0
+            current.append(entry)
+            current_tokens += entry[2]
+        if _cut_after(directory, group_tokens, max_tokens):
+            shards.append(current)
+            current, current_tokens = [], 0
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _cut_after(directory, tokens, max_tokens):
+    # Close the shard after a directory with a chance proportional to its
+    # size, drawn from a hash of its name, so shards average about half the
+    # budget without depending on the directories before them.
+    draw = int.from_bytes(hashlib.sha256(directory.encode('utf-8')).digest()[:8], 'big') / 2 ** 64
+    return draw * max_tokens < 2 * tokens
+
+
+def shard_key(model_name, instruction, shard):
+    """
+    Cache key of one map request.
+    :param model_name: Model that reviews the shard
+    :param instruction: Map instruction
+    :param shard: List of (file_path, block, tokens)
+    :return: Hex digest
+    """
+    h = hashlib.sha256(f'{model_name}\0{instruction}\0'.encode('utf-8'))
+    for _, block, _ in shard:
+        h.update(block.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def parse_findings(text):
+    """
+    Read the JSON array of findings from a model response.
+    :param text: Response text, possibly fenced or slightly malformed
+    :return: List of finding dictionaries
+    """
+    text = re.sub(r'^\s*`+(?:json)?\s*|\s*`+\s*$', '', text or '')
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        try:
+            data = json.loads(repair_json(text))
+        except (ValueError, json.JSONDecodeError):
+            logging.warning("Could not parse findings from the model response")
+            return []
+    if isinstance(data, dict):
+        data = [data]
+    return [item for item in data if isinstance(item, dict)] if isinstance(data, list) else []
+
+
+def severity_rank(finding):
+    """Sort position of a finding's severity; unknown severities go last."""
+    severity = str(finding.get('severity') or '').strip().lower()
+    return SEVERITY_ORDER.index(severity) if severity in SEVERITY_ORDER else len(SEVERITY_ORDER)
+
+
+def _normalize(value):
+    return re.sub(r'\W+', ' ', str(value or '')).strip().lower()
+
+
+def reduce_findings(findings):
+    """
+    Merge the findings of all shards into one report.
+
+    Findings about the same place with the same issue type and description
+    are kept once, at the highest severity any shard gave them. The result
+    is ranked by severity, then by file, keeping the map order otherwise.
+    :param findings: Iterable of finding dictionaries
+    :return: List of finding dictionaries
+    """
+    merged = {}
+    for finding in findings:
+        key = tuple(_normalize(finding.get(field)) for field in
+                    ('file_name', 'class_name', 'method_name', 'issue_type', 'description'))
+        kept = merged.get(key)
+        if kept is None or severity_rank(finding) < severity_rank(kept):
+            merged[key] = finding
+    ranked = sorted(enumerate(merged.values()),
+                    key=lambda item: (severity_rank(item[1]), str(item[1].get('file_name') or ''), item[0]))
+    return [finding for _, finding in ranked]
+
+
+_shard_cache = None
+
+
+def get_shard_cache():
+    """
+    Process-wide cache of map results, or None when it is disabled.
+    :return: DiskCache or None
+    """
+    global _shard_cache
+    if not cache_enabled('shard'):
+        return None
+    path = get_cache_dir() / 'shards.db'
+    if _shard_cache is None or _shard_cache.path != path:
+        _shard_cache = DiskCache(
+            path, env_int('DEVAI_SHARD_CACHE_BYTES', DEFAULT_SHARD_CACHE_BYTES), ttl=SHARD_CACHE_TTL)
+    return _shard_cache
@@ -0,0 +1,100 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import mimetypes
+import os
+
+from devai.util.cache import env_int
+
+# Largest local video accepted; DEVAI_VIDEO_MAX_BYTES overrides.
+DEFAULT_VIDEO_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Videos up to this size are sent inline in the request; larger ones go
+# through Cloud Storage. Vertex AI rejects inline data much above 20 MB.
+INLINE_VIDEO_MAX_BYTES = 16 * 1024 * 1024
+
+# Size of the pieces a video is hashed and uploaded in.
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+
+# Object name prefix of uploaded videos inside the bucket.
+UPLOAD_PREFIX = 'devai/videos/'
+
+GCS_PREFIX = 'gs://'
+
+
+class MediaTooLarge(ValueError):
+    """Raised for a local file above the configured size limit."""
+
+
+def get_video_max_bytes():
+    return env_int('DEVAI_VIDEO_MAX_BYTES', DEFAULT_VIDEO_MAX_BYTES)
+
+
+def guess_video_mime_type(path):
+    """MIME type of a video from its name, video/mp4 when unknown."""
+    mime_type, _ = mimetypes.guess_type(path)
+    return mime_type if mime_type and mime_type.startswith('video/') else 'video/mp4'
+
+
+def check_video_size(path):
+    """
+    Reject a local video above the size limit before anything is read or sent.
+    :param path: Local file
+    :return: Size in bytes
+    """
+    size = os.path.getsize(path)
+    limit = get_video_max_bytes()
+    if size > limit:
+        raise MediaTooLarge(
+            f"{path} is {size / 1024 / 1024:,.1f} MiB, above the {limit / 1024 / 1024:,.1f} MiB limit "
+            f"(DEVAI_VIDEO_MAX_BYTES); trim it or upload it and pass its gs:// URI")
+    return size
+
+
+def file_digest(path, chunk_bytes=UPLOAD_CHUNK_BYTES):
+    """SHA-256 of a file, read in chunks so large files are never held in memory."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_bytes), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def upload_video(path, bucket_name, client=None):
+    """
+    Upload a local video to Cloud Storage in resumable chunks streamed from
+    disk. Objects are named by content hash, so a video uploaded before is
+    not sent again.
+    :param path: Local file
+    :param bucket_name: Bucket to upload to, with or without gs://
+    :param client: Optional storage.Client
+    :return: gs:// URI of the object
+    """
+    if client is None:
+        from google.cloud import storage
+        client = storage.Client()
+    bucket_name = bucket_name[len(GCS_PREFIX):] if bucket_name.startswith(GCS_PREFIX) else bucket_name
+    bucket_name, _, prefix = bucket_name.partition('/')
+    extension = os.path.splitext(path)[1].lower() or '.mp4'
+    name = f"{prefix.rstrip('/') + '/' if prefix else ''}{UPLOAD_PREFIX}{file_digest(path)}{extension}"
+
+    blob = client.bucket(bucket_name).blob(name, chunk_size=UPLOAD_CHUNK_BYTES)
+    uri = f"{GCS_PREFIX}{bucket_name}/{name}"
+    if blob.exists():
+        logging.info(f"{path} was uploaded before as {uri}")
+        return uri
+    blob.upload_from_filename(path, content_type=guess_video_mime_type(path))
+    return uri
@@ -0,0 +1,213 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import os
+import subprocess
+
+from devai.util.file_processor import (
+    BINARY_EXTENSIONS,
+    get_file_size,
+    get_max_file_bytes,
+    iter_context_files,
+    iter_file_paths,
+)
+from devai.util.git import get_repository
+
+# Rough local estimate; Gemini averages about four characters per token on code.
+CHARS_PER_TOKEN = 4
+
+# Files that usually explain how the rest of a project fits together.
+ENTRY_POINT_NAMES = frozenset([
+    '__main__.py', 'app.py', 'cli.py', 'main.py', 'manage.py', 'setup.py',
+    'pyproject.toml', 'requirements.txt', 'index.js', 'index.ts', 'main.go',
+    'main.rs', 'lib.rs', 'Main.java', 'Application.java', 'pom.xml',
+    'build.gradle', 'package.json', 'go.mod', 'Cargo.toml', 'Dockerfile',
+    'README.md',
+])
+
+# Allowance for a skipped file's placeholder block, on top of its path.
+PLACEHOLDER_CHARS = 96
+
+# Commits inspected when ranking recently changed files.
+RECENT_COMMITS = 20
+
+
+def estimate_tokens(text):
+    """
+    Estimate the token count of a text without calling the model.
+    :param text: Prompt text
+    :return: Estimated number of tokens
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_file_tokens(file_path):
+    """
+    Estimate the tokens of a file's context block from its size alone.
+
+    UTF-8 never decodes to more characters than it has bytes, so this is an
+    upper bound for text files. Files that will become a placeholder are
+    estimated at the placeholder's length.
+    :param file_path: Path to the file
+    :return: Estimated number of tokens
+    """
+    chars = len(file_path) + PLACEHOLDER_CHARS
+    if os.path.splitext(file_path)[1].lower() not in BINARY_EXTENSIONS:
+        size = get_file_size(file_path) or 0
+        max_bytes = get_max_file_bytes()
+        if not max_bytes or size <= max_bytes:
+            chars = max(chars, len(f"\nfile: {file_path}\ncontent:\n\n") + size)
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def explicit_paths(input):
+    """
+    Files named directly in the context rather than found by walking.
+    :param input: Context as accepted by iter_file_paths
+    :return: Set of paths
+    """
+    paths = [input] if isinstance(input, str) else list(input or [])
+    return {path for path in paths if os.path.isfile(path)}
+
+
+def recently_changed_files(input):
+    """
+    Files with uncommitted changes or touched by the last few commits of the
+    repository holding the context.
+    :param input: Context as accepted by iter_file_paths
+    :return: Set of absolute paths, empty outside a git work tree
+    """
+    paths = [input] if isinstance(input, str) else list(input or [])
+    start = next((p for p in paths if os.path.exists(p)), None)
+    if start is None:
+        return set()
+    directory = start if os.path.isdir(start) else os.path.dirname(start) or '.'
+
+    try:
+        root = get_repository(directory).run("rev-parse", "--show-toplevel", timeout=10).strip()
+        repository = get_repository(root)
+        names = [line[3:].rstrip('\n') for line in repository.stream(
+            "status", "--porcelain", "--no-renames", timeout=30) if len(line) > 4]
+        names.extend(line.rstrip('\n') for line in repository.stream(
+            "log", "-n", str(RECENT_COMMITS), "--name-only", "--pretty=format:", timeout=30) if line.strip())
+    except (OSError, subprocess.SubprocessError) as e:
+        logging.debug(f"Could not list recent changes: {e}")
+        return set()
+
+    return {os.path.join(root, name) for name in names}
+
+
+class ContextPack:
+    """
+    Result of fitting a context into a token budget.
+
+    included holds (file_path, block, tokens) in walk order, dropped holds
+    (file_path, tokens, reason).
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.included = []
+        self.dropped = []
+
+    @property
+    def tokens(self):
+        return sum(tokens for _, _, tokens in self.included)
+
+    def parts(self, header=None):
+        """Prompt parts for the included files, optionally after a header."""
+        parts = [header] if header else []
+        parts.extend(block for _, block, _ in self.included)
+        return parts
+
+    def manifest(self, verbose=False):
+        """
+        Human readable summary of what was packed.
+        :param verbose: List every included file, not only the dropped ones
+        :return: List of lines
+        """
+        lines = [
+            f"Context: {len(self.included)} files, ~{self.tokens:,} tokens "
+            f"(budget {self.budget:,}), {len(self.dropped)} dropped"
+        ]
+        if verbose:
+            lines.extend(f"  + {path} (~{tokens:,} tokens)" for path, _, tokens in self.included)
+        lines.extend(f"  - {path} (~{tokens:,} tokens): {reason}" for path, tokens, reason in self.dropped)
+        return lines
+
+
+def pack_context(input, budget, reserved_tokens=0, rejected=None):
+    """
+    Fit the files of a context into a token budget.
+
+    Files are ranked by priority: paths named explicitly, then recently
+    changed files, then entry points, then smaller files first. The ranked
+    files are taken greedily while their size based estimate fits, and only
+    those are read and formatted, so dropped files are never decoded. Any
+    room left because a kept file came out smaller than estimated is offered
+    to the dropped files in a second round. The kept files go back into walk
+    order so the prompt reads like the tree.
+    :param input: Context as accepted by iter_file_paths
+    :param budget: Token budget for the whole request
+    :param reserved_tokens: Tokens already used by instructions and headers
+    :param rejected: Optional dictionary collecting skipped files and reasons
+    :return: ContextPack
+    """
+    pack = ContextPack(budget)
+    explicit = {os.path.abspath(path) for path in explicit_paths(input)}
+    recent = recently_changed_files(input)
+
+    candidates = []
+    for index, file_path in enumerate(iter_file_paths(input, rejected)):
+        full_path = os.path.abspath(file_path)
+        tokens = estimate_file_tokens(file_path)
+        priority = (
+            full_path not in explicit,
+            full_path not in recent,
+            os.path.basename(file_path) not in ENTRY_POINT_NAMES,
+            tokens,
+        )
+        candidates.append((priority, index, file_path, tokens))
+    candidates.sort(key=lambda c: (c[0], c[1]))
+
+    remaining = budget - reserved_tokens
+    kept = []
+    while candidates:
+        chosen, skipped = [], []
+        for candidate in candidates:
+            if candidate[3] <= remaining:
+                remaining -= candidate[3]
+                chosen.append(candidate)
+            else:
+                skipped.append(candidate)
+        if not chosen:
+            break
+
+        # Settle each estimate against the formatted block; a kept file that
+        # came out smaller hands the difference back to the dropped ones.
+        blocks = iter_context_files([file_path for _, _, file_path, _ in chosen], rejected)
+        for (priority, index, file_path, estimate), (_, block) in zip(chosen, blocks):
+            tokens = estimate_tokens(block)
+            if tokens - estimate > remaining:
+                remaining += estimate
+                pack.dropped.append((file_path, tokens, 'over token budget'))
+                continue
+            remaining += estimate - tokens
+            kept.append((index, file_path, block, tokens))
+        candidates = skipped
+
+    pack.dropped.extend((file_path, tokens, 'over token budget') for _, _, file_path, tokens in candidates)
+    pack.included = [(file_path, block, tokens) for _, file_path, block, tokens in sorted(kept)]
+    return pack
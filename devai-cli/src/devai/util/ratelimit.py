@@ -0,0 +1,169 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: the rate is only shared within the process
+    fcntl = None
+
+from devai.util.cache import get_cache_dir
+
+# Requests per second a fresh controller starts at, and the bounds it moves
+# between; DEVAI_<NAME>_MAX_RPS overrides the upper bound.
+INITIAL_RATE = 1.0
+MIN_RATE = 0.05
+DEFAULT_MAX_RATE = 20.0
+
+# Requests that may be sent back to back after an idle period.
+BURST = 4
+
+# Additive increase per successful request, in requests per second, and the
+# multiplicative decrease on a quota error.
+RATE_INCREASE = 0.1
+RATE_DECREASE = 0.5
+
+# Quota errors within this many seconds of a decrease count as the same
+# congestion event and do not cut the rate again.
+DECREASE_HOLDOFF = 2.0
+
+# State untouched for this long is stale and starts over from INITIAL_RATE.
+STALE_AFTER = 600
+
+
+def rate_limit_enabled():
+    """DEVAI_RATE_LIMIT=0 switches the rate controller off."""
+    return os.getenv('DEVAI_RATE_LIMIT', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+class RateController:
+    """
+    Additive-increase/multiplicative-decrease rate limit shared by every devai
+    process of the machine.
+
+    The rate and a token bucket live in a small JSON file under the cache
+    directory, read and written under an exclusive lock, so concurrent CLI
+    runs draw from one budget: each success raises the rate a little, a quota
+    error halves it, and aggregate throughput settles just under the quota
+    instead of every process retrying at once.
+    """
+
+    def __init__(self, path, max_rate=DEFAULT_MAX_RATE):
+        self.path = path
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+
+    def _update(self, change):
+        """Apply change(state, now) to the shared state under the lock and return its result."""
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a+', encoding='utf-8') as f:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    now = time.time()
+                    try:
+                        state = json.loads(f.read() or '{}')
+                    except ValueError:
+                        state = {}
+                    if not state or now - state.get('updated', 0) > STALE_AFTER:
+                        state = {'rate': INITIAL_RATE, 'tokens': BURST, 'updated': now, 'decreased': 0}
+                    result = change(state, now)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                    return result
+                finally:
+                    if fcntl:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def reserve(self):
+        """
+        Take a slot for one request.
+        :return: Seconds to wait before sending it
+        """
+        def take(state, now):
+            rate = state['rate']
+            tokens = min(BURST, state['tokens'] + (now - state['updated']) * rate)
+            # The bucket may go negative: later callers queue behind earlier ones.
+            state['tokens'] = tokens - 1
+            state['updated'] = now
+            return 0.0 if tokens >= 1 else (1 - tokens) / rate
+        return self._update(take)
+
+    def acquire(self):
+        """Wait for a slot for one request."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        """Asynchronous version of acquire(); the locked file is read off the event loop."""
+        delay = await asyncio.to_thread(self.reserve)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def succeeded(self):
+        """Raise the rate after a request went through."""
+        def increase(state, now):
+            state['rate'] = min(self.max_rate, state['rate'] + RATE_INCREASE)
+        self._update(increase)
+
+    def throttled(self):
+        """Cut the rate after a request was rejected for quota."""
+        def decrease(state, now):
+            if now - state['decreased'] < DECREASE_HOLDOFF:
+                return
+            state['rate'] = max(MIN_RATE, state['rate'] * RATE_DECREASE)
+            state['tokens'] = min(state['tokens'], 0)
+            state['decreased'] = now
+            logging.info(f"Quota error, lowering the request rate to {state['rate']:.2f}/s")
+        self._update(decrease)
+
+    def rate(self):
+        """Current shared rate in requests per second."""
+        return self._update(lambda state, now: state['rate'])
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_rate_controller(name):
+    """
+    Process-wide controller for one kind of request, or None when rate
+    limiting is switched off.
+    :param name: Kind of request, e.g. 'model' or 'embedding'
+    :return: RateController or None
+    """
+    if not rate_limit_enabled():
+        return None
+    path = str(get_cache_dir() / 'ratelimit' / f'{name}.json')
+    try:
+        max_rate = float(os.getenv(f'DEVAI_{name.upper()}_MAX_RPS', DEFAULT_MAX_RATE))
+    except ValueError:
+        max_rate = DEFAULT_MAX_RATE
+    with _controllers_lock:
+        controller = _controllers.get(name)
+        if controller is None or controller.path != path or controller.max_rate != max_rate:
+            controller = _controllers[name] = RateController(path, max_rate)
+        return controller
@@ -0,0 +1,181 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+# Default location of the incremental review state, relative to the working directory.
+DEFAULT_STATE_FILE = os.path.join('.devai', 'review-state.json')
+
+# Bump when the layout of the state file changes.
+STATE_VERSION = 1
+
+
+def content_hash(block):
+    """Hash of a formatted file block, which holds both its path and contents."""
+    return hashlib.sha256(block.encode('utf-8')).hexdigest()
+
+
+def prompt_version(instruction):
+    """Short hash identifying the instruction a finding was produced with."""
+    return hashlib.sha256(instruction.encode('utf-8')).hexdigest()[:16]
+
+
+def _strip_dot(path):
+    while path.startswith('./'):
+        path = path[2:]
+    return path
+
+
+def assign_findings(findings, paths):
+    """
+    Attribute the findings of one review request to the files it covered.
+
+    A finding belongs to the file named in its file_name, allowing for the
+    model shortening or lengthening the path, and its file_name is set to
+    that file's path. Findings that name no file of the request are returned
+    apart and left as the model wrote them.
+    :param findings: List of finding dictionaries
+    :param paths: Paths of the files sent in the request, in order
+    :return: Tuple of (dictionary mapping every path to its list of
+             findings, list of the findings that match no path)
+    """
+    assigned = {path: [] for path in paths}
+    unmatched = []
+    for finding in findings:
+        name = _strip_dot(str(finding.get('file_name') or '').strip())
+        match = next((path for path in paths if _strip_dot(path) == name), None)
+        if match is None and name:
+            match = next((path for path in paths
+                          if path.endswith('/' + name) or name.endswith('/' + _strip_dot(path))), None)
+        if match is None:
+            unmatched.append(finding)
+            continue
+        finding['file_name'] = match
+        assigned[match].append(finding)
+    return assigned, unmatched
+
+
+class ReviewState:
+    """
+    Findings of previous reviews, per file.
+
+    An entry is current when the file's content hash, the prompt version and
+    the model all match the ones it was reviewed with. Findings of a request
+    that name none of its files are kept per request instead, and dropped
+    as soon as any file of that request changes.
+    """
+
+    def __init__(self, path, prompt_version, model_name, files=None, requests=None):
+        self.path = path
+        self.prompt_version = prompt_version
+        self.model_name = model_name
+        self.files = files or {}
+        self.requests = requests or {}
+
+    @classmethod
+    def load(cls, path, prompt_version, model_name):
+        """
+        Read the state file; a missing, unreadable or outdated file gives an
+        empty state.
+        :param path: State file
+        :param prompt_version: Version of the review instruction in use
+        :param model_name: Model in use
+        :return: ReviewState
+        """
+        files = {}
+        requests = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STATE_VERSION:
+                files = data.get('files', {})
+                requests = data.get('requests', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Ignoring unreadable review state {path}: {e}")
+        return cls(path, prompt_version, model_name, files, requests)
+
+    def is_current(self, file_path, digest):
+        entry = self.files.get(file_path)
+        return (entry is not None and entry.get('hash') == digest
+                and entry.get('prompt') == self.prompt_version and entry.get('model') == self.model_name)
+
+    def update(self, file_path, digest, findings):
+        self.files[file_path] = {
+            'hash': digest,
+            'prompt': self.prompt_version,
+            'model': self.model_name,
+            'findings': findings,
+        }
+
+    def discard(self, file_path):
+        """Forget the findings of a file, so the next run reviews it again."""
+        self.files.pop(file_path, None)
+
+    def update_request(self, digests, findings):
+        """
+        Keep the findings of a request that name none of its files.
+        :param digests: Dictionary mapping the paths of the request's files
+                        to their content hashes
+        :param findings: List of finding dictionaries
+        """
+        if not findings:
+            return
+        key = content_hash(json.dumps(sorted(digests.items())))
+        self.requests[key] = {
+            'files': digests,
+            'prompt': self.prompt_version,
+            'model': self.model_name,
+            'findings': findings,
+        }
+
+    def prune(self, digests):
+        """
+        Forget the files that are no longer part of the context, and the
+        requests any of whose files left the context or changed.
+        :param digests: Dictionary mapping the paths in the current context
+                        to their content hashes
+        :return: List of the paths that were dropped
+        """
+        removed = [path for path in self.files if path not in digests]
+        for path in removed:
+            del self.files[path]
+        for key, entry in list(self.requests.items()):
+            if (entry.get('prompt') != self.prompt_version or entry.get('model') != self.model_name
+                    or any(digests.get(path) != digest for path, digest in entry.get('files', {}).items())):
+                del self.requests[key]
+        return removed
+
+    def findings(self):
+        """All findings in the state, in file order, then those of whole requests."""
+        entries = [*self.files.values(), *self.requests.values()]
+        return [finding for entry in entries for finding in entry.get('findings', [])]
+
+    def save(self):
+        """Write the state atomically, creating its directory if needed."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.review-state-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'version': STATE_VERSION, 'files': self.files, 'requests': self.requests}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
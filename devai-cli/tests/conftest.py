@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 import os
 import sys
 
@@ -13,4 +14,73 @@ def test_data_dir():
 @pytest.fixture
 def sample_prompt_file(test_data_dir):
     """Fixture to provide a path to a sample prompt file."""
-    return os.path.join(test_data_dir, 'sample_prompt.yaml') 
\ No newline at end of file
+    return os.path.join(test_data_dir, 'sample_prompt.yaml') 
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(tmp_path_factory, monkeypatch):
+    """Keep the on-disk caches of every test out of the user's home directory."""
+    cache_dir = tmp_path_factory.mktemp('devai-cache')
+    monkeypatch.setenv('DEVAI_CACHE_DIR', str(cache_dir))
+    return cache_dir
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """
+    Stand-in for vertexai's GenerativeModel that records every call as
+    (system_instruction, contents).
+
+    reply is the response text, a list of the chunks a streamed response is
+    made of, or a callable taking (system_instruction, contents) and
+    returning either; it may raise to fail the call. Async calls take delay
+    seconds, and the most calls in flight at once is kept.
+    """
+    reply = 'No major issues found.'
+    delay = 0
+
+    def __init__(self, model_name, system_instruction=None):
+        self.system_instruction = system_instruction
+
+    def start_chat(self, **kwargs):
+        raise AssertionError('commands should not open a chat')
+
+    def generate_content(self, contents, generation_config=None, stream=False):
+        fake = type(self)
+        fake.calls.append((self.system_instruction, contents))
+        reply = fake.reply(self.system_instruction, contents) if callable(fake.reply) else fake.reply
+        chunks = [reply] if isinstance(reply, str) else list(reply)
+        if stream:
+            return iter([FakeResponse(chunk) for chunk in chunks])
+        return FakeResponse(''.join(chunks))
+
+    async def generate_content_async(self, contents, generation_config=None):
+        fake = type(self)
+        fake.in_flight += 1
+        fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+        try:
+            await asyncio.sleep(fake.delay)
+            return self.generate_content(contents, generation_config)
+        finally:
+            fake.in_flight -= 1
+
+
+@pytest.fixture
+def fake_model(request, monkeypatch):
+    """
+    Replace the model and the prompt overrides for a command test, offline
+    and without rate limiting. Returns the fake model class; set its reply
+    or delay, or parametrize the fixture indirectly with a dictionary of
+    them.
+    """
+    fake = type('FakeModel', (FakeModel,), {'calls': [], 'in_flight': 0, 'max_in_flight': 0})
+    for name, value in getattr(request, 'param', {}).items():
+        setattr(fake, name, value)
+    monkeypatch.setattr('devai.commands.models.GenerativeModel', fake)
+    monkeypatch.setattr('devai.commands.review.get_prompt', lambda secret_id: None)
+    monkeypatch.setenv('DEVAI_OFFLINE', '1')
+    monkeypatch.setenv('DEVAI_RATE_LIMIT', '0')
+    return fake
@@ -0,0 +1,120 @@
+import json
+import warnings
+
+import pytest
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from devai.commands.batch import batch
+from devai.util.batch_state import read_batch_manifest
+
+
+def review(fail=()):
+    """Model reply that fails the requests whose context mentions a name in fail."""
+    def reply(instruction, contents):
+        context = ''.join(contents)
+        for name in fail:
+            if name in context:
+                raise RuntimeError(f'{name} failed')
+        return 'No major issues found.'
+    return reply
+
+
+@pytest.fixture
+def repos(tmp_path, fake_model):
+    for name in ('ledger', 'frontend'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / f'{name}.py').write_text(f'print("{name}")\n')
+    manifest = tmp_path / 'repos.txt'
+    manifest.write_text(f"# weekly run\n{tmp_path / 'ledger'}\n"
+                        + json.dumps({'repo': str(tmp_path / 'frontend'), 'types': ['security', 'performance']})
+                        + '\n')
+    return tmp_path
+
+
+def run_batch(repos, *args):
+    return CliRunner(mix_stderr=False).invoke(
+        batch, [*args, '-m', str(repos / 'repos.txt'), '--checkpoint', str(repos / 'batch.db')])
+
+
+def test_read_batch_manifest():
+    lines = ['# comment', 'services/ledger', '{"repo": "web", "types": "security"}', '']
+    assert read_batch_manifest(lines, ['code']) == [('services/ledger', ['code']), ('web', ['security'])]
+    with pytest.raises(ValueError):
+        read_batch_manifest(['{"types": []}'], ['code'])
+
+
+def test_run_writes_one_line_per_item_and_resumes(repos, fake_model):
+    fake_model.reply = review(fail={'frontend'})
+
+    result = run_batch(repos, 'run', '--no-cache')
+
+    assert result.exit_code == 1
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert sorted((line['type'], line['status']) for line in lines) == [
+        ('code', 'done'), ('performance', 'failed'), ('security', 'failed')]
+    assert len(fake_model.calls) == 3
+
+    fake_model.reply = review()
+    fake_model.calls.clear()
+    result = run_batch(repos, 'run', '--no-cache')
+
+    assert result.exit_code == 0
+    assert 'Skipping 1 items' in result.stderr
+    assert sorted(json.loads(line)['type'] for line in result.stdout.splitlines()) == ['performance', 'security']
+    assert all('frontend' in ''.join(contents) for _, contents in fake_model.calls)
+
+
+def test_export_and_import_predictions(repos, fake_model):
+    result = run_batch(repos, 'export')
+
+    assert result.exit_code == 0
+    requests = [json.loads(line) for line in result.stdout.splitlines()]
+    assert len(requests) == 3
+    assert requests[0]['request']['contents'][0]['parts'][0]['text'] == '### Context (code) ###'
+
+    predictions = repos / 'predictions.jsonl'
+    # The job echoes the requests with its own defaults filled in.
+    predictions.write_text(''.join(
+        json.dumps({'request': {**request['request'], 'generationConfig': {}}, 'status': '',
+                    'response': {'candidates': [{'content': {'parts': [{'text': 'Looks fine.'}]}}]}}) + '\n'
+        for request in requests))
+    result = CliRunner(mix_stderr=False).invoke(
+        batch, ['import', '-p', str(predictions), '--checkpoint', str(repos / 'batch.db')])
+
+    assert result.exit_code == 0
+    assert [json.loads(line)['response'] for line in result.stdout.splitlines()] == ['Looks fine.'] * 3
+
+    result = run_batch(repos, 'run')
+    assert 'Skipping 3 items' in result.stderr
+    assert fake_model.calls == []
+
+
+def test_import_without_matching_requests_fails(repos, fake_model):
+    assert run_batch(repos, 'export').exit_code == 0
+    predictions = repos / 'predictions.jsonl'
+    predictions.write_text(json.dumps({'request': {'contents': []}, 'status': '', 'response': {}}) + '\n')
+
+    result = CliRunner(mix_stderr=False).invoke(
+        batch, ['import', '-p', str(predictions), '--checkpoint', str(repos / 'batch.db')])
+
+    assert result.exit_code == 1
+    assert 'None of the predictions' in result.stderr
+
+
+def test_changed_files_and_new_run_id_run_again(repos, fake_model):
+    assert run_batch(repos, 'run', '--no-cache').exit_code == 0
+    fake_model.calls.clear()
+
+    (repos / 'ledger' / 'ledger.py').write_text('print("ledger, this week")\n')
+    result = run_batch(repos, 'run', '--no-cache')
+
+    assert 'Skipping 2 items' in result.stderr
+    assert [json.loads(line)['repo'] for line in result.stdout.splitlines()] == [str(repos / 'ledger')]
+
+    fake_model.calls.clear()
+    result = run_batch(repos, 'run', '--no-cache', '--run-id', '2026-w42')
+    assert len(fake_model.calls) == 3
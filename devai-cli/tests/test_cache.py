@@ -0,0 +1,103 @@
+import os
+import sqlite3
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+import devai.util.cache as cache_module
+import devai.util.file_processor as file_processor
+from devai.util.cache import DiskCache, get_context_cache
+from devai.util.file_processor import format_files_as_string
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    """Entries beyond the size bound are evicted oldest first."""
+    cache = DiskCache(tmp_path / 'lru.db', max_bytes=10)
+    cache.put('a', 'aaaa')
+    cache.put('b', 'bbbb')
+    cache.flush()
+    assert cache.get('a') == 'aaaa'
+    cache.flush()
+
+    cache.put('c', 'cccc')
+    cache.flush()
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'aaaa'
+    assert cache.get('c') == 'cccc'
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_disk_cache_expires_entries(tmp_path, monkeypatch):
+    """Entries older than the TTL are treated as misses."""
+    cache = DiskCache(tmp_path / 'ttl.db', max_bytes=1000, ttl=60)
+    cache.put('key', 'value')
+    cache.flush()
+    assert cache.get('key') == 'value'
+
+    now = cache_module.time.time()
+    monkeypatch.setattr(cache_module.time, 'time', lambda: now + 120)
+    assert cache.get('key') is None
+
+
+def test_unchanged_files_are_served_without_reading(tmp_path, monkeypatch):
+    """A second build of the same tree does not open any file."""
+    (tmp_path / 'src').mkdir()
+    (tmp_path / 'src' / 'a.py').write_text('a = 1\n')
+    (tmp_path / 'src' / 'b.py').write_text('b = 2\n')
+    context = str(tmp_path / 'src')
+
+    first = format_files_as_string(context)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("file was read despite an unchanged cache entry")
+
+    monkeypatch.setattr(file_processor, 'read_file_bytes', fail)
+    assert format_files_as_string(context) == first
+
+
+def test_touched_files_fall_back_to_the_content_hash(tmp_path):
+    """A changed mtime with the same contents reuses the cached block."""
+    source = tmp_path / 'a.py'
+    source.write_text('a = 1\n')
+    first = format_files_as_string(str(source))
+
+    stat = os.stat(source)
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    cache = get_context_cache()
+    hits = cache.hits
+    assert format_files_as_string(str(source)) == first
+    assert cache.hits == hits + 1
+
+    source.write_text('a = 2\n')
+    assert 'a = 2' in format_files_as_string(str(source))
+
+
+def test_writes_do_not_hold_the_cache_file_locked(tmp_path):
+    """Another process can write as soon as an entry is stored."""
+    cache = DiskCache(tmp_path / 'shared.db', max_bytes=1000)
+    cache.put('a', 'aaaa')
+
+    other = sqlite3.connect(str(tmp_path / 'shared.db'), timeout=0.1)
+    other.execute("INSERT INTO entries VALUES ('b', 'bbbb', 4, 0, 0)")
+    other.commit()
+    other.close()
+    assert cache.get('b') == 'bbbb'
+
+
+def test_locked_context_cache_falls_back_to_reading(tmp_path):
+    source = tmp_path / 'a.py'
+    source.write_text('a = 1\n')
+
+    class LockedCache:
+        def lookup(self, file_path, st):
+            raise sqlite3.OperationalError('database is locked')
+
+    assert 'a = 1' in file_processor.format_file(str(source), cache=LockedCache())
+
+
+def test_context_cache_can_be_disabled(monkeypatch):
+    monkeypatch.setenv('DEVAI_CONTEXT_CACHE', '0')
+    assert get_context_cache() is None
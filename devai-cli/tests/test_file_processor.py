@@ -0,0 +1,176 @@
+import pytest
+import io
+import mmap
+import os
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from devai.util.file_processor import (
+    read_text_file,
+    is_ascii_text,
+    get_text_files_contents,
+    format_files_as_string,
+    format_files_as_parts,
+    write_formatted_files,
+    iter_formatted_files,
+    iter_file_paths,
+    resolve_context,
+    format_file,
+    read_file_bytes,
+    release_buffer,
+    MMAP_THRESHOLD,
+)
+
+
+@pytest.fixture
+def sample_tree(tmp_path):
+    """Create a small source tree with text and binary files."""
+    (tmp_path / 'main.py').write_text('print("hello")\n')
+    (tmp_path / 'notes.txt').write_bytes(b'line one\r\nline two\r\n')
+    (tmp_path / 'logo.png').write_bytes(b'\x89PNG\r\n\x1a\n' + b'\x00' * 16)
+    (tmp_path / 'blob.dat').write_bytes(b'abc\x00def')
+    (tmp_path / 'latin1.txt').write_bytes('caf\xe9'.encode('latin-1'))
+    return tmp_path
+
+
+def test_read_text_file_returns_contents(sample_tree):
+    """Text files are decoded from a single read."""
+    content, reason = read_text_file(str(sample_tree / 'main.py'))
+    assert reason is None
+    assert content == 'print("hello")\n'
+
+
+def test_read_text_file_normalizes_newlines(sample_tree):
+    """Contents match what text mode reading used to return."""
+    content, reason = read_text_file(str(sample_tree / 'notes.txt'))
+    assert reason is None
+    assert content == 'line one\nline two\n'
+
+
+def test_read_text_file_reports_reasons(sample_tree):
+    """Rejected files come back with the reason they were rejected."""
+    assert read_text_file(str(sample_tree / 'logo.png')) == (None, 'binary file extension')
+    assert read_text_file(str(sample_tree / 'blob.dat')) == (None, 'contains NUL bytes')
+    assert read_text_file(str(sample_tree / 'latin1.txt')) == (None, 'not valid UTF-8')
+
+
+def test_read_text_file_detects_magic_numbers(tmp_path):
+    """Binary signatures are caught even without a telling extension."""
+    archive = tmp_path / 'bundle'
+    archive.write_bytes(b'PK\x03\x04rest-of-archive')
+    assert read_text_file(str(archive)) == (None, 'binary file signature')
+    assert not is_ascii_text(str(archive))
+
+
+def test_get_text_files_contents_collects_rejections(sample_tree):
+    """Only text files are returned and the rest are reported."""
+    rejected = {}
+    contents = get_text_files_contents(str(sample_tree), rejected=rejected)
+
+    assert sorted(os.path.basename(p) for p in contents) == ['main.py', 'notes.txt']
+    assert sorted(os.path.basename(p) for p in rejected) == ['blob.dat', 'latin1.txt', 'logo.png']
+
+
+def test_format_files_as_string_marks_binary_files(sample_tree):
+    """Binary files keep their placeholder entry in the formatted context."""
+    files = [str(sample_tree / 'main.py'), str(sample_tree / 'logo.png')]
+    formatted = format_files_as_string(files)
+
+    assert f"\nfile: {files[0]}\ncontent:\nprint(\"hello\")\n\n" in formatted
+    assert f"file: {files[1]}\nsource: [Binary File - Not ASCII Text]\n" in formatted
+
+
+def test_format_files_as_parts_yields_one_part_per_file(sample_tree):
+    """The context is split into a header and one block per file."""
+    files = [str(sample_tree / 'main.py'), str(sample_tree / 'notes.txt')]
+    parts = format_files_as_parts(files, header="### Context (code) ###")
+
+    assert parts[0] == "### Context (code) ###"
+    assert len(parts) == 3
+    assert "".join(parts[1:]) == format_files_as_string(files)
+
+
+def test_write_formatted_files_matches_string(sample_tree):
+    """Writing to a stream produces the same context as the string builder."""
+    stream = io.StringIO()
+    write_formatted_files(str(sample_tree), stream)
+    assert stream.getvalue() == format_files_as_string(str(sample_tree))
+
+
+def test_parallel_reading_keeps_walk_order(sample_tree):
+    """The context is identical no matter how many readers are used."""
+    for index in range(20):
+        (sample_tree / f'module_{index:02d}.py').write_text(f'value = {index}\n')
+
+    serial = list(iter_formatted_files(str(sample_tree), workers=1))
+    parallel = list(iter_formatted_files(str(sample_tree), workers=8))
+    assert parallel == serial
+
+
+def test_globs_and_files_from(sample_tree):
+    """Globs are expanded in sorted order and --files-from lines are appended."""
+    (sample_tree / 'pkg').mkdir()
+    (sample_tree / 'pkg' / 'util.py').write_text('pass\n')
+
+    paths = list(iter_file_paths(str(sample_tree / '**' / '*.py')))
+    assert [os.path.basename(p) for p in paths] == ['main.py', 'util.py']
+
+    files_from = io.StringIO(f"{sample_tree / 'notes.txt'}\n\n{sample_tree / 'main.py'}\n")
+    context = resolve_context(str(sample_tree / 'pkg'), files_from)
+    assert [os.path.basename(p) for p in iter_file_paths(context)] == ['util.py', 'notes.txt', 'main.py']
+
+
+def test_walk_honors_ignore_files_and_skips_generated_files(tmp_path):
+    """Ignore files, default names and generated files are left out of the context."""
+    (tmp_path / '.gitignore').write_text('*.log\nbuild/\n')
+    (tmp_path / '.devaiignore').write_text('fixtures/\n')
+    for directory in ['src', 'build', 'fixtures', 'node_modules/lib']:
+        (tmp_path / directory).mkdir(parents=True)
+    (tmp_path / 'src' / 'app.py').write_text('print("app")\n')
+    (tmp_path / 'src' / 'debug.log').write_text('noise\n')
+    (tmp_path / 'build' / 'out.py').write_text('print("out")\n')
+    (tmp_path / 'fixtures' / 'big.json').write_text('{}\n')
+    (tmp_path / 'node_modules' / 'lib' / 'index.js').write_text('module.exports = {}\n')
+    (tmp_path / 'src' / 'bundle.min.js').write_text('var a=1;\n')
+    (tmp_path / 'package-lock.json').write_text('{}\n')
+
+    rejected = {}
+    paths = list(iter_file_paths(str(tmp_path), rejected))
+
+    assert [os.path.relpath(p, tmp_path) for p in paths] == [os.path.join('src', 'app.py')]
+    assert sorted(rejected.values()) == ['dependency lockfile', 'generated file']
+
+
+def test_files_over_the_size_cap_are_skipped(tmp_path, monkeypatch):
+    """Oversized files are reported instead of being read into memory."""
+    large = tmp_path / 'large.sql'
+    large.write_text('select 1;\n' * 100)
+
+    content, reason = read_text_file(str(large), max_bytes=100)
+    assert content is None
+    assert reason == 'exceeds size cap (1000 > 100 bytes)'
+
+    monkeypatch.setenv('DEVAI_MAX_FILE_BYTES', '100')
+    assert format_file(str(large)) == f"file: {large}\nsource: [Skipped - {reason}]\n"
+
+
+def test_large_files_are_memory_mapped(tmp_path):
+    """Files over the threshold are mapped, not copied, and decode the same."""
+    dump = tmp_path / 'dump.sql'
+    dump.write_bytes(b'insert into t values (1);\r\n' * (MMAP_THRESHOLD // 20))
+
+    data, reason = read_file_bytes(str(dump), max_bytes=0)
+    assert reason is None
+    assert isinstance(data, mmap.mmap)
+    release_buffer(data)
+    assert data.closed
+
+    content, reason = read_text_file(str(dump), max_bytes=0)
+    assert content == 'insert into t values (1);\n' * (MMAP_THRESHOLD // 20)
+
+    generated = tmp_path / 'schema.sql'
+    generated.write_bytes(b'-- Code generated by sqlc. DO NOT EDIT.\n' + b'select 1;\n' * MMAP_THRESHOLD)
+    assert read_text_file(str(generated), max_bytes=0) == (None, 'generated file header')
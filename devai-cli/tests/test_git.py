@@ -0,0 +1,124 @@
+import os
+import pytest
+import subprocess
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from devai.util.git import GitRepository
+from devai.util.file_processor import (
+    format_files_as_string,
+    iter_file_paths,
+    list_changes,
+    list_commits_for_tags,
+    list_files,
+    list_tags,
+)
+from devai.util.packer import pack_context
+
+
+def git(repo, *args):
+    return subprocess.check_output(['git', *args], cwd=repo, text=True)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A repository with three commits, one packed tag and two loose ones."""
+    git(tmp_path, 'init', '-q')
+    git(tmp_path, 'config', 'user.email', 'dev@example.com')
+    git(tmp_path, 'config', 'user.name', 'Dev')
+    for index, tag in enumerate(['v1.0', 'release/v1.1', 'v2.0']):
+        (tmp_path / 'app.py').write_text(f'VERSION = {index}\n')
+        git(tmp_path, 'add', 'app.py')
+        git(tmp_path, 'commit', '-q', '-m', f'Release {tag}')
+        git(tmp_path, 'tag', tag)
+        if index == 0:
+            git(tmp_path, 'pack-refs', '--all')
+    return tmp_path
+
+
+def test_tags_are_read_without_git(repo, monkeypatch):
+    """Loose and packed tags come back in the order 'git tag' prints them."""
+    expected = git(repo, 'tag').split()
+
+    def no_git(*args, **kwargs):
+        raise AssertionError('git should not be started')
+
+    monkeypatch.setattr(subprocess, 'Popen', no_git)
+    assert GitRepository(str(repo)).tags() == expected == ['release/v1.1', 'v1.0', 'v2.0']
+
+
+def test_stream_yields_lines_and_reports_failures(repo):
+    repository = GitRepository(str(repo))
+    assert [line.rstrip('\n') for line in repository.stream('log', '--pretty=format:%s')] == [
+        'Release v2.0', 'Release release/v1.1', 'Release v1.0']
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        repository.run('log', 'no-such-revision')
+    assert 'no-such-revision' in error.value.stderr
+
+
+def test_file_processor_helpers_use_the_shared_repository(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    assert list_tags() == ['release/v1.1', 'v1.0', 'v2.0']
+    assert len(list_commits_for_tags('v1.0', 'HEAD')) == 3
+    assert list_files('v1.0', 'v2.0') == ['app.py']
+    assert '+VERSION = 2' in list_changes('v1.0', 'v2.0')
+
+
+def test_git_context_reads_the_revision_not_the_working_tree(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    (repo / 'lib').mkdir()
+    (repo / 'lib' / 'util.py').write_text('pass\n')
+    (repo / 'package-lock.json').write_text('{}\n')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-q', '-m', 'Add lib')
+    git(repo, 'rm', '-q', 'lib/util.py')
+    git(repo, 'commit', '-q', '-m', 'Drop lib')
+    (repo / 'app.py').write_text('VERSION = "dirty"\n')
+
+    rejected = {}
+    assert list(iter_file_paths('git:HEAD~1', rejected)) == ['git:HEAD~1:app.py', 'git:HEAD~1:lib/util.py']
+    assert rejected == {'git:HEAD~1:package-lock.json': 'dependency lockfile'}
+    assert list(iter_file_paths('git:HEAD~1:lib')) == ['git:HEAD~1:lib/util.py']
+
+    formatted = format_files_as_string(['git:v1.0:app.py', 'git:HEAD:lib/util.py'])
+    assert "file: git:v1.0:app.py\ncontent:\nVERSION = 0\n" in formatted
+    assert 'lib/util.py' not in formatted
+
+    pack = pack_context('git:v2.0', budget=100000)
+    assert [path for path, _, _ in pack.included] == ['git:v2.0:app.py']
+
+
+def test_explicit_git_files_share_the_cat_file_processes(repo, monkeypatch):
+    monkeypatch.chdir(repo)
+    for index in range(20):
+        (repo / f'mod{index}.py').write_text(f'N = {index}\n')
+    git(repo, 'add', '.')
+    git(repo, 'commit', '-q', '-m', 'Add modules')
+    started = []
+    popen = subprocess.Popen
+
+    def counting_popen(args, **kwargs):
+        started.append(args)
+        return popen(args, **kwargs)
+
+    monkeypatch.setattr(subprocess, 'Popen', counting_popen)
+    formatted = format_files_as_string([f'git:HEAD:mod{index}.py' for index in range(20)])
+
+    assert 'N = 19' in formatted
+    assert sorted(args[2] for args in started) == ['--batch', '--batch-check']
+
+
+def test_stuck_cat_file_times_out(repo, tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'git').write_text('#!/bin/sh\nexec sleep 30\n')
+    (bin_dir / 'git').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    repository = GitRepository(str(repo), timeout=0.2)
+    with pytest.raises(subprocess.TimeoutExpired):
+        repository.read_blob('HEAD', 'app.py')
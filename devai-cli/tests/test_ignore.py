@@ -0,0 +1,70 @@
+import pytest
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from devai.util.ignore import (
+    IgnoreMatcher,
+    compile_pattern,
+    generated_file_reason,
+    sniff_generated,
+)
+
+
+def matcher_for(*lines):
+    """Build a matcher from ignore file lines without touching the disk."""
+    matcher = IgnoreMatcher('/repo')
+    for line in lines:
+        rule = compile_pattern(line)
+        if rule:
+            matcher.rules.append(('', *rule))
+    return matcher
+
+
+@pytest.mark.parametrize("line", ["", "# comment", "   ", "/"])
+def test_blank_lines_and_comments_are_skipped(line):
+    assert compile_pattern(line) is None
+
+
+def test_unanchored_patterns_match_at_any_depth():
+    matcher = matcher_for("*.log", "build/")
+    assert matcher.is_ignored("app.log", False)
+    assert matcher.is_ignored("server/logs/app.log", False)
+    assert matcher.is_ignored("server/build", True)
+    assert not matcher.is_ignored("server/build", False)
+
+
+def test_anchored_patterns_match_from_the_root():
+    matcher = matcher_for("/config/*.yaml", "docs/**/draft.md")
+    assert matcher.is_ignored("config/app.yaml", False)
+    assert not matcher.is_ignored("service/config/app.yaml", False)
+    assert matcher.is_ignored("docs/draft.md", False)
+    assert matcher.is_ignored("docs/a/b/draft.md", False)
+
+
+def test_negation_re_includes_files():
+    matcher = matcher_for("*.json", "!settings.json")
+    assert matcher.is_ignored("data.json", False)
+    assert not matcher.is_ignored("settings.json", False)
+
+
+def test_default_names_are_always_ignored():
+    matcher = matcher_for()
+    assert matcher.is_ignored("web/node_modules", True)
+    assert matcher.is_ignored(".git", True)
+    assert not matcher.is_ignored("src/main.py", False)
+
+
+def test_generated_files_are_detected_by_name():
+    assert generated_file_reason("package-lock.json") == 'dependency lockfile'
+    assert generated_file_reason("app.min.js") == 'generated file'
+    assert generated_file_reason("service_pb2.py") == 'generated file'
+    assert generated_file_reason("service.py") is None
+
+
+def test_generated_files_are_detected_by_content():
+    assert sniff_generated(b"// Code generated by protoc-gen-go. DO NOT EDIT.\n") == 'generated file header'
+    assert sniff_generated(b"var a=1;" * 1000) == 'long single-line content'
+    assert sniff_generated(b"def main():\n    pass\n" * 500) is None
@@ -0,0 +1,167 @@
+import io
+import json
+
+import pytest
+from PIL import Image, ImageDraw
+from click.testing import CliRunner
+
+from devai.commands.review import image, imgdiff
+from devai.util.imgdiff import changed_mask, changed_regions, prediff
+
+
+def screenshot(path, button_color='blue', size=(640, 480)):
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 620, 60), fill='gray')
+    draw.rectangle((500, 400, 600, 440), fill=button_color)
+    image.save(path)
+    return path
+
+
+button_changed = pytest.mark.parametrize('fake_model', [{'reply': 'The button changed colour.'}], indirect=True)
+
+
+@button_changed
+def test_identical_images_need_no_model_call(tmp_path, fake_model):
+    before = screenshot(tmp_path / 'before.png')
+    # Same pixels, different file.
+    after = tmp_path / 'after.png'
+    Image.open(before).save(after, optimize=True)
+
+    result = CliRunner().invoke(imgdiff, ['-c', str(before), '-t', str(after)])
+
+    assert result.exit_code == 0
+    assert 'identical' in result.output
+    assert fake_model.calls == []
+
+
+def test_rescaled_screenshot_is_compared_at_one_size(tmp_path):
+    before = screenshot(tmp_path / 'before.png')
+    after = tmp_path / 'after.png'
+    Image.open(before).resize((320, 240), Image.Resampling.LANCZOS).save(after)
+
+    result = prediff(before, after)
+
+    assert not result.identical and not result.pairs
+    assert result.distance <= 10
+    assert result.note == 'the same screen at 640x480 and 320x240 pixels'
+
+
+@button_changed
+def test_faint_change_is_not_reported_as_identical(tmp_path, fake_model):
+    before, after = tmp_path / 'before.png', tmp_path / 'after.png'
+    Image.new('RGB', (64, 64), (51, 51, 51)).save(before)
+    Image.new('RGB', (64, 64), (71, 71, 71)).save(after)
+
+    result = CliRunner().invoke(imgdiff, ['-c', str(before), '-t', str(after)])
+
+    assert result.exit_code == 0
+    assert 'identical' not in result.output
+    assert 'No significant visual differences: no channel differs by more than 20 levels' in result.output
+    assert fake_model.calls == []
+
+
+def test_regions_of_rescaled_screenshots_are_in_full_size_coordinates(tmp_path):
+    before = tmp_path / 'before.png'
+    Image.open(screenshot(tmp_path / 'small.png')).resize((1280, 960), Image.Resampling.LANCZOS).save(before)
+    after = screenshot(tmp_path / 'after.png', button_color='red')
+
+    result = prediff(before, after)
+
+    [(left, top, right, bottom)] = result.regions
+    # The button spans (1000, 800) to (1200, 880) of the 1280x960 image.
+    assert left <= 1000 and top <= 800 and right >= 1200 and bottom >= 880
+    assert right <= 1280 and bottom <= 960
+
+
+def test_only_the_changed_region_is_cropped(tmp_path):
+    before = screenshot(tmp_path / 'before.png')
+    after = screenshot(tmp_path / 'after.png', button_color='red')
+
+    result = prediff(before, after)
+
+    assert not result.identical
+    [(region, current, target)] = result.pairs
+    left, top, right, bottom = region
+    assert left <= 500 and top <= 400 and right >= 601 and bottom >= 441
+    assert (right - left) * (bottom - top) < 640 * 480 / 4
+    assert Image.open(io.BytesIO(current)).size == (right - left, bottom - top)
+
+
+def test_separate_changes_give_separate_regions():
+    before = Image.new('RGB', (400, 400), 'white')
+    after = before.copy()
+    draw = ImageDraw.Draw(after)
+    draw.rectangle((10, 10, 20, 20), fill='black')
+    draw.rectangle((300, 300, 320, 320), fill='black')
+
+    assert len(changed_regions(changed_mask(before, after))) == 2
+
+
+@button_changed
+def test_verdict_is_cached_by_image_content(tmp_path, fake_model):
+    before = screenshot(tmp_path / 'before.png')
+    after = screenshot(tmp_path / 'after.png', button_color='red')
+    args = ['-c', str(after), '-t', str(before)]
+
+    first = CliRunner().invoke(imgdiff, args)
+    second = CliRunner(mix_stderr=False).invoke(imgdiff, args)
+
+    assert first.exit_code == 0 and second.exit_code == 0
+    assert len(fake_model.calls) == 1
+    assert any(isinstance(part, str) and part.startswith('REGION') for part in fake_model.calls[0][1])
+    assert second.stdout == 'The button changed colour.'
+
+    CliRunner().invoke(imgdiff, args + ['--refresh'])
+    assert len(fake_model.calls) == 2
+
+
+@button_changed
+def test_directories_are_compared_pair_by_pair(tmp_path, fake_model):
+    for state, color in (('current', 'red'), ('target', 'blue')):
+        (tmp_path / state / 'settings').mkdir(parents=True)
+        screenshot(tmp_path / state / 'login.png', button_color=color)
+        screenshot(tmp_path / state / 'settings' / 'menu.png')
+    screenshot(tmp_path / 'current' / 'new.png')
+
+    result = CliRunner(mix_stderr=False).invoke(
+        imgdiff, ['-c', str(tmp_path / 'current'), '-t', str(tmp_path / 'target'), '--concurrency', '2'])
+
+    assert result.exit_code == 0
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [line['name'] for line in lines] == ['login.png', 'settings/menu.png']
+    assert lines[0]['response'] == 'The button changed colour.' and not lines[0]['identical']
+    assert lines[1]['identical'] and 'response' not in lines[1]
+    assert len(fake_model.calls) == 1
+
+
+@button_changed
+def test_manifest_pairs_and_failures(tmp_path, fake_model):
+    screenshot(tmp_path / 'a.png')
+    screenshot(tmp_path / 'b.png', button_color='red')
+    manifest = tmp_path / 'pairs.jsonl'
+    manifest.write_text(json.dumps({'current': 'a.png', 'target': 'b.png', 'name': 'button'}) + '\n'
+                        + json.dumps({'current': 'a.png', 'target': 'missing.png'}) + '\n')
+    output = tmp_path / 'results.jsonl'
+
+    result = CliRunner(mix_stderr=False).invoke(imgdiff, ['-m', str(manifest), '-o', str(output)])
+
+    assert result.exit_code == 1
+    first, second = [json.loads(line) for line in output.read_text().splitlines()]
+    assert first['name'] == 'button' and first['response'] == 'The button changed colour.'
+    assert 'error' in second
+
+
+@button_changed
+def test_image_directory_is_downscaled_before_sending(tmp_path, fake_model):
+    screenshot(tmp_path / 'large.png', size=(3000, 2000))
+    (tmp_path / 'notes.txt').write_text('not an image')
+
+    result = CliRunner(mix_stderr=False).invoke(image, ['-d', str(tmp_path), '-p', 'Describe the screen'])
+
+    assert result.exit_code == 0
+    [line] = [json.loads(line) for line in result.stdout.splitlines()]
+    assert line['name'] == 'large.png' and line['response'] == 'The button changed colour.'
+    [(_, contents)] = fake_model.calls
+    sent = Image.open(io.BytesIO(contents[0].data))
+    assert max(sent.size) == 1024
@@ -0,0 +1,76 @@
+import pytest
+import json
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from devai.util.json_stream import JsonArrayParser, iter_json_objects
+from devai.commands.review import code
+
+FINDINGS = [
+    {"issue_type": "Overview", "description": "Small module, {braces} and [brackets] in \"text\" \\ fine."},
+    {"class_name": "App", "method_name": "run", "issue_type": "Bug", "description": "Crashes on empty input.",
+     "severity": "high", "lines": [1, {"to": 3}]},
+]
+
+
+@pytest.mark.parametrize('size', [1, 2, 5, 64, 10000])
+def test_objects_are_parsed_across_any_chunking(size):
+    text = '```json\n' + json.dumps(FINDINGS, indent=2) + '\n```'
+    chunks = [text[i:i + size] for i in range(0, len(text), size)]
+
+    assert list(iter_json_objects(chunks)) == FINDINGS
+
+
+def test_objects_are_returned_as_soon_as_they_close():
+    parser = JsonArrayParser()
+
+    assert parser.feed('[{"issue_type": "A", "description": "x"}, {"issue_') == [
+        {"issue_type": "A", "description": "x"}]
+    assert parser.feed('type": "B"') == []
+    assert parser.feed('}]') == [{"issue_type": "B"}]
+    assert parser.done
+
+
+def test_truncated_trailing_object_is_repaired_on_close():
+    parser = JsonArrayParser()
+    parser.feed('[{"issue_type": "A", "description": "x"}, {"issue_type": "B", "description": "cut o')
+
+    assert parser.close() == [{"issue_type": "B", "description": "cut o"}]
+
+
+def test_lone_object_and_text_without_json():
+    assert list(iter_json_objects(['{"issue_type": "A"}'])) == [{"issue_type": "A"}]
+    assert list(iter_json_objects(['No major issues found.'])) == []
+
+
+TRUNCATED_RESPONSE = json.dumps(FINDINGS) + ', {"issue_type": "Truncat'
+
+# The response arrives in 7 character chunks that split the objects anywhere.
+streamed_findings = pytest.mark.parametrize(
+    'fake_model', [{'reply': [TRUNCATED_RESPONSE[i:i + 7] for i in range(0, len(TRUNCATED_RESPONSE), 7)]}],
+    indirect=True)
+
+
+@streamed_findings
+def test_review_json_output_streams_findings(tmp_path, fake_model):
+    (tmp_path / 'app.py').write_text('print("app")\n')
+
+    result = CliRunner(mix_stderr=False).invoke(code, ['-c', str(tmp_path), '-o', 'json'])
+
+    assert result.exit_code == 0
+    assert result.stdout == json.dumps(FINDINGS, indent=4) + '\n'
+
+
+@streamed_findings
+def test_review_table_output_streams_findings(tmp_path, fake_model):
+    (tmp_path / 'app.py').write_text('print("app")\n')
+
+    result = CliRunner().invoke(code, ['-c', str(tmp_path), '-o', 'table', '--no-cache'])
+
+    assert result.exit_code == 0
+    assert 'Crashes on empty input.' in result.output
+    assert 'Truncat' not in result.output
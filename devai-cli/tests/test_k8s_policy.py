@@ -0,0 +1,179 @@
+import textwrap
+
+import pytest
+from click.testing import CliRunner
+
+from devai.commands.review import compliance
+from devai.util.k8s_policy import check_manifest, compile_standards, environment_of, parse_quantity
+
+STANDARDS = textwrap.dedent("""\
+    # Company Kubernetes configuration best practices
+
+    1. Set resource requests and limits on every container.
+
+    ### Resources for DEV env ###
+    resources:
+        requests:
+            cpu: 200m
+            memory: 256Mi
+        limits:
+            memory: 512Mi
+
+    ### Resources for PROD env ###
+    resources:
+        requests:
+            cpu: 500m
+            memory: 1Gi
+        limits:
+            memory: 2Gi
+    """)
+
+
+def deployment(name, resources=None, service=True):
+    container = {'name': name, 'image': name}
+    if resources:
+        container['resources'] = resources
+    lines = [
+        'apiVersion: apps/v1',
+        'kind: Deployment',
+        f'metadata: {{name: {name}}}',
+        'spec:',
+        '  template:',
+        '    spec:',
+        '      containers:',
+        f'      - {container!r}'.replace("'", '"'),
+    ]
+    text = '\n'.join(lines) + '\n'
+    return text + '---\napiVersion: v1\nkind: Service\nmetadata: {name: svc}\n' if service else text
+
+
+PROD_RESOURCES = {'requests': {'cpu': '0.5', 'memory': '1024Mi'}, 'limits': {'memory': '2Gi'}}
+
+
+def test_parse_quantity():
+    assert parse_quantity('1000m') == parse_quantity('1') == parse_quantity(1)
+    assert parse_quantity('1Gi') == parse_quantity('1024Mi')
+    assert parse_quantity('fast') is None
+
+
+def test_compile_standards_by_environment():
+    standards = compile_standards([STANDARDS])
+
+    assert set(standards.references) == {'dev', 'prod'}
+    assert standards.references['prod']['resources']['requests']['cpu'] == '500m'
+    assert '1. Set resource requests and limits on every container.' in standards.prose
+    assert 'resources.limits.memory: 2Gi' in standards.digest()
+
+
+def test_fenced_snippets_keep_their_comments():
+    standards = compile_standards([textwrap.dedent("""\
+        # Kubernetes standards
+
+        ## Production
+
+        Every production container uses these resources:
+
+        ```yaml
+        # prod resources
+        resources:
+          requests:
+            cpu: 500m  # half a core
+        ```
+
+        ```sh
+        kubectl apply -f k8s/production
+        ```
+        """)])
+
+    assert standards.references == {'prod': {'resources': {'requests': {'cpu': '500m'}}}}
+    assert 'Every production container uses these resources:' in standards.prose
+    assert 'kubectl apply -f k8s/production' in standards.prose
+    assert '# prod resources' not in standards.prose
+
+
+def test_check_manifest_against_its_environment():
+    standards = compile_standards([STANDARDS])
+
+    assert check_manifest('k8s/production/app.yaml', deployment('app', PROD_RESOURCES), standards) == []
+    [finding] = check_manifest('k8s/development/app.yaml', deployment('app', PROD_RESOURCES), standards)
+    assert finding.environment == 'dev'
+    assert 'resources.requests.cpu is 0.5, the dev standard is 200m' in finding.problems
+
+
+def test_unknown_environment_only_checks_presence():
+    standards = compile_standards([STANDARDS])
+
+    assert check_manifest('k8s/app.yaml', deployment('app', PROD_RESOURCES), standards) == []
+    [finding] = check_manifest('k8s/app.yaml', deployment('app'), standards)
+    assert 'resources.requests.cpu is not set' in finding.problems
+
+
+def test_nearest_directory_tells_the_environment():
+    assert environment_of('dev/work/k8s/production/deploy.yaml') == 'prod'
+    assert environment_of('k8s/staging') == 'staging'
+    assert environment_of('k8s/app.yaml') is None
+
+
+def test_non_manifests_are_not_checked():
+    standards = compile_standards([STANDARDS])
+
+    assert check_manifest('values.yaml', 'replicas: 3\n', standards) is None
+    assert check_manifest('broken.yaml', 'a: [\n', standards) is None
+
+
+@pytest.fixture
+def fake_stream(monkeypatch):
+    calls = []
+    monkeypatch.setattr('devai.commands.review.get_prompt', lambda secret_id: None)
+    monkeypatch.setattr('devai.commands.review.stream',
+                        lambda instruction, contents, **kwargs: calls.append((instruction, contents)))
+    return calls
+
+
+def test_compliance_sends_only_flagged_containers(tmp_path, fake_stream):
+    (tmp_path / 'standards.md').write_text(STANDARDS)
+    k8s = tmp_path / 'k8s'
+    for env in ('production', 'development'):
+        (k8s / env).mkdir(parents=True)
+    (k8s / 'production' / 'good.yaml').write_text(deployment('good', PROD_RESOURCES))
+    (k8s / 'production' / 'bad.yaml').write_text(deployment('bad'))
+    (k8s / 'development' / 'notes.txt').write_text('not a manifest')
+
+    result = CliRunner().invoke(compliance, ['-c', str(k8s), '-cfg', str(tmp_path / 'standards.md')])
+
+    assert result.exit_code == 0
+    [(instruction, contents)] = fake_stream
+    assert instruction[-1].startswith('### Standards digest ###')
+    context = ''.join(contents)
+    assert 'Deployment bad, container bad' in context
+    assert 'container good' not in context
+    assert 'not a manifest' in context
+
+
+def test_compliance_sends_other_documents_unchecked(tmp_path, fake_stream):
+    (tmp_path / 'standards.md').write_text(STANDARDS)
+    (tmp_path / 'dev' / 'k8s' / 'production').mkdir(parents=True)
+    (tmp_path / 'dev' / 'k8s' / 'production' / 'web.yaml').write_text(deployment('web', PROD_RESOURCES))
+
+    result = CliRunner(mix_stderr=False).invoke(
+        compliance, ['-c', str(tmp_path / 'dev' / 'k8s'), '-cfg', str(tmp_path / 'standards.md')])
+
+    assert result.exit_code == 0
+    [(instruction, contents)] = fake_stream
+    context = ''.join(contents)
+    # The production Deployment meets the standard; the Service still goes to the model.
+    assert 'Service svc (not checked locally)' in context
+    assert 'container web' not in context
+    assert '1 files or documents sent unchecked' in result.stderr
+
+
+def test_compliance_without_findings_needs_no_model(tmp_path, fake_stream):
+    (tmp_path / 'standards.md').write_text(STANDARDS)
+    (tmp_path / 'prod').mkdir()
+    (tmp_path / 'prod' / 'good.yaml').write_text(deployment('good', PROD_RESOURCES, service=False))
+
+    result = CliRunner().invoke(compliance, ['-c', str(tmp_path / 'prod'), '-cfg', str(tmp_path / 'standards.md')])
+
+    assert result.exit_code == 0
+    assert 'No potential violations' in result.output
+    assert fake_stream == []
@@ -0,0 +1,93 @@
+import io
+import sys
+import textwrap
+
+import pytest
+from PIL import Image
+from click.testing import CliRunner
+
+from devai.commands.review import video
+from devai.util.keyframes import Keyframe, drop_near_duplicates, extract_keyframes, parse_timestamps, thin_out
+
+SHOWINFO_LOG = """
+Input #0, mov,mp4,m4a,3gp,3g2,mj2, from 'demo.mp4':
+  Duration: 00:01:10.00, start: 0.000000, bitrate: 412 kb/s
+[Parsed_showinfo_1 @ 0x5581] n:   0 pts:      0 pts_time:0       duration:512 fmt:yuv420p
+[Parsed_showinfo_1 @ 0x5581] n:   1 pts: 102400 pts_time:6.66667 duration:512 fmt:yuv420p
+[Parsed_showinfo_1 @ 0x5581] n:   2 pts: 967680 pts_time:63     duration:512 fmt:yuv420p
+"""
+
+
+def jpeg(color, text_box=None):
+    image = Image.new('RGB', (160, 90), color)
+    if text_box:
+        image.paste('black', text_box)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    """A stand-in for ffmpeg that writes three frames, two of them alike, and logs them like showinfo."""
+    frames = tmp_path / 'frames'
+    frames.mkdir()
+    for index, data in enumerate([jpeg('white'), jpeg('white'), jpeg('white', (10, 10, 150, 80))], 1):
+        (frames / f'frame-{index:05d}.jpg').write_bytes(data)
+    script = tmp_path / 'ffmpeg'
+    script.write_text(textwrap.dedent(f"""\
+        #!{sys.executable}
+        import shutil, sys
+        pattern = sys.argv[-1]
+        for index, time in enumerate(['0', '2.5', '75.25'], 1):
+            shutil.copy({str(frames)!r} + f'/frame-{{index:05d}}.jpg', pattern % index)
+            print(f'[Parsed_showinfo_1 @ 0x1] n: {{index - 1}} pts_time:{{time}} fmt:yuvj420p', file=sys.stderr)
+        """))
+    script.chmod(0o755)
+    monkeypatch.setenv('DEVAI_FFMPEG', str(script))
+    return script
+
+
+def test_parse_timestamps_of_showinfo_log():
+    assert parse_timestamps(SHOWINFO_LOG) == [0.0, 6.66667, 63.0]
+
+
+def test_thin_out_keeps_first_and_last():
+    frames = list(range(100))
+    assert thin_out(frames, 5) == [0, 25, 50, 74, 99]
+    assert thin_out(frames[:3], 5) == [0, 1, 2]
+
+
+def test_near_duplicate_frames_are_dropped():
+    frames = [Keyframe(0, jpeg('white')), Keyframe(1, jpeg('white')), Keyframe(2, jpeg('white', (10, 10, 150, 80)))]
+    assert [frame.timestamp for frame in drop_near_duplicates(frames)] == [0, 2]
+
+
+def test_extract_keyframes_with_ffmpeg(tmp_path, fake_ffmpeg):
+    frames = extract_keyframes(str(tmp_path / 'demo.mp4'))
+    assert [frame.label() for frame in frames] == ['0:00.0', '1:15.2']
+
+
+@pytest.mark.parametrize('fake_model', [{'reply': 'The dialog opens at 1:15.'}], indirect=True)
+def test_video_sends_keyframes_with_timestamps(tmp_path, fake_ffmpeg, fake_model):
+    (tmp_path / 'demo.mp4').write_bytes(b'not decoded by the fake ffmpeg')
+
+    result = CliRunner(mix_stderr=False).invoke(
+        video, ['-f', str(tmp_path / 'demo.mp4'), '-p', 'When does the dialog open?', '--keyframes'])
+
+    assert result.exit_code == 0
+    assert 'The dialog opens at 1:15.' in result.stdout
+    [(_, contents)] = fake_model.calls
+    assert 'FRAME 0:00.0:' in contents and 'FRAME 1:15.2:' in contents
+    assert len(contents) == 2 + 2 * 2
+
+
+def test_keyframes_without_ffmpeg(tmp_path, monkeypatch, fake_model):
+    monkeypatch.delenv('DEVAI_FFMPEG', raising=False)
+    monkeypatch.setattr('devai.util.keyframes.shutil.which', lambda name: None)
+    (tmp_path / 'demo.mp4').write_bytes(b'')
+
+    result = CliRunner().invoke(video, ['-f', str(tmp_path / 'demo.mp4'), '-p', 'Describe', '--keyframes'])
+
+    assert result.exit_code == 1
+    assert 'ffmpeg is needed' in result.output
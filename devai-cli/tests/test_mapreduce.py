@@ -0,0 +1,141 @@
+import pytest
+import json
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from devai.util.mapreduce import parse_findings, reduce_findings, shard_files, shard_key
+from devai.commands.review import code
+
+
+def test_shards_follow_directories():
+    files = [('a/x.py', 'x', 400), ('a/y.py', 'y', 400), ('b/z.py', 'z', 300),
+             ('c/big.py', 'big', 2000), ('d/w.py', 'w', 100)]
+
+    shards = shard_files(files, 1000)
+
+    assert [[path for path, _, _ in shard] for shard in shards] == [
+        ['a/x.py', 'a/y.py'], ['b/z.py'], ['c/big.py'], ['d/w.py']]
+
+
+def test_editing_one_directory_keeps_the_other_shards():
+    def context(sizes):
+        return [(f'pkg{index:02d}/module.py', f'pkg{index:02d} {tokens}', tokens) for index, tokens in enumerate(sizes)]
+
+    before = shard_files(context([100] * 16), 1000)
+    keys = {shard_key('model', 'review', shard) for shard in shard_files(context([100, 350] + [100] * 14), 1000)}
+
+    untouched = [shard for shard in before if not any(path.startswith('pkg01/') for path, _, _ in shard)]
+    assert len(before) > 2 and len(untouched) == len(before) - 1
+    assert all(shard_key('model', 'review', shard) in keys for shard in untouched)
+
+
+def test_parse_findings_handles_fences_and_repairs():
+    assert parse_findings('```json\n[{"issue_type": "Bug"}]\n```') == [{'issue_type': 'Bug'}]
+    assert parse_findings('[{"issue_type": "Bug",}') == [{'issue_type': 'Bug'}]
+    assert parse_findings('not json at all') == []
+
+
+def test_reduce_dedupes_and_ranks_by_severity():
+    findings = [
+        {'file_name': 'a.py', 'issue_type': 'Style', 'description': 'Long line', 'severity': 'low'},
+        {'file_name': 'b.py', 'issue_type': 'Bug', 'description': 'Divide by zero.', 'severity': 'medium'},
+        {'file_name': 'b.py', 'issue_type': 'bug', 'description': 'Divide by zero', 'severity': 'high'},
+        {'file_name': 'a.py', 'issue_type': 'Security', 'description': 'SQL injection', 'severity': 'Critical'},
+    ]
+
+    merged = reduce_findings(findings)
+
+    assert [(f['file_name'], f['severity']) for f in merged] == [('a.py', 'Critical'), ('b.py', 'high'), ('a.py', 'low')]
+
+
+def finding_per_file(instruction, contents):
+    """Model reply with one finding per file of the shard it is sent."""
+    paths = [part.split('\n')[1][len('file: '):] for part in contents[1:]]
+    return json.dumps([{'file_name': path, 'issue_type': 'Naming', 'description': f'Rename things in {path}',
+                        'severity': 'low' if 'lib' in path else 'high'} for path in paths])
+
+
+@pytest.mark.parametrize('fake_model', [{'reply': finding_per_file}], indirect=True)
+def test_map_reduce_review_caches_shards(tmp_path, fake_model):
+    for directory in ('app', 'lib'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'module.py').write_text(f'# {directory}\n' + 'value = 1\n' * 400)
+    args = ['-c', str(tmp_path), '--map-reduce', '--shard-tokens', '1000', '-o', 'json']
+
+    result = CliRunner(mix_stderr=False).invoke(code, args)
+
+    assert result.exit_code == 0
+    assert len(fake_model.calls) == 2
+    findings = json.loads(result.stdout)
+    assert [f['severity'] for f in findings] == ['high', 'low']
+
+    result = CliRunner(mix_stderr=False).invoke(code, args)
+    assert len(fake_model.calls) == 2
+    assert 'Reviewed 0 shards, 2 from cache' in result.stderr
+    assert json.loads(result.stdout) == findings
+
+    (tmp_path / 'lib' / 'module.py').write_text('# lib\nvalue = 2\n')
+    result = CliRunner(mix_stderr=False).invoke(code, args)
+    assert len(fake_model.calls) == 3
+    assert 'Reviewed 1 shards, 1 from cache' in result.stderr
+
+
+@pytest.mark.parametrize('fake_model', [{'reply': finding_per_file}], indirect=True)
+def test_incremental_review_only_sends_changed_files(tmp_path, fake_model):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for name in ('app.py', 'lib.py', 'util.py'):
+        (src / name).write_text(f'# {name}\n')
+    state_file = tmp_path / 'state.json'
+    args = ['-c', str(src), '--incremental', '--state-file', str(state_file), '-o', 'json']
+
+    def run():
+        result = CliRunner(mix_stderr=False).invoke(code, args)
+        assert result.exit_code == 0, result.stderr
+        return result, sorted(f['file_name'] for f in json.loads(result.stdout))
+
+    result, files = run()
+    assert 'Incremental review: 3 new or changed files, 0 unchanged, 0 removed' in result.stderr
+    assert files == [str(src / name) for name in ('app.py', 'lib.py', 'util.py')]
+    assert len(fake_model.calls) == 1
+
+    result, again = run()
+    assert 'Incremental review: 0 new or changed files, 3 unchanged, 0 removed' in result.stderr
+    assert again == files
+    assert len(fake_model.calls) == 1
+
+    (src / 'app.py').write_text('# app.py, changed\n')
+    (src / 'util.py').unlink()
+    result, files = run()
+    assert 'Incremental review: 1 new or changed files, 1 unchanged, 1 removed' in result.stderr
+    assert files == [str(src / 'app.py'), str(src / 'lib.py')]
+    assert len(fake_model.calls) == 2
+    assert sorted(json.loads(state_file.read_text())['files']) == [str(src / 'app.py'), str(src / 'lib.py')]
+
+
+@pytest.mark.parametrize('fake_model', [{'reply': finding_per_file}], indirect=True)
+def test_failed_shard_drops_the_old_findings_of_its_files(tmp_path, fake_model):
+    src = tmp_path / 'src'
+    src.mkdir()
+    for name in ('app.py', 'lib.py'):
+        (src / name).write_text(f'# {name}\n')
+    args = ['-c', str(src), '--incremental', '--state-file', str(tmp_path / 'state.json'), '-o', 'json']
+    assert CliRunner(mix_stderr=False).invoke(code, args).exit_code == 0
+
+    def unavailable(instruction, contents):
+        raise RuntimeError('model unavailable')
+
+    (src / 'app.py').write_text('# app.py, changed\n')
+    fake_model.reply = unavailable
+    result = CliRunner(mix_stderr=False).invoke(code, args)
+
+    assert f"Not reviewed, run again to retry: {src / 'app.py'}" in result.stderr
+    assert [f['file_name'] for f in json.loads(result.stdout)] == [str(src / 'lib.py')]
+
+    fake_model.reply = finding_per_file
+    result = CliRunner(mix_stderr=False).invoke(code, args)
+    assert 'Incremental review: 1 new or changed files, 1 unchanged, 0 removed' in result.stderr
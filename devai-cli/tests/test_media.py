@@ -0,0 +1,86 @@
+import hashlib
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from devai.util.media import file_digest, upload_video
+from devai.commands.review import load_video_part, video
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket, self.name, self.chunk_size = bucket, name, chunk_size
+
+    def exists(self):
+        return self.name in self.bucket.objects
+
+    def upload_from_filename(self, path, content_type=None):
+        with open(path, 'rb') as f:
+            self.bucket.objects[self.name] = (f.read(), content_type)
+
+
+class FakeStorage:
+    def __init__(self):
+        self.objects = {}
+
+    def bucket(self, name):
+        self.name = name
+        return self
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size)
+
+
+def test_videos_are_uploaded_once_by_content_hash(tmp_path):
+    path = tmp_path / 'demo.webm'
+    path.write_bytes(b'frame' * 1000)
+    client = FakeStorage()
+
+    uri = upload_video(str(path), 'gs://reviews/ci', client=client)
+    assert uri == f'gs://reviews/ci/devai/videos/{hashlib.sha256(path.read_bytes()).hexdigest()}.webm'
+    assert client.objects[uri.split('/', 3)[3]][1] == 'video/webm'
+
+    client.objects = {name: (b'', 'video/webm') for name in client.objects}
+    assert upload_video(str(path), 'reviews/ci', client=client) == uri
+    assert list(client.objects.values()) == [(b'', 'video/webm')]
+
+
+def test_digest_is_read_in_chunks(tmp_path):
+    path = tmp_path / 'demo.mp4'
+    path.write_bytes(b'x' * 10)
+    assert file_digest(str(path), chunk_bytes=3) == hashlib.sha256(b'x' * 10).hexdigest()
+
+
+def test_large_videos_are_uploaded_and_referenced(tmp_path, monkeypatch):
+    path = tmp_path / 'demo.mp4'
+    path.write_bytes(b'x' * 100)
+    monkeypatch.setattr('devai.commands.review.INLINE_VIDEO_MAX_BYTES', 10)
+    monkeypatch.setattr('devai.commands.review.upload_video', lambda source, bucket: f'gs://{bucket}/demo.mp4')
+
+    part = load_video_part(str(path), 'reviews')
+    assert part.file_data.file_uri == 'gs://reviews/demo.mp4'
+    assert part.file_data.mime_type == 'video/mp4'
+
+    assert load_video_part('gs://reviews/other.mov').file_data.mime_type == 'video/quicktime'
+
+
+def test_oversized_videos_are_rejected_before_any_request(tmp_path, monkeypatch):
+    path = tmp_path / 'demo.mp4'
+    path.write_bytes(b'x' * 100)
+    monkeypatch.setenv('DEVAI_VIDEO_MAX_BYTES', '50')
+    monkeypatch.setattr('devai.commands.review.get_prompt', lambda secret_id: None)
+    monkeypatch.setattr('devai.commands.models.GenerativeModel', None)
+
+    result = CliRunner().invoke(video, ['-f', str(path), '-p', 'What happens?'])
+    assert result.exit_code == 1
+    assert 'DEVAI_VIDEO_MAX_BYTES' in result.output
+
+    monkeypatch.setenv('DEVAI_VIDEO_MAX_BYTES', '1000')
+    monkeypatch.setattr('devai.commands.review.INLINE_VIDEO_MAX_BYTES', 10)
+    monkeypatch.delenv('DEVAI_VIDEO_BUCKET', raising=False)
+    result = CliRunner().invoke(video, ['-f', str(path), '-p', 'What happens?'])
+    assert result.exit_code == 2
+    assert 'too large to send inline' in result.output
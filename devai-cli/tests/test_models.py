@@ -0,0 +1,92 @@
+import pytest
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from google.api_core.exceptions import InvalidArgument, ResourceExhausted, ServiceUnavailable
+from devai.commands import models
+from devai.commands.models import get_model, iter_with_retries, with_retries
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(models.time, 'sleep', delays.append)
+    monkeypatch.setenv('DEVAI_MODEL_RETRIES', '2')
+    monkeypatch.setenv('DEVAI_RATE_LIMIT', '0')
+    return delays
+
+
+def failing(errors, result):
+    """A call that raises the given errors, one per attempt, then returns result."""
+    errors = list(errors)
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    call.attempts = attempts
+    return call
+
+
+def test_quota_and_availability_errors_are_retried_with_backoff(sleeps):
+    call = failing([ResourceExhausted('quota'), ServiceUnavailable('busy')], 'ok')
+
+    assert with_retries(call) == 'ok'
+    assert len(call.attempts) == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= models.BACKOFF_BASE and 0 <= sleeps[1] <= 2 * models.BACKOFF_BASE
+
+
+def test_retries_are_bounded_and_other_errors_are_not_retried(sleeps):
+    call = failing([ResourceExhausted('quota')] * 3, 'ok')
+    with pytest.raises(ResourceExhausted):
+        with_retries(call)
+    assert len(call.attempts) == 3
+
+    call = failing([InvalidArgument('bad request')], 'ok')
+    with pytest.raises(InvalidArgument):
+        with_retries(call)
+    assert len(call.attempts) == 1
+
+
+def test_streams_are_only_retried_before_the_first_chunk(sleeps):
+    call = failing([ResourceExhausted('quota')], ['a', 'b'])
+    assert list(iter_with_retries(call)) == ['a', 'b']
+    assert len(call.attempts) == 2
+
+    def broken_stream():
+        yield 'a'
+        raise ServiceUnavailable('dropped')
+    chunks = []
+    with pytest.raises(ServiceUnavailable):
+        for chunk in iter_with_retries(broken_stream):
+            chunks.append(chunk)
+    assert chunks == ['a']
+
+
+def test_models_share_one_client_with_a_deadline(monkeypatch):
+    created = []
+
+    class PredictionClient:
+        def generate_content(self, request, timeout=None):
+            return timeout
+
+    def create_client(client_class, location_override, prediction_client):
+        created.append(client_class)
+        return PredictionClient()
+    monkeypatch.setattr(models.aiplatform_initializer.global_config, 'create_client', create_client)
+    monkeypatch.setenv('DEVAI_MODEL_TIMEOUT', '42')
+    monkeypatch.setattr(models.aiplatform_initializer.global_config, '_project', 'demo')
+
+    first = get_model('gemini', system_instruction='Review.')
+    second = get_model('gemini', system_instruction='Document.')
+
+    assert first._prediction_client is second._prediction_client
+    assert first._prediction_client.generate_content(request=None) == 42
+    assert second._prediction_client.generate_content(request=None) == 42
+    assert len(created) == 1
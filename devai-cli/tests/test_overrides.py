@@ -0,0 +1,95 @@
+import pytest
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+from devai.commands import overrides
+from devai.commands.overrides import get_prompt, prefetch_prompts
+from devai.commands.review import review_all
+
+
+class FakeSecretManager:
+    """Serves secrets from a dictionary and records the lookups."""
+
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.names = []
+
+    def access_secret_version(self, name):
+        self.names.append(name)
+        secret_id = name.split('/')[3]
+        value = self.secrets.get(secret_id)
+        if isinstance(value, Exception):
+            raise value
+        if value is None:
+            raise NotFound(f'{secret_id} not found')
+
+        class Response:
+            class payload:
+                data = value.encode('utf-8')
+        return Response()
+
+
+@pytest.fixture
+def secret_manager(monkeypatch):
+    client = FakeSecretManager({'review_query': 'Review carefully.'})
+    monkeypatch.setenv('PROJECT_ID', 'demo')
+    monkeypatch.delenv('DEVAI_OFFLINE', raising=False)
+    monkeypatch.setattr(overrides, '_client', client)
+    return client
+
+
+def test_overrides_and_missing_secrets_are_cached(secret_manager):
+    assert get_prompt('review_query') == 'Review carefully.'
+    assert get_prompt('document_readme') is None
+    assert get_prompt('review_query') == 'Review carefully.'
+    assert get_prompt('document_readme') is None
+
+    assert secret_manager.names == ['projects/demo/secrets/review_query/versions/latest',
+                                    'projects/demo/secrets/document_readme/versions/latest']
+
+
+def test_transient_errors_are_not_cached(secret_manager):
+    secret_manager.secrets['review_query'] = ServiceUnavailable('try again')
+    assert get_prompt('review_query') is None
+
+    secret_manager.secrets['review_query'] = 'Review carefully.'
+    assert get_prompt('review_query') == 'Review carefully.'
+    assert len(secret_manager.names) == 2
+
+
+def test_offline_mode_only_reads_the_cache(secret_manager, monkeypatch):
+    get_prompt('review_query')
+    monkeypatch.setenv('DEVAI_OFFLINE', '1')
+
+    assert get_prompt('review_query') == 'Review carefully.'
+    assert get_prompt('document_readme') is None
+    assert len(secret_manager.names) == 1
+
+
+def test_review_all_prefetches_per_type_overrides(secret_manager, monkeypatch):
+    secret_manager.secrets['review_security_query'] = 'Only look for injections.'
+    instructions = {}
+    monkeypatch.setattr('devai.commands.review.prepare_context', lambda *args, **kwargs: ['context'])
+
+    class Response:
+        text = 'Looks good.'
+    monkeypatch.setattr('devai.commands.review.generate_many',
+                        lambda requests, concurrency: instructions.update(requests)
+                        or {review_type: Response() for review_type in requests})
+
+    result = CliRunner().invoke(review_all, ['--types', 'code,security'])
+
+    assert result.exit_code == 0
+    assert instructions['code'][0] == 'Review carefully.'
+    assert instructions['security'][0] == 'Only look for injections.'
+    assert sorted(secret_manager.names) == sorted(
+        f'projects/demo/secrets/{secret_id}/versions/latest'
+        for secret_id in ('review_query', 'review_code_query', 'review_security_query'))
+    assert prefetch_prompts(['review_code_query', 'review_query']) == {
+        'review_code_query': None, 'review_query': 'Review carefully.'}
+    assert len(secret_manager.names) == 3
@@ -0,0 +1,92 @@
+import pytest
+import os
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from devai.util.packer import estimate_file_tokens, estimate_tokens, pack_context
+from devai.commands.review import performance
+
+
+@pytest.fixture
+def project(tmp_path):
+    """A small project with one entry point and files of different sizes."""
+    (tmp_path / 'main.py').write_text('import lib\n' * 50)
+    (tmp_path / 'lib.py').write_text('x = 1\n' * 20)
+    (tmp_path / 'big.py').write_text('y = 2\n' * 400)
+    return tmp_path
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('') == 0
+    assert estimate_tokens('abcd') == 1
+    assert estimate_tokens('abcde') == 2
+
+
+def test_everything_fits_in_a_large_budget(project):
+    pack = pack_context(str(project), budget=100000)
+    assert len(pack.included) == 3
+    assert pack.dropped == []
+
+
+def test_budget_drops_low_priority_files(project):
+    """Entry points and small files win; the kept files stay in walk order."""
+    sizes = {os.path.basename(path): tokens for path, _, tokens in pack_context(str(project), 100000).included}
+    budget = sizes['main.py'] + sizes['lib.py']
+
+    pack = pack_context(str(project), budget=budget)
+
+    assert sorted(os.path.basename(path) for path, _, _ in pack.included) == ['lib.py', 'main.py']
+    assert [(os.path.basename(path), reason) for path, _, reason in pack.dropped] == [('big.py', 'over token budget')]
+    assert pack.tokens <= budget
+
+
+def test_dropped_files_are_never_read(project, monkeypatch):
+    """Ranking works from file sizes, so files over the budget stay unread."""
+    import devai.util.file_processor as file_processor
+    read_file_bytes = file_processor.read_file_bytes
+    opened = []
+
+    def tracking_read(file_path, max_bytes=None):
+        opened.append(os.path.basename(file_path))
+        return read_file_bytes(file_path, max_bytes)
+
+    monkeypatch.setattr(file_processor, 'read_file_bytes', tracking_read)
+    budget = estimate_file_tokens(str(project / 'main.py')) + estimate_file_tokens(str(project / 'lib.py'))
+
+    pack = pack_context(str(project), budget=budget)
+
+    assert sorted(opened) == ['lib.py', 'main.py']
+    assert [os.path.basename(path) for path, _, _ in pack.dropped] == ['big.py']
+
+
+def test_explicit_paths_come_first(project):
+    big = str(project / 'big.py')
+    tokens = pack_context(big, 100000).tokens
+
+    pack = pack_context([big, str(project)], budget=tokens)
+
+    assert [path for path, _, _ in pack.included] == [big]
+
+
+def test_dry_run_reports_without_calling_the_model(project, monkeypatch):
+    monkeypatch.setattr('devai.commands.review.get_prompt', lambda secret_id: None)
+    monkeypatch.setattr('devai.commands.models.GenerativeModel', None)
+
+    result = CliRunner(mix_stderr=False).invoke(performance, ['-c', str(project), '--dry-run'])
+
+    assert result.exit_code == 0
+    assert 'Context: 3 files' in result.stderr
+    assert 'Estimated input:' in result.stderr
+    assert result.stdout == ''
+
+
+@pytest.mark.parametrize('budget', ['0', '-100'])
+def test_budget_must_be_positive(project, budget):
+    result = CliRunner(mix_stderr=False).invoke(performance, ['-c', str(project), '--budget', budget, '--dry-run'])
+
+    assert result.exit_code == 2
+    assert '--budget' in result.stderr
@@ -0,0 +1,131 @@
+import pytest
+import asyncio
+import multiprocessing
+import threading
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from google.api_core.exceptions import ResourceExhausted
+from devai.commands import models
+from devai.util import ratelimit
+from devai.util.ratelimit import RateController, get_rate_controller
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, 'time', lambda: now[0])
+    return now
+
+
+def test_rate_grows_additively_and_halves_on_quota_errors(tmp_path, clock):
+    controller = RateController(str(tmp_path / 'model.json'), max_rate=2.0)
+    assert controller.rate() == ratelimit.INITIAL_RATE
+
+    for _ in range(3):
+        controller.succeeded()
+    assert controller.rate() == pytest.approx(ratelimit.INITIAL_RATE + 3 * ratelimit.RATE_INCREASE)
+
+    controller.throttled()
+    controller.throttled()  # same congestion event
+    assert controller.rate() == pytest.approx((ratelimit.INITIAL_RATE + 0.3) * ratelimit.RATE_DECREASE)
+
+    clock[0] += ratelimit.DECREASE_HOLDOFF
+    controller.throttled()
+    assert controller.rate() == pytest.approx(0.325)
+
+    for _ in range(100):
+        controller.succeeded()
+    assert controller.rate() == 2.0
+
+
+def test_requests_beyond_the_burst_queue_at_the_shared_rate(tmp_path, clock):
+    # Two controllers on one file stand in for two processes.
+    first = RateController(str(tmp_path / 'model.json'))
+    second = RateController(str(tmp_path / 'model.json'))
+
+    delays = [(first if i % 2 else second).reserve() for i in range(ratelimit.BURST + 3)]
+
+    assert delays[:ratelimit.BURST] == [0] * ratelimit.BURST
+    assert delays[ratelimit.BURST:] == pytest.approx([1.0, 2.0, 3.0])
+
+    second.throttled()
+    assert first.reserve() == pytest.approx(4 / (ratelimit.INITIAL_RATE * ratelimit.RATE_DECREASE))
+
+
+def _reserve_many(path, count, queue):
+    controller = RateController(path)
+    queue.put([controller.reserve() for _ in range(count)])
+
+
+def test_processes_share_one_budget(tmp_path):
+    path = str(tmp_path / 'model.json')
+    queue = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_reserve_many, args=(path, 5, queue)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    delays = sorted(delay for _ in processes for delay in queue.get(timeout=30))
+    for process in processes:
+        process.join()
+
+    # 15 requests at 1/s: the burst goes at once, the others queue one second apart.
+    assert len([delay for delay in delays if delay == 0]) == ratelimit.BURST
+    assert delays[-1] == pytest.approx(15 - ratelimit.BURST, abs=0.5)
+
+
+def test_model_calls_report_to_the_controller(monkeypatch):
+    monkeypatch.setattr(models.time, 'sleep', lambda delay: None)
+    monkeypatch.setattr(ratelimit.time, 'sleep', lambda delay: None)
+    errors = [ResourceExhausted('quota')]
+
+    def call():
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    assert models.with_retries(call) == 'ok'
+    assert get_rate_controller('model').rate() == pytest.approx(
+        ratelimit.INITIAL_RATE * ratelimit.RATE_DECREASE + ratelimit.RATE_INCREASE)
+
+    monkeypatch.setenv('DEVAI_RATE_LIMIT', '0')
+    assert get_rate_controller('model') is None
+
+
+def test_async_calls_use_the_controller_off_the_event_loop(monkeypatch):
+    threads = []
+    for name in ('reserve', 'succeeded', 'throttled'):
+        method = getattr(RateController, name)
+        monkeypatch.setattr(RateController, name, lambda self, method=method: (
+            threads.append(threading.current_thread()), method(self))[1])
+    errors = [ResourceExhausted('quota')]
+
+    async def call():
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    monkeypatch.setattr(models, 'backoff_delay', lambda attempt: 0)
+    assert asyncio.run(models.with_retries_async(call)) == 'ok'
+    # Two reservations, one quota error and one success.
+    assert len(threads) == 4
+    assert threading.main_thread() not in threads
+
+
+def test_embeddings_keep_the_sdk_batch_size(monkeypatch):
+    from devai.commands.rag.embeddings import RateLimitedEmbeddings
+
+    monkeypatch.setenv('DEVAI_RATE_LIMIT', '0')
+    calls = []
+
+    class SDK:
+        def embed_documents(self, texts, **kwargs):
+            calls.append((len(texts), kwargs))
+            return [[float(len(text))] for text in texts]
+
+    vectors = RateLimitedEmbeddings(SDK()).embed_documents(['x' * n for n in range(600)])
+
+    assert vectors == [[float(n)] for n in range(600)]
+    assert sorted(calls) == [(100, {}), (250, {}), (250, {})]
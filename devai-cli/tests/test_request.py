@@ -0,0 +1,111 @@
+import pytest
+import warnings
+
+# Suppress deprecation warnings from dependencies
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="google._upb._message")
+warnings.filterwarnings("ignore", category=DeprecationWarning, module="pydantic.v1.typing")
+
+from click.testing import CliRunner
+from devai.commands.review import compliance, performance, review_all
+
+
+def review(instruction, contents):
+    if 'security programmer' in instruction:
+        raise RuntimeError('quota exceeded')
+    return ['No major ', 'issues found.']
+
+
+pytestmark = pytest.mark.parametrize('fake_model', [{'reply': review, 'delay': 0.01}], indirect=True)
+
+
+def test_review_sends_one_request_with_a_system_instruction(tmp_path, fake_model):
+    (tmp_path / 'app.py').write_text('print("app")\n')
+
+    result = CliRunner().invoke(performance, ['-c', str(tmp_path)])
+
+    assert result.exit_code == 0
+    assert 'No major issues found.' in result.output
+    [(instruction, contents)] = fake_model.calls
+    assert 'performance tuning expert' in instruction
+    assert contents[0] == '### Context (code) ###'
+    assert 'print("app")' in contents[1]
+
+
+def test_compliance_sends_best_practices_with_the_instruction(tmp_path, fake_model):
+    (tmp_path / 'deployment.yaml').write_text('kind: Deployment\n')
+    (tmp_path / 'rules.md').write_text('Set resource limits.\n')
+
+    result = CliRunner().invoke(compliance, ['-c', str(tmp_path / 'deployment.yaml'),
+                                             '-cfg', str(tmp_path / 'rules.md')])
+
+    assert result.exit_code == 0
+    [(instruction, contents)] = fake_model.calls
+    assert instruction[1] == '### Best Practices ###'
+    assert 'Set resource limits.' in instruction[2]
+    assert 'kind: Deployment' in contents[1]
+
+
+def test_review_all_fans_out_over_one_context(tmp_path, fake_model, monkeypatch):
+    (tmp_path / 'app.py').write_text('print("app")\n')
+    contexts = []
+    monkeypatch.setattr('devai.commands.review.prepare_context',
+                        lambda *args, **kwargs: contexts.append(args) or ['### Context (code) ###', 'app'])
+
+    result = CliRunner().invoke(review_all, ['-c', str(tmp_path), '--types', 'code,performance,security,blockers',
+                                             '--concurrency', '2'])
+
+    assert result.exit_code == 0
+    assert len(contexts) == 1
+    # Four requests, the security one failing.
+    assert len(fake_model.calls) == 4
+    assert fake_model.max_in_flight == 2
+    titles = [line for line in result.output.splitlines() if line.startswith('## ')]
+    assert titles == ['## Code Review', '## Performance Review', '## Security Review', '## Blockers Review']
+    assert 'Failed to call LLM: quota exceeded' in result.output
+
+
+def test_review_all_rejects_unknown_types(fake_model):
+    result = CliRunner().invoke(review_all, ['--types', 'code,style'])
+    assert result.exit_code == 2
+    assert 'unknown review type(s) style' in result.output
+
+
+def test_responses_are_cached_between_runs(tmp_path, fake_model):
+    from devai.util.cache import get_response_cache
+    (tmp_path / 'app.py').write_text('print("app")\n')
+    args = ['-c', str(tmp_path)]
+
+    first = CliRunner(mix_stderr=False).invoke(performance, args)
+    second = CliRunner(mix_stderr=False).invoke(performance, args)
+    assert len(fake_model.calls) == 1
+    assert second.stdout == first.stdout
+    assert 'Using a cached response' in second.stderr
+
+    CliRunner(mix_stderr=False).invoke(performance, args + ['--refresh'])
+    assert len(fake_model.calls) == 2
+    CliRunner(mix_stderr=False).invoke(performance, args + ['--no-cache'])
+    assert len(fake_model.calls) == 3
+
+    (tmp_path / 'app.py').write_text('print("changed")\n')
+    CliRunner(mix_stderr=False).invoke(performance, args)
+    assert len(fake_model.calls) == 4
+
+    stats = get_response_cache().stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (2, 1, 2)
+
+
+def test_text_reviews_stream_the_response(tmp_path, fake_model, monkeypatch):
+    (tmp_path / 'app.py').write_text('print("app")\n')
+    printed = []
+    monkeypatch.setattr('devai.commands.request.click.echo',
+                        lambda message=None, nl=True, err=False: err or printed.append(message))
+
+    result = CliRunner().invoke(performance, ['-c', str(tmp_path)])
+
+    assert result.exit_code == 0
+    assert printed == ['No major ', 'issues found.', None]
+
+    printed.clear()
+    CliRunner().invoke(performance, ['-c', str(tmp_path)])
+    assert len(fake_model.calls) == 1
+    assert printed == ['No major issues found.', None]
@@ -0,0 +1,32 @@
+from devai.util.review_state import ReviewState, assign_findings
+
+
+def test_unmatched_findings_last_until_their_request_changes(tmp_path):
+    findings = [{'file_name': './src/app.py', 'issue_type': 'Bug'},
+                {'file_name': 'config/settings.py', 'issue_type': 'Security'}]
+
+    assigned, unmatched = assign_findings(findings, ['src/app.py', 'src/lib.py'])
+
+    assert assigned == {'src/app.py': [{'file_name': 'src/app.py', 'issue_type': 'Bug'}], 'src/lib.py': []}
+    assert unmatched == [{'file_name': 'config/settings.py', 'issue_type': 'Security'}]
+
+    state = ReviewState(str(tmp_path / 'state.json'), 'prompt', 'model')
+    state.update_request({'src/app.py': 'a1', 'src/lib.py': 'l1'}, unmatched)
+    state.save()
+    state = ReviewState.load(str(tmp_path / 'state.json'), 'prompt', 'model')
+
+    state.prune({'src/app.py': 'a1', 'src/lib.py': 'l1'})
+    assert state.findings() == unmatched
+    state.prune({'src/app.py': 'a1', 'src/lib.py': 'l2'})
+    assert state.findings() == []
+
+
+def test_discarded_file_is_no_longer_current(tmp_path):
+    state = ReviewState(str(tmp_path / 'state.json'), 'prompt', 'model')
+    state.update('src/app.py', 'a1', [{'file_name': 'src/app.py', 'issue_type': 'Bug'}])
+    assert state.is_current('src/app.py', 'a1')
+
+    state.discard('src/app.py')
+
+    assert not state.is_current('src/app.py', 'a1')
+    assert state.findings() == []